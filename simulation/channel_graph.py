@@ -0,0 +1,484 @@
+import networkx as nx
+import numpy as np
+from collections import deque
+
+
+class ChannelGraph:
+	"""CSR channel graph with one NumPy balance entry per directed channel.
+
+	Out-edges of node u are the edge ids indptr[u]..indptr[u+1]-1, with
+	indices[e] the neighbour of edge e, in insertion order. rev[e] is the
+	id of the opposite direction (or -1), so a payment over u->v updates
+	balance[e] and balance[rev[e]] with two array writes. Node ids are the
+	0..N-1 ids of the relabelled topology.
+
+	The read/write interface of nx.DiGraph used by the routing modules
+	(G[u][v]["balance"], neighbors, has_edge, remove_edge/add_edge, copy,
+	degree, edges) is supported; remove_edge only masks the edge out.
+	Neighbour order follows an nx.DiGraph copy of the same graph, so
+	searches break ties the same way: successors in insertion order,
+	predecessors in node order (as DiGraph.copy() rebuilds them), and an
+	edge re-added after remove_edge moves to the end of both lists.
+	topology() follows the same order; edges() stays in CSR order.
+	"""
+
+	def __init__(self, num_nodes, indptr, indices, balance, rev, active=None, shared=None, succ_order=None):
+		self.num_nodes = int(num_nodes)
+		self.indptr = indptr
+		self.indices = indices
+		self.balance = balance
+		self.rev = rev
+		self.active = active if active is not None else np.ones(len(indices), dtype=bool)
+		self.num_removed = int(len(indices) - np.count_nonzero(self.active))
+		# lazily built structures shared by every copy of the graph
+		self._shared = shared if shared is not None else {}
+		# out/in edge ids of the nodes whose neighbour order changed (re-added edges at the end)
+		self._succ_order = succ_order if succ_order is not None else {}
+		self._pred_order = {}
+		# topology with this graph's neighbour order, once it differs from the shared one
+		self._topology = None
+
+	@classmethod
+	def from_edges(cls, num_nodes, edge_src, edge_dst, balance):
+		edge_src = np.asarray(edge_src, dtype=np.int64)
+		edge_dst = np.asarray(edge_dst, dtype=np.int64)
+		balance = np.asarray(balance, dtype=np.float64)
+
+		# a repeated (u, v) keeps its first position and the last balance, as nx.DiGraph.add_edge does
+		if len(edge_src) > 1:
+			keys = edge_src * num_nodes + edge_dst
+			order = np.argsort(keys, kind='stable')
+			keys = keys[order]
+			first = np.ones(len(keys), dtype=bool)
+			first[1:] = keys[1:] != keys[:-1]
+			if not first.all():
+				last = np.ones(len(keys), dtype=bool)
+				last[:-1] = keys[1:] != keys[:-1]
+				balance = balance.copy()
+				balance[order[first]] = balance[order[last]]
+				keep = np.zeros(len(keys), dtype=bool)
+				keep[order[first]] = True
+				edge_src = edge_src[keep]
+				edge_dst = edge_dst[keep]
+				balance = balance[keep]
+			del keys, order, first
+
+		# CSR rows in insertion order
+		order = np.argsort(edge_src, kind='stable')
+		edge_src = edge_src[order]
+		edge_dst = edge_dst[order]
+		balance = balance[order]
+		del order
+
+		indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+		np.cumsum(np.bincount(edge_src, minlength=num_nodes), out=indptr[1:])
+		indices = edge_dst.astype(np.int32)
+
+		# sorted (u, v) keys and their edge ids, for edge id lookups
+		keys = edge_src * num_nodes + edge_dst
+		lookup = np.argsort(keys, kind='stable')
+		keys = keys[lookup]
+
+		# reverse edge ids: look up (v, u) among the sorted (u, v) keys,
+		# querying in sorted order so the search walks the keys sequentially
+		rev_keys = edge_dst * num_nodes + edge_src
+		del edge_src, edge_dst
+		rev_order = np.argsort(rev_keys)
+		rev_keys = rev_keys[rev_order]
+		pos = np.searchsorted(keys, rev_keys)
+		pos[pos == len(keys)] = 0
+		rev = np.full(len(keys), -1, dtype=np.int64)
+		if len(keys):
+			found = keys[pos] == rev_keys
+			rev[rev_order[found]] = lookup[pos[found]]
+
+		return cls(num_nodes, indptr, indices, balance.copy(), rev, shared={'keys': keys, 'lookup': lookup})
+
+	@classmethod
+	def from_networkx(cls, G):
+		edges = list(G.edges(data='balance'))
+		edge_src = np.array([e[0] for e in edges], dtype=np.int64)
+		edge_dst = np.array([e[1] for e in edges], dtype=np.int64)
+		balance = np.array([e[2] for e in edges], dtype=np.float64)
+		graph = cls.from_edges(len(G), edge_src, edge_dst, balance)
+		# predecessors in the node order of G (as G.copy() has them), if G's nodes are not in id order
+		node_rank = np.empty(len(G), dtype=np.int64)
+		node_rank[np.fromiter(G, dtype=np.int64, count=len(G))] = np.arange(len(G))
+		if not np.array_equal(node_rank, np.arange(len(G))):
+			graph._shared['node_rank'] = node_rank
+		return graph
+
+	def to_networkx(self):
+		G = nx.DiGraph()
+		G.add_nodes_from(range(self.num_nodes))
+		src = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+		for e in np.flatnonzero(self.active).tolist():
+			G.add_edge(int(src[e]), int(self.indices[e]), balance=float(self.balance[e]))
+		return G
+
+	# topology-only nx.DiGraph (all channels, removed ones included), for algorithms without an array
+	# implementation; its neighbour order is the order of neighbors() / predecessors()
+	def topology(self):
+		if 'topology' not in self._shared:
+			G = nx.DiGraph()
+			src = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+			if 'node_rank' in self._shared:
+				nodes = np.argsort(self._shared['node_rank'])
+				G.add_nodes_from(nodes.tolist())
+				order = np.argsort(self._shared['node_rank'][src], kind='stable')
+				G.add_edges_from(zip(src[order].tolist(), self.indices[order].tolist()))
+			else:
+				G.add_nodes_from(range(self.num_nodes))
+				G.add_edges_from(zip(src.tolist(), self.indices.tolist()))
+			self._shared['topology'] = G
+		if not self._succ_order and not self._pred_order:
+			return self._shared['topology']
+
+		if self._topology is None:
+			# 按本图的邻居顺序重排 succ / pred（边属性字典仍然共享）
+			G = self._shared['topology'].copy()
+			self._in_edges()
+			for u, order in self._succ_order.items():
+				nbrs = G._succ[u]
+				G._succ[u] = {w: nbrs[w] for w in self.indices[order].tolist()}
+			for v, order in self._pred_order.items():
+				preds = G._pred[v]
+				G._pred[v] = {w: preds[w] for w in self._shared['src'][order].tolist()}
+			self._topology = G
+		return self._topology
+
+	def to_undirected(self):
+		return self.topology().to_undirected()
+
+	# as DiGraph.copy(): successor order is kept, predecessors go back to node order
+	def copy(self):
+		succ_order = {u: list(order) for u, order in self._succ_order.items()}
+		return ChannelGraph(self.num_nodes, self.indptr, self.indices, self.balance.copy(), self.rev, self.active.copy(), self._shared, succ_order)
+
+	# copy with every balance multiplied by scale_factor
+	def scaled(self, scale_factor):
+		G = self.copy()
+		G.balance *= scale_factor
+		return G
+
+	def __len__(self):
+		return self.num_nodes
+
+	def __iter__(self):
+		return iter(range(self.num_nodes))
+
+	def __contains__(self, node):
+		return 0 <= node < self.num_nodes
+
+	def number_of_nodes(self):
+		return self.num_nodes
+
+	def number_of_edges(self):
+		return len(self.indices) - self.num_removed
+
+	@property
+	def nodes(self):
+		return _NodeView(self.num_nodes)
+
+	def edges(self):
+		src = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+		eids = np.flatnonzero(self.active)
+		return zip(src[eids].tolist(), self.indices[eids].tolist())
+
+	@property
+	def degree(self):
+		if 'in_degree' not in self._shared:
+			self._shared['in_degree'] = np.bincount(self.indices, minlength=self.num_nodes)
+		return _DegreeView(np.diff(self.indptr) + self._shared['in_degree'])
+
+	# edge id of u->v, or -1
+	def edge_id(self, u, v):
+		keys, lookup = self._edge_keys()
+		lo = self.indptr[u]
+		hi = self.indptr[u + 1]
+		key = u * self.num_nodes + v
+		pos = lo + np.searchsorted(keys[lo:hi], key)
+		if pos < hi and keys[pos] == key:
+			return int(lookup[pos])
+		return -1
+
+	# sorted u*N+v key of every edge and the edge id of each key, for edge id lookups
+	# (rows are contiguous in both, so the keys of u are keys[indptr[u]:indptr[u+1]])
+	def _edge_keys(self):
+		if 'keys' not in self._shared:
+			src = np.repeat(np.arange(self.num_nodes, dtype=np.int64), np.diff(self.indptr))
+			keys = src * self.num_nodes + self.indices
+			lookup = np.argsort(keys, kind='stable')
+			self._shared['keys'] = keys[lookup]
+			self._shared['lookup'] = lookup
+		return self._shared['keys'], self._shared['lookup']
+
+	# edge ids of the hops of a path, which must all be channels of the graph
+	def path_edge_ids(self, path):
+		keys, lookup = self._edge_keys()
+		nodes = np.asarray(path, dtype=np.int64)
+		return lookup[np.searchsorted(keys, nodes[:-1] * self.num_nodes + nodes[1:])]
+
+	def has_edge(self, u, v):
+		eid = self.edge_id(u, v)
+		return eid >= 0 and self.active[eid]
+
+	def neighbors(self, u):
+		order = self._succ_order.get(u)
+		if order is not None:
+			eids = np.asarray(order)
+			return self.indices[eids[self.active[eids]]].tolist()
+		lo = self.indptr[u]
+		hi = self.indptr[u + 1]
+		if self.num_removed:
+			return self.indices[lo:hi][self.active[lo:hi]].tolist()
+		return self.indices[lo:hi].tolist()
+
+	successors = neighbors
+
+	def __getitem__(self, u):
+		return _AdjacencyView(self, u)
+
+	def remove_edge(self, u, v):
+		eid = self.edge_id(u, v)
+		if eid < 0 or not self.active[eid]:
+			raise nx.NetworkXError(f"The edge {u}-{v} is not in the graph")
+		self.active[eid] = False
+		self.num_removed += 1
+
+	# only re-activates a channel that exists in the CSR; like a re-added nx edge,
+	# it moves to the end of the successors of u and the predecessors of v
+	def add_edge(self, u, v, **attr):
+		eid = self.edge_id(u, v)
+		if eid < 0:
+			raise nx.NetworkXError(f"The edge {u}-{v} is not a channel of the graph")
+		if not self.active[eid]:
+			self.active[eid] = True
+			self.num_removed -= 1
+			succ = self._succ_order.get(u)
+			if succ is None:
+				succ = self._succ_order[u] = list(range(self.indptr[u], self.indptr[u + 1]))
+			succ.remove(eid)
+			succ.append(eid)
+			pred = self._pred_order.get(v)
+			if pred is None:
+				in_indptr, in_eids, in_src = self._in_edges()
+				pred = self._pred_order[v] = in_eids[in_indptr[v]:in_indptr[v + 1]].tolist()
+			pred.remove(eid)
+			pred.append(eid)
+			if self._topology is not None:
+				self._topology.remove_edge(u, v)
+				self._topology.add_edge(u, v)
+		if 'balance' in attr:
+			self.balance[eid] = attr['balance']
+
+	def path_capacity(self, path):
+		return float(self.balance[self.path_edge_ids(path)].min())
+
+	# move amount along path: u->v loses it, v->u gains it
+	def update_path(self, path, amount):
+		eids = self.path_edge_ids(path)
+		if len(set(path)) == len(path):
+			# simple path: no channel is touched twice
+			self.balance[eids] -= amount
+			self.balance[self.rev[eids]] += amount
+		else:
+			np.subtract.at(self.balance, eids, amount)
+			np.add.at(self.balance, self.rev[eids], amount)
+
+	# in-edges of every node, predecessors in node order (id order, or node_rank from from_networkx)
+	def _in_edges(self):
+		if 'in_indptr' not in self._shared:
+			src = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.indptr))
+			if 'node_rank' in self._shared:
+				order = np.lexsort((self._shared['node_rank'][src], self.indices))
+			else:
+				order = np.argsort(self.indices, kind='stable')
+			in_indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+			np.cumsum(np.bincount(self.indices, minlength=self.num_nodes), out=in_indptr[1:])
+			self._shared['in_indptr'] = in_indptr
+			self._shared['in_eids'] = order
+			self._shared['in_src'] = src[order]
+			self._shared['src'] = src
+		return self._shared['in_indptr'], self._shared['in_eids'], self._shared['in_src']
+
+	def predecessors(self, v):
+		in_indptr, in_eids, in_src = self._in_edges()
+		order = self._pred_order.get(v)
+		if order is not None:
+			eids = np.asarray(order)
+			return self._shared['src'][eids[self.active[eids]]].tolist()
+		lo = in_indptr[v]
+		hi = in_indptr[v + 1]
+		if self.num_removed:
+			return in_src[lo:hi][self.active[in_eids[lo:hi]]].tolist()
+		return in_src[lo:hi].tolist()
+
+	# bidirectional BFS over the active edges, as nx.shortest_path does
+	def shortest_path(self, src, dst):
+		if src == dst:
+			return [src]
+
+		pred = {src: None}
+		succ = {dst: None}
+		forward = [src]
+		reverse = [dst]
+
+		while forward and reverse:
+			if len(forward) <= len(reverse):
+				this_level = forward
+				forward = []
+				for u in this_level:
+					for w in self.neighbors(u):
+						if w not in pred:
+							forward.append(w)
+							pred[w] = u
+						if w in succ:
+							return _join_paths(pred, succ, w)
+			else:
+				this_level = reverse
+				reverse = []
+				for v in this_level:
+					for w in self.predecessors(v):
+						if w not in succ:
+							succ[w] = v
+							reverse.append(w)
+						if w in pred:
+							return _join_paths(pred, succ, w)
+
+		raise nx.NetworkXNoPath(f"No path between {src} and {dst}.")
+
+	def has_path(self, src, dst):
+		if src == dst:
+			return True
+		visited = {src}
+		queue = deque([src])
+		while queue:
+			u = queue.popleft()
+			for w in self.neighbors(u):
+				if w == dst:
+					return True
+				if w not in visited:
+					visited.add(w)
+					queue.append(w)
+		return False
+
+
+def _join_paths(pred, succ, w):
+	path = []
+	node = w
+	while node is not None:
+		path.append(node)
+		node = pred[node]
+	path.reverse()
+	node = succ[w]
+	while node is not None:
+		path.append(node)
+		node = succ[node]
+	return path
+
+
+class _NodeView:
+	def __init__(self, num_nodes):
+		self._num_nodes = num_nodes
+
+	def __call__(self):
+		return self
+
+	def __iter__(self):
+		return iter(range(self._num_nodes))
+
+	def __len__(self):
+		return self._num_nodes
+
+	def __contains__(self, node):
+		return 0 <= node < self._num_nodes
+
+
+class _DegreeView:
+	def __init__(self, degrees):
+		self._degrees = degrees
+
+	def __getitem__(self, node):
+		return int(self._degrees[node])
+
+	def __iter__(self):
+		return iter(enumerate(self._degrees.tolist()))
+
+	def __len__(self):
+		return len(self._degrees)
+
+
+class _AdjacencyView:
+	def __init__(self, G, u):
+		self._G = G
+		self._u = u
+
+	def __getitem__(self, v):
+		eid = self._G.edge_id(self._u, v)
+		if eid < 0 or not self._G.active[eid]:
+			raise KeyError(v)
+		return _EdgeAttrView(self._G, eid)
+
+	def __contains__(self, v):
+		return self._G.has_edge(self._u, v)
+
+	def __iter__(self):
+		return iter(self._G.neighbors(self._u))
+
+
+class _EdgeAttrView:
+	def __init__(self, G, eid):
+		self._G = G
+		self._eid = eid
+
+	def __getitem__(self, key):
+		if key != 'balance':
+			raise KeyError(key)
+		return float(self._G.balance[self._eid])
+
+	def __setitem__(self, key, value):
+		if key != 'balance':
+			raise KeyError(key)
+		self._G.balance[self._eid] = value
+
+	def get(self, key, default=None):
+		return float(self._G.balance[self._eid]) if key == 'balance' else default
+
+	def copy(self):
+		return {'balance': float(self._G.balance[self._eid])}
+
+
+# helpers taking either an nx.DiGraph or a ChannelGraph
+
+def shortest_path(G, src, dst):
+	if isinstance(G, ChannelGraph):
+		return G.shortest_path(src, dst)
+	return nx.shortest_path(G, src, dst)
+
+
+def has_path(G, src, dst):
+	if isinstance(G, ChannelGraph):
+		return G.has_path(src, dst)
+	return nx.has_path(G, src, dst)
+
+
+def topology(G):
+	if isinstance(G, ChannelGraph):
+		return G.topology()
+	return G
+
+
+def path_capacity(G, path):
+	if isinstance(G, ChannelGraph):
+		return G.path_capacity(path)
+	return min(G[path[i]][path[i + 1]]["balance"] for i in range(len(path) - 1))
+
+
+def update_path(G, path, amount):
+	if isinstance(G, ChannelGraph):
+		G.update_path(path, amount)
+		return
+	for i in range(len(path) - 1):
+		G[path[i]][path[i + 1]]["balance"] -= amount
+		G[path[i + 1]][path[i]]["balance"] += amount
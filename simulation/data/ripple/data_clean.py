@@ -1,4 +1,7 @@
 import pandas as pd
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 def process_csv(input_file, output_file):
     # 读取 CSV 文件，仅加载所需列
@@ -14,7 +17,101 @@ def process_csv(input_file, output_file):
     df.to_csv(output_file, index=False)
 
 
-# 调用
-input_file = "trust sets_24-3-6.csv"  # 替换为实际输入文件路径
-output_file = "RP_topology.csv"  # 替换为实际输出文件路径
-process_csv(input_file, output_file)
\ No newline at end of file
+# 单个数据块的部分聚合（与 process_csv 的过滤、合并规则相同）
+def aggregate_chunk(df):
+    df = df.query("Account != issuer")
+    return df.groupby(['Account', 'issuer'], as_index=False, sort=False)['value'].sum()
+
+
+# 合并部分聚合结果，保持 (Account, issuer) 首次出现的顺序
+def merge_partials(partials):
+    if len(partials) == 1:
+        return partials[0]
+    df = pd.concat(partials, ignore_index=True)
+    return df.groupby(['Account', 'issuer'], as_index=False, sort=False)['value'].sum()
+
+
+# 增量合并：部分结果的总行数超过已合并结果的两倍时才合并，避免每个块都重新分组
+class PartialAggregate:
+    def __init__(self):
+        self.merged = None
+        self.pending = []
+        self.pending_rows = 0
+
+    def add(self, partial):
+        self.pending.append(partial)
+        self.pending_rows += len(partial)
+        merged_rows = 0 if self.merged is None else len(self.merged)
+        if self.pending_rows > 2 * max(merged_rows, 100000):
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            partials = self.pending if self.merged is None else [self.merged] + self.pending
+            self.merged = merge_partials(partials)
+            self.pending = []
+            self.pending_rows = 0
+
+    def result(self):
+        self.flush()
+        if self.merged is None:
+            return pd.DataFrame(columns=['Account', 'issuer', 'value'])
+        return self.merged
+
+
+# 读取字节区间 [start, end) 内开始的所有行，每次最多 block_size 字节（行不可跨越换行引号）
+def iter_byte_range(input_file, start, end, block_size):
+    with open(input_file, 'rb') as f:
+        header = f.readline()
+        if start > len(header):
+            # 跳过上一区间中开始的行
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        while pos < end:
+            data = f.read(min(block_size, end - pos))
+            if not data:
+                break
+            if not data.endswith(b'\n'):
+                data += f.readline()
+            pos = f.tell()
+            yield header + data
+
+
+def aggregate_byte_range(input_file, start, end, block_size):
+    result = PartialAggregate()
+    for data in iter_byte_range(input_file, start, end, block_size):
+        df = pd.read_csv(io.BytesIO(data), usecols=['Account', 'issuer', 'value'])
+        result.add(aggregate_chunk(df))
+    return result.result()
+
+
+# 流式处理：按块读取并增量合并，内存只随 (Account, issuer) 对的数量增长；
+# workers > 1 时按字节区间把文件分给多个进程解析
+def process_csv_chunked(input_file, output_file, chunksize=1000000, workers=1, block_size=64 << 20):
+    result = PartialAggregate()
+
+    if workers <= 1:
+        for df in pd.read_csv(input_file, usecols=['Account', 'issuer', 'value'], chunksize=chunksize):
+            result.add(aggregate_chunk(df))
+    else:
+        file_size = os.path.getsize(input_file)
+        bounds = [file_size * i // workers for i in range(workers + 1)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(aggregate_byte_range, input_file, bounds[i], bounds[i + 1], block_size)
+                for i in range(workers)
+            ]
+            # 按区间顺序合并，保持首次出现的顺序
+            for future in futures:
+                result.add(future.result())
+
+    # 保存处理后的数据到新的 CSV 文件
+    result.result().to_csv(output_file, index=False)
+
+
+if __name__ == "__main__":
+    # 调用
+    input_file = "trust sets_24-3-6.csv"  # 替换为实际输入文件路径
+    output_file = "RP_topology.csv"  # 替换为实际输出文件路径
+    process_csv_chunked(input_file, output_file, workers=os.cpu_count())
@@ -2,13 +2,167 @@ import networkx as nx
 import numpy as np
 import csv
 import random
+import os
+import json
+import array
+import hashlib
+import pandas as pd
 from scipy import stats
 
+import channel_graph
 
-# returns network topology and transactions for Lightning
-def lightning_setup():
-	file_path = "data/lightning/1.2_original_topology.csv"
 
+# directory holding the binary topology snapshots
+SNAPSHOT_DIR = "data/snapshot"
+
+
+# sha1 digest of a file, read in chunks
+def file_digest(file_path):
+	h = hashlib.sha1()
+	with open(file_path, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), b''):
+			h.update(block)
+	return h.hexdigest()
+
+
+# fingerprint (path, size, mtime, sha1) of every input file of a snapshot
+def input_fingerprint(file_paths):
+	fingerprint = []
+	for file_path in file_paths:
+		st = os.stat(file_path)
+		fingerprint.append({
+			'path': file_path,
+			'size': st.st_size,
+			'mtime': st.st_mtime_ns,
+			'sha1': file_digest(file_path)
+		})
+	return fingerprint
+
+
+# check a stored fingerprint against the files on disk
+# the sha1 is only recomputed for files whose size/mtime changed
+def fingerprint_matches(fingerprint, file_paths):
+	if [entry['path'] for entry in fingerprint] != list(file_paths):
+		return False
+
+	for entry in fingerprint:
+		try:
+			st = os.stat(entry['path'])
+		except OSError:
+			return False
+		if st.st_size == entry['size'] and st.st_mtime_ns == entry['mtime']:
+			continue
+		if st.st_size != entry['size'] or file_digest(entry['path']) != entry['sha1']:
+			return False
+
+	return True
+
+
+class TopologySnapshot:
+	"""Relabelled largest-SCC topology and mapped transactions as compact arrays.
+
+	Edge i is the directed channel edge_src[i] -> edge_dst[i] with balance[i],
+	in the order of G.edges() of the relabelled graph. graph() builds the
+	networkx graph on its first call; channel_graph() and trans_array()
+	build the array forms without it.
+	"""
+
+	def __init__(self, num_nodes, edge_src, edge_dst, balance, tx_src, tx_dst, tx_amount):
+		self.num_nodes = int(num_nodes)
+		self.edge_src = edge_src
+		self.edge_dst = edge_dst
+		self.balance = balance
+		self.tx_src = tx_src
+		self.tx_dst = tx_dst
+		self.tx_amount = tx_amount
+		self._G = None
+
+	# trans is a TRANS_DTYPE structured array
+	@classmethod
+	def from_graph(cls, G, trans):
+		edges = list(G.edges(data='balance'))
+		edge_src = np.array([e[0] for e in edges], dtype=np.int32)
+		edge_dst = np.array([e[1] for e in edges], dtype=np.int32)
+		balance = np.array([e[2] for e in edges], dtype=np.float64)
+		tx_src = np.ascontiguousarray(trans['src'])
+		tx_dst = np.ascontiguousarray(trans['dst'])
+		tx_amount = np.ascontiguousarray(trans['amount'])
+		snapshot = cls(len(G), edge_src, edge_dst, balance, tx_src, tx_dst, tx_amount)
+		snapshot._G = G
+		return snapshot
+
+	def graph(self):
+		if self._G is None:
+			G = nx.DiGraph()
+			G.add_nodes_from(range(self.num_nodes))
+			G.add_edges_from(
+				(u, v, {'balance': bal})
+				for u, v, bal in zip(self.edge_src.tolist(), self.edge_dst.tolist(), self.balance.tolist())
+			)
+			self._G = G
+		return self._G
+
+	def channel_graph(self):
+		return channel_graph.ChannelGraph.from_edges(self.num_nodes, self.edge_src, self.edge_dst, self.balance)
+
+	@property
+	def trans(self):
+		return list(zip(self.tx_src.tolist(), self.tx_dst.tolist(), self.tx_amount.tolist()))
+
+	# the mapped transactions as a TRANS_DTYPE structured array
+	def trans_array(self):
+		out = np.empty(len(self.tx_src), dtype=TRANS_DTYPE)
+		out['src'] = self.tx_src
+		out['dst'] = self.tx_dst
+		out['amount'] = self.tx_amount
+		return out
+
+	def save(self, file_path, fingerprint):
+		os.makedirs(os.path.dirname(file_path), exist_ok=True)
+		tmp_path = file_path + '.tmp.npz'
+		np.savez(
+			tmp_path,
+			num_nodes=np.int64(self.num_nodes),
+			edge_src=self.edge_src,
+			edge_dst=self.edge_dst,
+			balance=self.balance,
+			tx_src=self.tx_src,
+			tx_dst=self.tx_dst,
+			tx_amount=self.tx_amount,
+			fingerprint=np.array(json.dumps(fingerprint))
+		)
+		os.replace(tmp_path, file_path)
+
+	@classmethod
+	def load(cls, file_path, input_files):
+		if not os.path.exists(file_path):
+			return None
+		with np.load(file_path) as data:
+			if not fingerprint_matches(json.loads(str(data['fingerprint'])), input_files):
+				return None
+			return cls(
+				data['num_nodes'],
+				data['edge_src'],
+				data['edge_dst'],
+				data['balance'],
+				data['tx_src'],
+				data['tx_dst'],
+				data['tx_amount']
+			)
+
+
+# print the topology stats line from the balance of every directed channel
+def print_topology_stats(num_nodes, balance):
+	listC_sorted = np.sort(balance)
+
+	print("number of nodes", num_nodes)
+	print('num of channels', len(balance) / 2)
+	print('average channel capacity', float(np.sum(balance))/(len(balance) / 2))
+	print('medium channel balance', stats.scoreatpercentile(listC_sorted, 50))
+
+
+# load a topology CSV as the relabelled largest strongly connected component
+def load_topology(file_path, skip_self_loops):
 	# load network topology
 	G = nx.DiGraph()
 	with open(file_path, 'r') as f:
@@ -20,6 +174,10 @@ def lightning_setup():
 			dst = row[1]
 			capacity = float(row[2])
 
+			# 跳过自交易
+			if skip_self_loops and src == dst:
+				continue
+
 			# 在图中添加双向边，均分容量，随机交易成本
 			G.add_edge(
 				src,
@@ -50,149 +208,221 @@ def lightning_setup():
 	# relabel nodes
 	mapping = dict(zip(G.nodes(), list(range(0, len(G)))))
 	G = nx.relabel_nodes(G, mapping, copy=True)
-	
-	# collect data for stats printout later
-	listC = []
-	for e in G.edges(): 
-		listC.append(G[e[0]][e[1]]['balance'])
-	listC_sorted = np.sort(listC)
 
-	# print stats
-	print("number of nodes", len(G))
-	print('num of channels', len(listC) / 2)
-	print('average channel capacity', float(sum(listC))/(len(listC) / 2))
-	print('medium channel balance', stats.scoreatpercentile(listC_sorted, 50))
+	return G
+
 
-	# load the transaction values from Bitcoin blockchain
-	vals = []
+# one mapped transaction (src, dst, amount)
+TRANS_DTYPE = np.dtype([('src', np.int32), ('dst', np.int32), ('amount', np.float64)])
 
+
+# the transaction values from the Bitcoin blockchain
+def load_bitcoin_values(file_path='data/lightning/BitcoinVal.txt'):
 	# BitcoinVal.txt
 	# sampled_values.csv
+	vals = pd.read_csv(file_path, header=None, usecols=[0], dtype=np.float64, float_precision='round_trip')
+	return vals[0].to_numpy()
+
+
+# stream the Ripple trace as structured arrays of at most chunksize rows
+# src/dst are mapped into [0, num_nodes), non-positive amounts and self-payments are dropped;
+# with vals, the i-th kept transaction gets amount vals[i] (Lightning)
+def iter_transaction_chunks(num_nodes, vals=None, file_path='data/ripple/ripple_val.csv', chunksize=1000000):
+	offset = 0
+	reader = pd.read_csv(
+		file_path,
+		header=None,
+		usecols=[0, 1, 2],
+		names=['src', 'dst', 'amount'],
+		dtype={'src': np.int64, 'dst': np.int64, 'amount': np.float64},
+		float_precision='round_trip',
+		chunksize=chunksize
+	)
+	for chunk in reader:
+		amount = chunk['amount'].to_numpy()
+		keep = amount > 0
+
+		# map each transaction to src/dst pair in the pruned graph
+		# TODO:该映射可能导致单个节点交易量过大
+		src = chunk['src'].to_numpy()[keep] % num_nodes
+		dst = chunk['dst'].to_numpy()[keep] % num_nodes
+		amount = amount[keep]
+
+		# 跳过自交易
+		keep = src != dst
+		src = src[keep]
+		dst = dst[keep]
+		amount = amount[keep]
+
+		if vals is not None:
+			if offset + len(src) > len(vals):
+				raise IndexError(f"{file_path} has more transactions than transaction values ({len(vals)})")
+			amount = vals[offset:offset + len(src)]
+			offset += len(src)
+
+		out = np.empty(len(src), dtype=TRANS_DTYPE)
+		out['src'] = src
+		out['dst'] = dst
+		out['amount'] = amount
+		yield out
+
+
+# the whole mapped trace as one structured array
+def load_transactions(num_nodes, vals=None, file_path='data/ripple/ripple_val.csv', chunksize=1000000):
+	chunks = list(iter_transaction_chunks(num_nodes, vals, file_path, chunksize))
+	if not chunks:
+		return np.empty(0, dtype=TRANS_DTYPE)
+	return np.concatenate(chunks)
+
+
+# structured transaction array -> list of (src, dst, amount) tuples
+def transactions_to_list(trans_array):
+	return list(zip(trans_array['src'].tolist(), trans_array['dst'].tolist(), trans_array['amount'].tolist()))
+
+
+# returns the cached snapshot of a trace, rebuilding it when any input file changed
+def load_snapshot(trace, use_cache=True):
+	if trace == 'lightning':
+		topology_file = "data/lightning/1.2_original_topology.csv"
+		input_files = [topology_file, 'data/lightning/BitcoinVal.txt', 'data/ripple/ripple_val.csv']
+	elif trace == 'ripple':
+		topology_file = "data/ripple/RP_topology.csv"
+		input_files = [topology_file, 'data/ripple/ripple_val.csv']
+	else:
+		raise ValueError(f"No snapshot support for trace {trace}")
+
+	snapshot_file = os.path.join(SNAPSHOT_DIR, f"{trace}.npz")
+
+	if use_cache:
+		snapshot = TopologySnapshot.load(snapshot_file, input_files)
+		if snapshot is not None:
+			print(f"Loaded snapshot {snapshot_file}")
+			return snapshot
+
+	fingerprint = input_fingerprint(input_files)
+
+	if trace == 'lightning':
+		G = load_topology(topology_file, skip_self_loops=False)
+		trans = load_transactions(len(G), vals=load_bitcoin_values())
+	else:
+		G = load_topology(topology_file, skip_self_loops=True)
+		trans = load_transactions(len(G))
+
+	snapshot = TopologySnapshot.from_graph(G, trans)
+	if use_cache:
+		snapshot.save(snapshot_file, fingerprint)
+
+	return snapshot
+
+
+# mode 'networkx': nx.DiGraph and a list of (src, dst, amount) tuples;
+# mode 'array': ChannelGraph and a TRANS_DTYPE array, straight from the snapshot arrays (no networkx graph is built)
+def snapshot_setup(snapshot, mode='networkx'):
+	if mode == 'array':
+		return snapshot.channel_graph(), snapshot.trans_array()
+	return snapshot.graph(), snapshot.trans
 
-	with open('data/lightning/BitcoinVal.txt', 'r') as f:
-		for line in f:
-			vals.append(float(line))
 
-	# load src/dst from Ripple trace
-	trans = []
-	i = 0
-	with open('data/ripple/ripple_val.csv', 'r') as f: 
-		csv_reader = csv.reader(f, delimiter=',')
-		for row in csv_reader:
-			if float(row[2]) > 0:
-				# map
-				# TODO:该映射可能导致单个节点交易量过大
-				tx_src = int(row[0]) % len(G)
-				tx_dst = int(row[1]) % len(G)
-
-				# 跳过自交易
-				if tx_src == tx_dst: 
-					continue
-				
-				val = vals[i]
-				i += 1
-				
-				trans.append((int(tx_src), int(tx_dst), val))
+# returns network topology and transactions for Lightning
+def lightning_setup(use_cache=True, mode='networkx'):
+	snapshot = load_snapshot('lightning', use_cache)
 
-	print('num of transactions', len(trans))
+	# print stats
+	print_topology_stats(snapshot.num_nodes, snapshot.balance)
+	print('num of transactions', len(snapshot.tx_src))
 
-	return G, trans
+	return snapshot_setup(snapshot, mode)
 
 
 # returns network topology and transactions for Ripple
-def ripple_setup():
-	file_path = "data/ripple/RP_topology.csv"
+def ripple_setup(use_cache=True, mode='networkx'):
+	snapshot = load_snapshot('ripple', use_cache)
 
-	# load network topology
-	G = nx.DiGraph()
-	with open(file_path, 'r') as f:
-		csv_reader = csv.reader(f)
-		# 跳过表头
-		next(csv_reader)
-		for row in csv_reader:
-			src = row[0]
-			dst = row[1]
-			capacity = float(row[2])
+	# print stats
+	print_topology_stats(snapshot.num_nodes, snapshot.balance)
+	print('num of transactions', len(snapshot.tx_src))
 
-			# 跳过自交易
-			if src == dst:
-				continue
+	return snapshot_setup(snapshot, mode)
 
 
-			# 在图中添加双向边，均分容量，随机交易成本
-			G.add_edge(
-				src,
-				dst,
-				balance = capacity / 2
-			)
-			G.add_edge(
-				dst,
-				src,
-				balance = capacity / 2
-			)
+# Barabasi-Albert edge list as NumPy arrays, without a networkx graph
+# same process as nx.barabasi_albert_graph: start from a star on m+1 nodes, then each new
+# node attaches to m distinct targets drawn proportionally to degree
+def barabasi_albert_edges(num_node, m, seed):
+	rng = np.random.default_rng(seed)
 
-	# 最大联通子图
-	components = nx.strongly_connected_components(G)
-	largest_component = max(components, key=len)
-	G = G.subgraph(largest_component).copy()
+	# int32 buffers: compact, and fast to index from Python
+	edge_src = array.array('i', [0] * m)
+	edge_dst = array.array('i', range(1, m + 1))
 
-	"""
-	# remove nodes with less than 2 neighbors, iteratively
-	while True:
-		nodes_to_remove = [node for node in G.nodes if len(list(G.neighbors(node))) < 2]
-		if not nodes_to_remove:
-			break
-		G.remove_nodes_from(nodes_to_remove)
-		# print(f"Removed nodes: {nodes_to_remove}")
-	"""
+	# every edge endpoint once, so a uniform draw picks nodes by degree
+	repeated_nodes = array.array('i', [0] * m)
+	repeated_nodes.extend(range(1, m + 1))
 
-	# relabel nodes
-	mapping = dict(zip(G.nodes(), list(range(0, len(G)))))
-	G = nx.relabel_nodes(G, mapping, copy=True)
-	
-	# collect data for stats printout later
-	listC = []
-	for e in G.edges(): 
-		listC.append(G[e[0]][e[1]]['balance'])
-	listC_sorted = np.sort(listC)
+	block = []
+	pos = 0
+	for source in range(m + 1, num_node):
+		num_repeated = len(repeated_nodes)
+		targets = set()
+		while len(targets) < m:
+			if pos == len(block):
+				block = rng.random(1 << 20).tolist()
+				pos = 0
+			targets.add(repeated_nodes[int(block[pos] * num_repeated)])
+			pos += 1
 
-	# print stats
-	print("number of nodes", len(G))
-	print('num of channels', len(listC) / 2)
-	print('average channel capacity', float(sum(listC))/(len(listC) / 2))
-	print('medium channel balance', stats.scoreatpercentile(listC_sorted, 50))
+		targets = sorted(targets)
+		edge_src.extend([source] * m)
+		edge_dst.extend(targets)
 
-	# load transaction amounts and src/dst from Ripple trace
-	trans = []
-	with open('data/ripple/ripple_val.csv', 'r') as f: 
-		csv_reader = csv.reader(f, delimiter=',')
-		for row in csv_reader:
-			if float(row[2]) > 0:
-				# map each transaction to src/dst pair in the pruned graph
-				# TODO:该映射可能导致单个节点交易量过大
-				src = int(row[0]) % len(G)
-				dst = int(row[1]) % len(G)
+		repeated_nodes.extend(targets)
+		repeated_nodes.extend([source] * m)
 
-				# 跳过自交易
-				if src == dst: 
-					continue
+	del repeated_nodes
+	edge_src = np.frombuffer(edge_src, dtype=np.int32)
+	edge_dst = np.frombuffer(edge_dst, dtype=np.int32)
 
-				trans.append((int(src), int(dst), float(row[2])))
+	return edge_src, edge_dst
 
-	print('num of transactions', len(trans))
 
-	return G, trans
+# mode 'networkx' returns an nx.DiGraph and a list of (src, dst, amount) tuples,
+# mode 'array' a ChannelGraph built straight from the edge arrays and a TRANS_DTYPE array
+def scale_free_setup(mode='networkx', num_node=1000000, m=3, seed=1):
+
+	if mode == 'array':
+		edge_src, edge_dst = barabasi_albert_edges(num_node, m, seed)
 
+		#设置通道余额
+		rng = np.random.default_rng(seed)
+		balance = rng.integers(20000, 25001, size=len(edge_src)).astype(np.float64) / 2
 
-def scale_free_setup():
+		# each channel contributes the same balance in both directions
+		listC_sorted = np.sort(balance)
+		print("number of nodes", num_node)
+		print('num of channels', float(len(balance)))
+		print('average channel capacity', 2 * float(np.sum(balance)) / len(balance))
+		print('medium channel balance', stats.scoreatpercentile(listC_sorted, 50))
+		del listC_sorted
 
-	num_node = 1000000
+		G = channel_graph.ChannelGraph.from_edges(
+			num_node,
+			np.concatenate((edge_src, edge_dst)),
+			np.concatenate((edge_dst, edge_src)),
+			np.concatenate((balance, balance))
+		)
+
+		# load transaction amounts and src/dst from Ripple trace (TRANS_DTYPE array, as snapshot_setup's array mode)
+		trans = load_transactions(num_node)
+
+		print('num of transactions', len(trans))
+
+		return G, trans
 
 	#生成小世界拓扑
 	#GG = nx.watts_strogatz_graph(num_node, 8, 0.8, 1)   # num_node nodes, connected to nearest 8 neighbors in ring topology, 0.8 probability of rewiring, random seed 1
 	
 	#生成无标度拓扑
-	GG = nx.barabasi_albert_graph(num_node, 3, 1) # 每个新加入节点连接7个节点
+	GG = nx.barabasi_albert_graph(num_node, m, seed) # 每个新加入节点连接7个节点
 	#GG = nx.powerlaw_cluster_graph(num_node, 3, 0.1) # p = 0.3314
 	
 	G = nx.DiGraph()
@@ -215,21 +445,7 @@ def scale_free_setup():
 	print('medium channel balance', stats.scoreatpercentile(listC_sorted, 50))
 
 	# load transaction amounts and src/dst from Ripple trace
-	trans = []
-	with open('data/ripple/ripple_val.csv', 'r') as f: 
-		csv_reader = csv.reader(f, delimiter=',')
-		for row in csv_reader:
-			if float(row[2]) > 0:
-				# map each transaction to src/dst pair in the pruned graph
-				# TODO:该映射可能导致单个节点交易量过大
-				src = int(row[0]) % len(G)
-				dst = int(row[1]) % len(G)
-
-				# 跳过自交易
-				if src == dst: 
-					continue
-
-				trans.append((int(src), int(dst), float(row[2])))
+	trans = transactions_to_list(load_transactions(len(G)))
 
 	print('num of transactions', len(trans))
 
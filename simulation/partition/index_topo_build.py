@@ -1,33 +1,87 @@
 import networkx as nx
 import sys
 import csv
+import os
+import hashlib
+import numpy as np
+import time
+import multiprocessing
 
-from itertools import combinations
+from collections import deque
+from scipy import sparse
+from scipy.sparse import csgraph
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def process_graph(subgraph, boundary_nodes, subnet_id):
-	print(f"\nStart build index channels in subnet {subnet_id}")
 
-	index_topo_i = nx.DiGraph()
+# 从 source 出发的 BFS：dist[w] 为最短距离，bad[w] 表示存在一条 source->w 的最短路径经过其他边界节点（不含端点）。
+# bad 沿 BFS 最短路 DAG 传播：bad[x] = OR_{前驱 w} (bad[w] or w 是边界节点且 w != source)；
+# 节点出队时其所有前驱都已出队，因此 bad 值已确定。O(V+E)
+def boundary_bfs(subgraph, source, boundary_nodes):
+	dist = {source: 0}
+	bad = {source: False}
+	queue = deque([source])
+	while queue:
+		w = queue.popleft()
+		d = dist[w] + 1
+		blocked = bad[w] or (w != source and w in boundary_nodes)
+		for x in subgraph.neighbors(w):
+			dx = dist.get(x)
+			if dx is None:
+				dist[x] = d
+				bad[x] = blocked
+				queue.append(x)
+			elif dx == d and blocked:
+				bad[x] = True
+	return dist, bad
 
-	for u, v in combinations(boundary_nodes, 2):  # 只考虑 u < v 的组合
-		try:
-			paths = list(nx.all_shortest_paths(subgraph, u, v))
 
-			for path in paths:
-				if any(node in boundary_nodes for node in path[1:-1]):  # 若任意路径经过其他边界节点，则该索引通道可以不建立
-					break
-			else:  # 如果没有路径经过边界节点
-				length = len(paths[0]) - 1
+# 边界节点 boundary_list[lo:hi] 作为起点生成的索引边 (u, v, length)，v 只取列表中 u 之后的节点（与 combinations 相同的顺序）
+# method='bfs': 每个边界节点一次 BFS，O(B·(V+E))；method='all_shortest_paths': 原方法，枚举每对边界节点的所有最短路径。
+# 两种方法生成的索引边及其顺序相同
+def index_edges(subgraph, boundary_nodes, boundary_list, lo, hi, method='bfs'):
+	edges = []
 
-				# 添加双向边
-				index_topo_i.add_edge(u, v, length=length, subnet=subnet_id)
-				index_topo_i.add_edge(v, u, length=length, subnet=subnet_id)
+	if method == 'bfs':
+		for i in range(lo, hi):
+			u = boundary_list[i]
+			dist, bad = boundary_bfs(subgraph, u, boundary_nodes)
+			for v in boundary_list[i + 1:]:
+				if v in dist and not bad[v]:
+					edges.append((u, v, dist[v]))
 
-		except nx.NetworkXNoPath:
-			#print(f"No path between {u} and {v} in subnet {subnet_id}.")
-			continue
+	elif method == 'all_shortest_paths':
+		for i in range(lo, hi):
+			u = boundary_list[i]
+			for v in boundary_list[i + 1:]:
+				try:
+					paths = list(nx.all_shortest_paths(subgraph, u, v))
+
+					for path in paths:
+						if any(node in boundary_nodes for node in path[1:-1]):  # 若任意路径经过其他边界节点，则该索引通道可以不建立
+							break
+					else:  # 如果没有路径经过边界节点
+						edges.append((u, v, len(paths[0]) - 1))
+
+				except nx.NetworkXNoPath:
+					#print(f"No path between {u} and {v} in subnet {subnet_id}.")
+					continue
+
+	else:
+		raise ValueError(f"Unknown index build method {method}")
+
+	return edges
 
+
+def make_index_topo(edges, subnet_id):
+	index_topo_i = nx.DiGraph()
+	for u, v, length in edges:
+		# 添加双向边
+		index_topo_i.add_edge(u, v, length=length, subnet=subnet_id)
+		index_topo_i.add_edge(v, u, length=length, subnet=subnet_id)
+	return index_topo_i
+
+
+def export_index_topo(index_topo_i, subnet_id):
 	# 输出索引拓扑情况
 	print(f'Index topology of subnet {subnet_id}:')
 	listC = []
@@ -35,7 +89,8 @@ def process_graph(subgraph, boundary_nodes, subnet_id):
 		listC.append(index_topo_i[e[0]][e[1]]['length'])
 	print('number of nodes', len(index_topo_i))
 	print('num of indexedges', len(listC))
-	print('average length', float(sum(listC))/len(listC))
+	if listC:
+		print('average length', float(sum(listC))/len(listC))
 
 	# 导出索引拓扑
 	file_name = f"partition_results/index_topology_{subnet_id}.csv"
@@ -46,14 +101,137 @@ def process_graph(subgraph, boundary_nodes, subnet_id):
 			length = edge_data.get("length")
 			sid = edge_data.get("subnet")
 			writer.writerow([node1, node2, length, sid])
+
+
+def process_graph(subgraph, boundary_nodes, subnet_id, method='bfs'):
+	print(f"\nStart build index channels in subnet {subnet_id}")
+
+	boundary_list = list(boundary_nodes)
+	index_topo_i = make_index_topo(index_edges(subgraph, boundary_nodes, boundary_list, 0, len(boundary_list), method), subnet_id)
+	export_index_topo(index_topo_i, subnet_id)
 	
 	print(f"End process subnet {subnet_id}\n")
 	
 	return index_topo_i
 
 
+# 进程池中共享的子网和边界节点（fork 时直接继承，不逐任务序列化）
+_shared = {}
+
+
+def init_worker(subGraphs, boundary_nodes, boundary_lists, method):
+	_shared['subGraphs'] = subGraphs
+	_shared['boundary_nodes'] = boundary_nodes
+	_shared['boundary_lists'] = boundary_lists
+	_shared['method'] = method
+
+
+# 子网 subnet_id 中以 boundary_lists[subnet_id][lo:hi] 为起点的一块任务，返回 (索引边, 耗时)
+def index_task(subnet_id, lo, hi):
+	start_time = time.perf_counter()
+	edges = index_edges(_shared['subGraphs'][subnet_id], _shared['boundary_nodes'][subnet_id], _shared['boundary_lists'][subnet_id], lo, hi, _shared['method'])
+	return edges, time.perf_counter() - start_time
+
+
+def pool_context():
+	methods = multiprocessing.get_all_start_methods()
+	return multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+
+def get_executor(subGraphs, boundary_nodes, boundary_lists, method, workers):
+	return ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(), initializer=init_worker, initargs=(subGraphs, boundary_nodes, boundary_lists, method))
+
+
+# 按起点分块：每个起点的代价约为一次 BFS (V_i + E_i)，每块的代价约为总代价的 1/(workers * chunks_per_worker)；
+# 代价大的块先提交（最大子网优先）；subnet_ids: 需要构建的子网（默认全部）
+def index_chunks(subGraphs_undi, boundary_lists, workers, chunks_per_worker, subnet_ids=None):
+	if subnet_ids is None:
+		subnet_ids = range(len(subGraphs_undi))
+	source_costs = [subgraph.number_of_nodes() + subgraph.number_of_edges() for subgraph in subGraphs_undi]
+	total_cost = sum(max(len(boundary_lists[subnet_id]) - 1, 0) * source_costs[subnet_id] for subnet_id in subnet_ids)
+	target_cost = max(total_cost / (workers * chunks_per_worker), 1)
+
+	chunks = []
+	for subnet_id in subnet_ids:
+		boundary_list = boundary_lists[subnet_id]
+		num_sources = len(boundary_list) - 1  # 最后一个边界节点之后没有目标
+		chunk_size = max(1, int(target_cost // max(source_costs[subnet_id], 1)))
+		for lo in range(0, num_sources, chunk_size):
+			hi = min(lo + chunk_size, num_sources)
+			chunks.append(((hi - lo) * source_costs[subnet_id], subnet_id, lo, hi))
+
+	chunks.sort(key=lambda chunk: -chunk[0])
+	return [(subnet_id, lo, hi) for _, subnet_id, lo, hi in chunks]
+
+
+INDEX_CACHE_DIR = 'partition_results/index_cache'
+
+
+# 子网缓存键：子网边集（无向、排序后）、边界节点列表（顺序决定索引边顺序）和构建方法的 sha1
+def subnet_cache_key(subgraph, boundary_list, method):
+	edges = np.array([(u, v) if u <= v else (v, u) for u, v in subgraph.edges()], dtype=np.int64).reshape(-1, 2)
+	edges = edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+	boundary = np.asarray(boundary_list, dtype=np.int64)
+
+	h = hashlib.sha1()
+	h.update(method.encode())
+	h.update(np.array([len(edges), len(boundary)], dtype=np.int64).tobytes())
+	h.update(edges.tobytes())
+	h.update(boundary.tobytes())
+	return h.hexdigest()
+
+
+def save_edge_arrays(file_name, **columns):
+	os.makedirs(os.path.dirname(file_name), exist_ok=True)
+	tmp_name = file_name + '.tmp.npz'
+	np.savez(tmp_name, **{name: np.asarray(column, dtype=np.int64) for name, column in columns.items()})
+	os.replace(tmp_name, file_name)
+
+
+def load_edge_arrays(file_name):
+	try:
+		with np.load(file_name) as data:
+			return {name: data[name].tolist() for name in data.files}
+	except (OSError, ValueError, KeyError):
+		return None
+
+
+# 单个子网的索引边 [(u, v, length)]
+def save_subnet_index(cache_dir, key, edges):
+	save_edge_arrays(os.path.join(cache_dir, f"subnet-{key}.npz"),
+		u=[edge[0] for edge in edges], v=[edge[1] for edge in edges], length=[edge[2] for edge in edges])
+
+
+def load_subnet_index(cache_dir, key):
+	columns = load_edge_arrays(os.path.join(cache_dir, f"subnet-{key}.npz"))
+	if columns is None:
+		return None
+	return list(zip(columns['u'], columns['v'], columns['length']))
+
+
+# 合并后的索引拓扑，按插入顺序保存，重建的 MultiDiGraph 与原图相同（包括边的键和顺序）
+def save_merged_index(cache_dir, key, merged_edges):
+	save_edge_arrays(os.path.join(cache_dir, f"merged-{key}.npz"),
+		u=[edge[0] for edge in merged_edges], v=[edge[1] for edge in merged_edges],
+		length=[edge[2] for edge in merged_edges], subnet=[edge[3] for edge in merged_edges])
+
+
+def load_merged_index(cache_dir, key):
+	columns = load_edge_arrays(os.path.join(cache_dir, f"merged-{key}.npz"))
+	if columns is None:
+		return None
+	index_topo = nx.MultiDiGraph()
+	index_topo.add_edges_from(
+		(u, v, {'length': length, 'subnet': sid})
+		for u, v, length, sid in zip(columns['u'], columns['v'], columns['length'], columns['subnet'])
+	)
+	return index_topo
+
+
 # 基于多最短路径的索引拓扑构建
-def build_index_topo(subGraphs_undi, node_partition_map):
+# cache_dir: 按子网哈希缓存索引边，只重建边集或边界节点变化的子网；所有子网都未变化时直接加载合并后的索引拓扑，
+# 仍逐子网输出并导出 CSV（None 不使用缓存）
+def build_index_topo(subGraphs_undi, node_partition_map, method='bfs', workers=None, chunks_per_worker=4, cache_dir=INDEX_CACHE_DIR):
 	# 筛选出割点
 	cut_nodes = {node for node, partition_ids in node_partition_map.items() if len(partition_ids) > 1}
 
@@ -65,32 +243,98 @@ def build_index_topo(subGraphs_undi, node_partition_map):
 		boundary_nodes.append(boundary_nodes_in_i)
 		print(f'Number of boundary nodes in subnet {i}: {len(boundary_nodes_in_i)} = {len(boundary_nodes[i])}')
 
+	boundary_lists = [list(boundary_nodes_in_i) for boundary_nodes_in_i in boundary_nodes]
+	if workers is None:
+		workers = os.cpu_count()
+
+	start_time = time.perf_counter()
+
+	# 缓存：未变化的子网直接复用
+	cached_edges = {}
+	merged_topo = None
+	if cache_dir is not None:
+		keys = [subnet_cache_key(subgraph, boundary_lists[i], method) for i, subgraph in enumerate(subGraphs_undi)]
+		merged_key = hashlib.sha1(','.join(keys).encode()).hexdigest()
+
+		for i, key in enumerate(keys):
+			edges = load_subnet_index(cache_dir, key)
+			if edges is not None:
+				cached_edges[i] = edges
+		print(f"Index cache: {len(cached_edges)}/{len(subGraphs_undi)} subnets unchanged.")
+
+		# 所有子网都未变化：合并后的索引拓扑不再重新合并
+		if len(cached_edges) == len(subGraphs_undi):
+			merged_topo = load_merged_index(cache_dir, merged_key)
+
+	subnet_ids = [i for i in range(len(subGraphs_undi)) if i not in cached_edges]
+	chunks = index_chunks(subGraphs_undi, boundary_lists, workers, chunks_per_worker, subnet_ids)
+
+	chunk_edges = [{} for _ in subGraphs_undi]
+	build_time = [0.0] * len(subGraphs_undi)
+	finish_time = [0.0] * len(subGraphs_undi)
+	failed = set()
 
-	results = {}
-	with ProcessPoolExecutor() as executor:
+	def collect(subnet_id, lo, result):
+		edges, elapsed = result
+		chunk_edges[subnet_id][lo] = edges
+		build_time[subnet_id] += elapsed
+		finish_time[subnet_id] = time.perf_counter() - start_time
 
-		# 提交所有任务到进程池
-		future_to_subnet_id = {
-			executor.submit(process_graph, subGraphs_undi[i], boundary_nodes[i], i): i
-			for i in range(len(subGraphs_undi))
-		}
+	if workers > 1:
+		with get_executor(subGraphs_undi, boundary_nodes, boundary_lists, method, workers) as executor:
 
-		# 收集结果
-		for future in as_completed(future_to_subnet_id):
-			subnet_id = future_to_subnet_id[future]
-			try:
-				results[subnet_id] = future.result()
-			except Exception as e:
-				print(f"Error when processing subnet {subnet_id}: {e}")
+			# 提交所有任务到进程池
+			future_to_chunk = {
+				executor.submit(index_task, subnet_id, lo, hi): (subnet_id, lo)
+				for subnet_id, lo, hi in chunks
+			}
+
+			# 收集结果
+			for future in as_completed(future_to_chunk):
+				subnet_id, lo = future_to_chunk[future]
+				try:
+					collect(subnet_id, lo, future.result())
+				except Exception as e:
+					print(f"Error when processing subnet {subnet_id}: {e}")
+					failed.add(subnet_id)
+	else:
+		init_worker(subGraphs_undi, boundary_nodes, boundary_lists, method)
+		for subnet_id, lo, hi in chunks:
+			collect(subnet_id, lo, index_task(subnet_id, lo, hi))
 
 	# 创建索引图（有向多重图）
-	index_topo = nx.MultiDiGraph()
+	index_topo = nx.MultiDiGraph() if merged_topo is None else merged_topo
+
+	# 按子网顺序合并索引图
+	merged_edges = []
+	for subnet_id in range(len(subGraphs_undi)):
+		if subnet_id in failed:
+			continue
+		if subnet_id in cached_edges:
+			edges = cached_edges[subnet_id]
+		else:
+			edges = [edge for lo in sorted(chunk_edges[subnet_id]) for edge in chunk_edges[subnet_id][lo]]
+			if cache_dir is not None:
+				save_subnet_index(cache_dir, keys[subnet_id], edges)
+		index_topo_i = make_index_topo(edges, subnet_id)
+		export_index_topo(index_topo_i, subnet_id)
+		if subnet_id in cached_edges:
+			print(f"Subnet {subnet_id}: cached.\n")
+		else:
+			print(f"Subnet {subnet_id}: {len(chunk_edges[subnet_id])} chunks, build time {build_time[subnet_id]:.2f}s, finished at {finish_time[subnet_id]:.2f}s.\n")
 
-	# 合并索引图
-	for subnet_id, index_topo_i in results.items():
+		if merged_topo is not None:
+			continue
 		for u, v, data in index_topo_i.edges(data=True):
 			index_topo.add_edge(u, v, **data)
+			merged_edges.append((u, v, data['length'], data['subnet']))
 
+	if merged_topo is not None:
+		print(f"Loaded cached index topology ({time.perf_counter() - start_time:.2f}s).")
+	else:
+		if cache_dir is not None and not failed:
+			save_merged_index(cache_dir, merged_key, merged_edges)
+		print(f"Index build time: {time.perf_counter() - start_time:.2f}s with {workers} workers, {len(chunks)} chunks.")
 
 	# 输出索引拓扑情况
 	print("number of nodes", len(index_topo.nodes()))
@@ -106,3 +350,305 @@ def build_index_topo(subGraphs_undi, node_partition_map):
 			writer.writerow([node1, node2, length, sid])
 
 	return index_topo
+
+
+DIST_UNREACHABLE = np.iinfo(np.uint16).max
+
+
+class BoundaryDistances:
+	"""Hop distances from every boundary node of one subnet to its nodes.
+
+	dist[r, c] (uint16) is the distance from boundary[r] to nodes[c] in the
+	subnet; unreachable pairs (and distances >= 65535) hold
+	DIST_UNREACHABLE. Subnets are undirected, so the same table gives
+	node -> boundary distances.
+	"""
+
+	def __init__(self, boundary, nodes, dist):
+		self.boundary = boundary
+		self.nodes = nodes
+		self.dist = dist
+		self.row = {node: r for r, node in enumerate(boundary)}
+		self.column = {node: c for c, node in enumerate(nodes)}
+
+	@property
+	def nbytes(self):
+		return self.dist.nbytes
+
+	# {boundary node: distance} for the boundary nodes that reach node
+	def distances(self, node):
+		c = self.column.get(node)
+		if c is None:
+			return {}
+		column = self.dist[:, c].tolist()
+		return {u: d for u, d in zip(self.boundary, column) if d != DIST_UNREACHABLE}
+
+
+# 子网邻接矩阵（CSR，节点顺序为 nodes）
+def subnet_csr(subgraph, nodes):
+	column = {node: c for c, node in enumerate(nodes)}
+	rows = [column[u] for u, v in subgraph.edges()]
+	cols = [column[v] for u, v in subgraph.edges()]
+	return sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(len(nodes), len(nodes)))
+
+
+# 边界节点 boundary[lo:hi] 到子网所有节点的距离（无权 BFS）
+def distance_rows(csr, boundary_columns, lo, hi):
+	dist = csgraph.shortest_path(csr, directed=False, unweighted=True, indices=boundary_columns[lo:hi])
+	dist[~np.isfinite(dist) | (dist >= DIST_UNREACHABLE)] = DIST_UNREACHABLE
+	return dist.astype(np.uint16)
+
+
+def init_distance_worker(csrs, boundary_columns):
+	_shared['csrs'] = csrs
+	_shared['boundary_columns'] = boundary_columns
+
+
+def distance_task(subnet_id, lo, hi):
+	return distance_rows(_shared['csrs'][subnet_id], _shared['boundary_columns'][subnet_id], lo, hi)
+
+
+# 每个子网的边界节点距离表 (BoundaryDistances)，边界节点按块并行计算
+def build_distance_tables(subGraphs_undi, node_partition_map, workers=None, chunks_per_worker=4):
+	start_time = time.perf_counter()
+	cut_nodes = {node for node, partition_ids in node_partition_map.items() if len(partition_ids) > 1}
+	if workers is None:
+		workers = os.cpu_count()
+
+	node_lists = [list(subgraph.nodes()) for subgraph in subGraphs_undi]
+	boundary_lists = [[node for node in nodes if node in cut_nodes] for nodes in node_lists]
+	csrs = [subnet_csr(subgraph, nodes) for subgraph, nodes in zip(subGraphs_undi, node_lists)]
+	boundary_columns = [np.flatnonzero([node in cut_nodes for node in nodes]) for nodes in node_lists]
+
+	# 每个起点的代价约为 V_i + E_i，分块方式与索引构建相同
+	source_costs = [subgraph.number_of_nodes() + subgraph.number_of_edges() for subgraph in subGraphs_undi]
+	total_cost = sum(len(boundary_lists[i]) * source_costs[i] for i in range(len(subGraphs_undi)))
+	target_cost = max(total_cost / (workers * chunks_per_worker), 1)
+	chunks = []
+	for i, boundary_list in enumerate(boundary_lists):
+		chunk_size = max(1, int(target_cost // max(source_costs[i], 1)))
+		for lo in range(0, len(boundary_list), chunk_size):
+			chunks.append((i, lo, min(lo + chunk_size, len(boundary_list))))
+
+	rows = [{} for _ in subGraphs_undi]
+	if workers > 1 and len(chunks) > 1:
+		with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(), initializer=init_distance_worker, initargs=(csrs, boundary_columns)) as executor:
+			future_to_chunk = {executor.submit(distance_task, i, lo, hi): (i, lo) for i, lo, hi in chunks}
+			for future in as_completed(future_to_chunk):
+				i, lo = future_to_chunk[future]
+				rows[i][lo] = future.result()
+	else:
+		init_distance_worker(csrs, boundary_columns)
+		for i, lo, hi in chunks:
+			rows[i][lo] = distance_task(i, lo, hi)
+
+	tables = []
+	for i, nodes in enumerate(node_lists):
+		if rows[i]:
+			dist = np.vstack([rows[i][lo] for lo in sorted(rows[i])])
+		else:
+			dist = np.zeros((0, len(nodes)), dtype=np.uint16)
+		tables.append(BoundaryDistances(boundary_lists[i], nodes, dist))
+
+	print(f"Distance tables: {sum(table.nbytes for table in tables) / 2**20:.1f} MB, build time {time.perf_counter() - start_time:.2f}s.")
+	return tables
+
+
+class IndexMaintainer:
+	"""Keeps the merged index topology up to date under edge changes inside subnets.
+
+	For every boundary source of a subnet the BFS (dist, bad) of
+	boundary_bfs() is kept. After an edge (u, v) is added to or removed
+	from subnet i (the subgraph is already updated, e.g. by
+	network_partition.IncrementalPartitioner), only the sources whose BFS
+	the edge can change are recomputed: a removed edge matters only if it
+	lies on the source's shortest-path DAG (|dist[u] - dist[v]| == 1), an
+	added edge unless both endpoints are unreachable or at equal distance.
+	Their index pairs are compared with the old ones and the MultiDiGraph
+	is patched in place. If the boundary set of a subnet changes (a node
+	becomes or stops being shared), that subnet is rebuilt. The BFS state
+	of a subnet is built on its first event, which costs one subnet build.
+
+	Each call returns the delta: added/removed/changed index pairs
+	(u, v, subnet[, lengths]), one entry per undirected pair, and the
+	rebuilt subnets.
+	"""
+
+	def __init__(self, subGraphs_undi, node_partition_map, index_topo):
+		self.subGraphs = subGraphs_undi
+		self.node_partition_map = node_partition_map
+		self.index_topo = index_topo
+
+		cut_nodes = {node for node, partition_ids in node_partition_map.items() if len(partition_ids) > 1}
+		self.boundary = [cut_nodes.intersection(subgraph.nodes()) for subgraph in subGraphs_undi]
+		self.boundary_list = [list(boundary_nodes_in_i) for boundary_nodes_in_i in self.boundary]
+		self.bfs = [None] * len(subGraphs_undi)
+		self.pairs = [None] * len(subGraphs_undi)
+
+	@staticmethod
+	def pair_key(u, v):
+		return (u, v) if u <= v else (v, u)
+
+	def _is_boundary(self, node, subnet_id):
+		partition_ids = self.node_partition_map.get(node)
+		return node in self.subGraphs[subnet_id] and partition_ids is not None and len(partition_ids) > 1
+
+	# index pairs of subnet_id currently in the merged topology
+	def _index_pairs(self, subnet_id):
+		pairs = {}
+		for u in self.boundary_list[subnet_id]:
+			if u not in self.index_topo:
+				continue
+			for v, keydict in self.index_topo[u].items():
+				for data in keydict.values():
+					if data['subnet'] == subnet_id:
+						pairs[self.pair_key(u, v)] = data['length']
+		return pairs
+
+	def _source_pairs(self, subnet_id, position):
+		boundary_list = self.boundary_list[subnet_id]
+		source = boundary_list[position]
+		dist, bad = self.bfs[subnet_id][source]
+		pairs = {}
+		for v in boundary_list[position + 1:]:
+			if v in dist and not bad[v]:
+				pairs[self.pair_key(source, v)] = dist[v]
+		return pairs
+
+	def _recompute_sources(self, subnet_id, positions):
+		subgraph = self.subGraphs[subnet_id]
+		boundary_nodes = self.boundary[subnet_id]
+		boundary_list = self.boundary_list[subnet_id]
+		pairs = {}
+		for position in positions:
+			source = boundary_list[position]
+			self.bfs[subnet_id][source] = boundary_bfs(subgraph, source, boundary_nodes)
+			pairs.update(self._source_pairs(subnet_id, position))
+		return pairs
+
+	# recompute every source of subnet_id (boundary list old_list -> self.boundary_list[subnet_id])
+	def _rebuild(self, subnet_id, delta, old_pairs=None):
+		if old_pairs is None:
+			old_pairs = self.pairs[subnet_id] if self.pairs[subnet_id] is not None else self._index_pairs(subnet_id)
+		self.bfs[subnet_id] = {}
+		new_pairs = self._recompute_sources(subnet_id, range(len(self.boundary_list[subnet_id]) - 1))
+		self.pairs[subnet_id] = dict(new_pairs)
+		self._patch(subnet_id, old_pairs, new_pairs, delta)
+		delta['rebuilt'].append(subnet_id)
+
+	def _patch(self, subnet_id, old_pairs, new_pairs, delta):
+		for pair, length in old_pairs.items():
+			if pair not in new_pairs:
+				self._remove_pair(subnet_id, pair)
+				delta['removed'].append((pair[0], pair[1], subnet_id))
+			elif new_pairs[pair] != length:
+				self._set_pair(subnet_id, pair, new_pairs[pair])
+				delta['changed'].append((pair[0], pair[1], subnet_id, length, new_pairs[pair]))
+		for pair, length in new_pairs.items():
+			if pair not in old_pairs:
+				self._set_pair(subnet_id, pair, length)
+				delta['added'].append((pair[0], pair[1], subnet_id, length))
+
+	def _find_key(self, u, v, subnet_id):
+		if u in self.index_topo and v in self.index_topo[u]:
+			for key, data in self.index_topo[u][v].items():
+				if data['subnet'] == subnet_id:
+					return key
+		return None
+
+	def _set_pair(self, subnet_id, pair, length):
+		u, v = pair
+		for a, b in ((u, v), (v, u)):
+			key = self._find_key(a, b, subnet_id)
+			if key is None:
+				self.index_topo.add_edge(a, b, length=length, subnet=subnet_id)
+			else:
+				self.index_topo[a][b][key]['length'] = length
+
+	def _remove_pair(self, subnet_id, pair):
+		u, v = pair
+		for a, b in ((u, v), (v, u)):
+			key = self._find_key(a, b, subnet_id)
+			if key is not None:
+				self.index_topo.remove_edge(a, b, key=key)
+		# 与整体构建一致：没有索引边的节点不在索引拓扑中
+		for node in pair:
+			if node in self.index_topo and self.index_topo.degree(node) == 0:
+				self.index_topo.remove_node(node)
+
+	# does the change of edge (u, v) affect the BFS of a source?
+	@staticmethod
+	def _affects(dist, u, v, added):
+		du = dist.get(u)
+		dv = dist.get(v)
+		if added:
+			if du is None and dv is None:
+				return False
+			return du is None or dv is None or du != dv
+		return du is not None and dv is not None and abs(du - dv) == 1
+
+	def _edge_changed(self, subnet_id, u, v, added):
+		delta = {'added': [], 'removed': [], 'changed': [], 'rebuilt': []}
+
+		# 边界节点集合的变化（节点加入/离开子网或成为/不再是割点）
+		rebuild = set()
+		for node in (u, v):
+			subnets = set(self.node_partition_map.get(node) or ()) | {j for j in range(len(self.subGraphs)) if node in self.boundary[j]}
+			for j in subnets:
+				if self._is_boundary(node, j) != (node in self.boundary[j]):
+					rebuild.add(j)
+
+		for j in sorted(rebuild):
+			old_pairs = self.pairs[j] if self.pairs[j] is not None else self._index_pairs(j)
+			boundary_nodes = {node for node in self.boundary[j] if self._is_boundary(node, j)}
+			for node in (u, v):
+				if self._is_boundary(node, j):
+					boundary_nodes.add(node)
+			# 保持原有顺序，新边界节点追加在末尾
+			self.boundary_list[j] = [node for node in self.boundary_list[j] if node in boundary_nodes] + [node for node in (u, v) if node in boundary_nodes and node not in self.boundary[j]]
+			self.boundary[j] = boundary_nodes
+			self._rebuild(j, delta, old_pairs)
+
+		if subnet_id in rebuild:
+			return delta
+		if self.bfs[subnet_id] is None:
+			self._rebuild(subnet_id, delta)
+			return delta
+
+		positions = [
+			position for position, source in enumerate(self.boundary_list[subnet_id][:-1])
+			if self._affects(self.bfs[subnet_id][source][0], u, v, added)
+		]
+		if positions:
+			pairs = self.pairs[subnet_id]
+			sources = {self.boundary_list[subnet_id][position] for position in positions}
+			order = {node: position for position, node in enumerate(self.boundary_list[subnet_id])}
+			# 索引对由列表中靠前的端点作为起点生成
+			old_pairs = {pair: length for pair, length in pairs.items() if min(pair, key=order.get) in sources}
+			new_pairs = self._recompute_sources(subnet_id, positions)
+			for pair in old_pairs:
+				del pairs[pair]
+			pairs.update(new_pairs)
+			self._patch(subnet_id, old_pairs, new_pairs, delta)
+
+		return delta
+
+	def edge_added(self, subnet_id, u, v):
+		return self._edge_changed(subnet_id, u, v, True)
+
+	def edge_removed(self, subnet_id, u, v):
+		return self._edge_changed(subnet_id, u, v, False)
+
+	# events: ('add' | 'remove', subnet_id, u, v); returns the combined delta
+	def apply(self, events):
+		total = {'added': [], 'removed': [], 'changed': [], 'rebuilt': []}
+		for op, subnet_id, u, v in events:
+			if op == 'add':
+				delta = self.edge_added(subnet_id, u, v)
+			elif op == 'remove':
+				delta = self.edge_removed(subnet_id, u, v)
+			else:
+				raise ValueError(f"Unknown event {op}")
+			for name in total:
+				total[name].extend(delta[name])
+		return total
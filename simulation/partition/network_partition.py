@@ -1,45 +1,167 @@
 import networkx as nx
+import numpy as np
+from scipy import sparse
 import csv
 import random
+import time
+import heapq
+import array
+from types import SimpleNamespace
 from collections import deque
+import subnet_map
+import channel_graph
 
 
-def assign_edge_to_partition(G, src, dst, partitions, balance_lambda, payment_lambda, payment_frequency):
+class PartitionState:
+	"""Per-partition state kept up to date as edges are assigned.
 
-	max_load = max(partition.number_of_nodes() for partition in partitions)
-	min_load = min(partition.number_of_nodes() for partition in partitions)
+	membership[node] is a bitmask of the partitions holding node, loads[i]
+	the node count of partition i, and freq_acc[node] a sparse
+	{partition: payment frequency between node and its members} dict, so
+	the state is O(V + P) plus the payment pairs. Each assignment then
+	costs O(P) plus the payment neighbours of nodes joining a partition
+	for the first time, instead of a scan of every partition.
+
+	If payment_frequency is a scipy sparse matrix (see
+	trans_store.payment_frequency_matrix), no accumulators are kept: the
+	score of an edge sums the sparse rows of src and dst over the
+	partitions in each counterparty's membership bitmask.
+	"""
+
+	def __init__(self, num_partitions, payment_frequency=None):
+		self.num_partitions = num_partitions
+		self.membership = {}
+		self.loads = [0] * num_partitions
+		self.payment_frequency = payment_frequency
+		self.freq_acc = {}
+		self.payment_matrix = None
+		if payment_frequency is not None and sparse.issparse(payment_frequency):
+			self.payment_matrix = sparse.csr_matrix(payment_frequency)
+			self.payment_frequency = None
+
+	@classmethod
+	def from_partitions(cls, partitions, payment_frequency=None):
+		state = cls(len(partitions), payment_frequency)
+		for i, partition in enumerate(partitions):
+			for node in partition.nodes():
+				state.add_node(node, i)
+		return state
+
+	def contains(self, node, i):
+		return (self.membership.get(node, 0) >> i) & 1
+
+	def partitions_of(self, node):
+		mask = self.membership.get(node, 0)
+		return [i for i in range(self.num_partitions) if (mask >> i) & 1]
+
+	# returns False if node was already in partition i
+	def add_node(self, node, i):
+		mask = self.membership.get(node, 0)
+		if (mask >> i) & 1:
+			return False
+		self.membership[node] = mask | (1 << i)
+		self.loads[i] += 1
+
+		# node now counts towards the payment score of its counterparties for partition i
+		if self.payment_frequency is not None:
+			for other, value in self.payment_frequency.get(node, {}).items():
+				acc = self.freq_acc.get(other)
+				if acc is None:
+					acc = {}
+					self.freq_acc[other] = acc
+				acc[i] = acc.get(i, 0) + value
+		return True
+
+	# returns False if node was not in partition i
+	def remove_node(self, node, i):
+		mask = self.membership.get(node, 0)
+		if not (mask >> i) & 1:
+			return False
+		mask &= ~(1 << i)
+		if mask:
+			self.membership[node] = mask
+		else:
+			del self.membership[node]
+		self.loads[i] -= 1
+
+		if self.payment_frequency is not None:
+			for other, value in self.payment_frequency.get(node, {}).items():
+				acc = self.freq_acc[other]
+				acc[i] -= value
+				# 频率为整数计数，归零即删除，累加器保持稀疏
+				if acc[i] == 0:
+					del acc[i]
+					if not acc:
+						del self.freq_acc[other]
+		return True
+
+	# payment frequency of src and dst towards each partition
+	def payment_scores(self, src, dst):
+		if self.payment_matrix is not None:
+			return self.sparse_payment_scores(src, dst)
+		scores = [0] * self.num_partitions
+		for node in (src, dst):
+			for i, value in self.freq_acc.get(node, {}).items():
+				scores[i] += value
+		return scores
+
+	# (F[src] + F[dst]) @ membership, by slicing the two CSR rows
+	def sparse_payment_scores(self, src, dst):
+		indptr = self.payment_matrix.indptr
+		indices = self.payment_matrix.indices
+		data = self.payment_matrix.data
+		num_rows = self.payment_matrix.shape[0]
+		membership = self.membership
+
+		scores = [0] * self.num_partitions
+		for node in (src, dst):
+			if node >= num_rows:
+				continue
+			lo, hi = indptr[node], indptr[node + 1]
+			for other, value in zip(indices[lo:hi].tolist(), data[lo:hi].tolist()):
+				mask = membership.get(other, 0)
+				while mask:
+					low = mask & -mask
+					scores[low.bit_length() - 1] += value
+					mask ^= low
+		return scores
+
+
+def assign_edge_to_partition(G, src, dst, partitions, balance_lambda, payment_lambda, payment_frequency, state=None):
+
+	if state is None:
+		state = PartitionState.from_partitions(partitions, payment_frequency)
+
+	loads = state.loads
+	max_load = max(loads)
+	min_load = min(loads)
 
 	best_score = float("-inf")
 	candidates = []
 
 	# 预计算支付频率分值
-	payment_frequency_for_partitions = [0] * len(partitions)
-	payment_frequency_src = payment_frequency.get(src, {})
-	payment_frequency_dst = payment_frequency.get(dst, {})
-	for i, partition in enumerate(partitions):
-		for node, value in payment_frequency_src.items():	
-			if node in partition.nodes():
-				payment_frequency_for_partitions[i] += value
-
-		for node, value in payment_frequency_dst.items():	
-			if node in partition.nodes():
-				payment_frequency_for_partitions[i] += value
+	if payment_lambda:
+		payment_frequency_for_partitions = state.payment_scores(src, dst)
+	else:
+		payment_frequency_for_partitions = [0] * state.num_partitions
 
 	max_frequency = max(payment_frequency_for_partitions)
 	min_frequency = min(payment_frequency_for_partitions)
 
-	# 计算分值
-	for i, partition in enumerate(partitions):
-		degree_src = G.degree[src]
-		degree_dst = G.degree[dst]
-		theta_src = degree_src / (degree_src + degree_dst)
-		theta_dst = degree_dst / (degree_src + degree_dst)
+	degree_src = G.degree[src]
+	degree_dst = G.degree[dst]
+	theta_src = degree_src / (degree_src + degree_dst)
+	theta_dst = degree_dst / (degree_src + degree_dst)
+	mask_src = state.membership.get(src, 0)
+	mask_dst = state.membership.get(dst, 0)
 
-		g_src = 2.0 - theta_src if src in partition else 0
-		g_dst = 2.0 - theta_dst if dst in partition else 0
+	# 计算分值
+	for i in range(state.num_partitions):
+		g_src = 2.0 - theta_src if (mask_src >> i) & 1 else 0
+		g_dst = 2.0 - theta_dst if (mask_dst >> i) & 1 else 0
 
 		replication_score = g_src + g_dst
-		balance_score = balance_lambda * (max_load - partition.number_of_nodes()) / (max_load - min_load + 1e-9)
+		balance_score = balance_lambda * (max_load - loads[i]) / (max_load - min_load + 1e-9)
 		payment_score = payment_lambda * (payment_frequency_for_partitions[i] - min_frequency) / (max_frequency - min_frequency + 1e-9)
 
 		total_score = replication_score + balance_score + payment_score
@@ -52,21 +174,23 @@ def assign_edge_to_partition(G, src, dst, partitions, balance_lambda, payment_la
 	
 	chosen_partition = random.choice(candidates)
 	
-	partitions[chosen_partition].add_edge(src, dst, balance = G[src][dst]["balance"])
+	if partitions is not None:
+		partitions[chosen_partition].add_edge(src, dst, balance = G[src][dst]["balance"])
+	state.add_node(src, chosen_partition)
+	state.add_node(dst, chosen_partition)
 
 	return chosen_partition
 
 
-def bfs_partitioning(G, num_partitions, balance_lambda, payment_lambda, payment_frequency):
-	# 初始化分区
-	partitions = [nx.Graph() for _ in range(num_partitions)]
-
+# BFS遍历无向图中所有边的顺序；遍历与分配结果无关，可预先计算并在多次划分间复用
+def bfs_edge_order(G):
 	# 选择度值最高的节点作为起始节点
 	degrees = G.degree()
 	max_degree_node = max(degrees, key=lambda x: x[1])
 	start_node = max_degree_node[0]
 
 	"""BFS遍历无向图中所有边"""
+	edge_order = []
 	visited_nodes = set()  # 已访问节点集合
 	visited_edges = set()  # 已访问边集合
 	queue = deque([start_node])  # 初始化队列，起点入队
@@ -81,16 +205,189 @@ def bfs_partitioning(G, num_partitions, balance_lambda, payment_lambda, payment_
 
 			if edge not in visited_edges:
 				visited_edges.add(edge)  # 标记边为已访问
-				chosen_partition = assign_edge_to_partition(G, edge[0], edge[1], partitions, balance_lambda, payment_lambda, payment_frequency)
+				edge_order.append(edge)
 
 				# 如果邻居节点未访问，则加入队列
 				if neighbor not in visited_nodes:
 					visited_nodes.add(neighbor)
 					queue.append(neighbor)
 
+	return edge_order
+
+
+def bfs_partitioning(G, num_partitions, balance_lambda, payment_lambda, payment_frequency, edge_order=None):
+	# 初始化分区
+	partitions = [nx.Graph() for _ in range(num_partitions)]
+	state = PartitionState(num_partitions, payment_frequency if payment_lambda else None)
+
+	if edge_order is None:
+		edge_order = bfs_edge_order(G)
+
+	# 按 BFS 顺序分配边
+	for src, dst in edge_order:
+		assign_edge_to_partition(G, src, dst, partitions, balance_lambda, payment_lambda, payment_frequency, state)
+
 	return partitions
 
 
+# 流式划分：不构建 networkx 图，每个节点只保留度、分区位图和支付频率累加器
+
+# undirected channel edges (eid, u, v) of a ChannelGraph in CSR order; each channel is
+# yielded once, from the direction with the smaller edge id
+def edge_stream_from_channel_graph(G_channel):
+	src = np.repeat(np.arange(G_channel.num_nodes, dtype=np.int32), np.diff(G_channel.indptr))
+	eids = np.flatnonzero((G_channel.rev < 0) | (np.arange(len(G_channel.rev)) <= G_channel.rev))
+	for lo in range(0, len(eids), 65536):
+		chunk = eids[lo:lo + 65536]
+		yield from zip(chunk.tolist(), src[chunk].tolist(), G_channel.indices[chunk].tolist())
+
+
+# the same channels in BFS order from the highest-degree node, as bfs_partitioning visits them;
+# an edge is new when its other end has not been dequeued yet, so only O(V) flags are kept
+def bfs_edge_stream(G_channel, degrees):
+	num_nodes = G_channel.num_nodes
+	start_node = int(np.argmax(degrees))
+	queued = np.zeros(num_nodes, dtype=bool)
+	done = np.zeros(num_nodes, dtype=bool)
+
+	queue = deque([start_node])
+	queued[start_node] = True
+	while queue:
+		current_node = queue.popleft()
+		lo = G_channel.indptr[current_node]
+		hi = G_channel.indptr[current_node + 1]
+		for eid, neighbor in zip(range(lo, hi), G_channel.indices[lo:hi].tolist()):
+			if done[neighbor]:
+				continue
+			yield eid, min(current_node, neighbor), max(current_node, neighbor)
+			if not queued[neighbor]:
+				queued[neighbor] = True
+				queue.append(neighbor)
+		done[current_node] = True
+
+
+# channels straight from a topology CSV in file order, with node ids mapped to 0..N-1 on first sight
+# (node_ids is filled in place); parallel channels are streamed, and assigned, one by one
+def edge_stream_from_csv(file_path, node_ids, skip_self_loops=True):
+	with open(file_path, 'r') as f:
+		csv_reader = csv.reader(f)
+		# 跳过表头
+		next(csv_reader)
+		for index, row in enumerate(csv_reader):
+			if skip_self_loops and row[0] == row[1]:
+				continue
+			u = node_ids.setdefault(row[0], len(node_ids))
+			v = node_ids.setdefault(row[1], len(node_ids))
+			yield index, u, v
+
+
+# undirected degrees of a ChannelGraph (number of distinct channel neighbours)
+def channel_graph_degrees(G_channel):
+	degrees = np.zeros(G_channel.num_nodes, dtype=np.int64)
+	for lo in range(0, len(G_channel.rev), 1 << 20):
+		eids = np.arange(lo, min(lo + (1 << 20), len(G_channel.rev)))
+		rev = G_channel.rev[eids]
+		src = np.searchsorted(G_channel.indptr, eids, side='right') - 1
+		once = (rev < 0) | (eids <= rev)
+		np.add.at(degrees, src[once], 1)
+		np.add.at(degrees, G_channel.indices[eids[once]], 1)
+	return degrees
+
+
+# degrees (channel endpoints), the node ids and the number of data rows (skipped self-loops included),
+# from a first pass over the CSV; ids are assigned in the same order as edge_stream_from_csv
+def csv_degrees(file_path, skip_self_loops=True):
+	node_ids = {}
+	counts = array.array('q')
+	num_rows = 0
+	with open(file_path, 'r') as f:
+		csv_reader = csv.reader(f)
+		# 跳过表头
+		next(csv_reader)
+		for row in csv_reader:
+			num_rows += 1
+			if skip_self_loops and row[0] == row[1]:
+				continue
+			u = node_ids.setdefault(row[0], len(node_ids))
+			v = node_ids.setdefault(row[1], len(node_ids))
+			while len(counts) < len(node_ids):
+				counts.append(0)
+			counts[u] += 1
+			counts[v] += 1
+	return np.frombuffer(counts, dtype=np.int64), node_ids, num_rows
+
+
+# one pass over an edge stream of (edge_index, u, v), scoring each edge like assign_edge_to_partition;
+# returns edge_index -> partition (num_edges entries, -1 for edges not in the stream),
+# the node -> partitions map and the PartitionState
+def stream_partitioning(edge_stream, degrees, num_edges, num_partitions, balance_lambda, payment_lambda, payment_frequency):
+	state = PartitionState(num_partitions, payment_frequency if payment_lambda else None)
+	degree_graph = SimpleNamespace(degree=degrees)
+	edge_partition = np.full(num_edges, -1, dtype=np.int16 if num_partitions < 32768 else np.int32)
+
+	for index, u, v in edge_stream:
+		edge_partition[index] = assign_edge_to_partition(degree_graph, u, v, None, balance_lambda, payment_lambda, payment_frequency, state)
+
+	node_partition_map = {node: set(state.partitions_of(node)) for node in state.membership}
+
+	return edge_partition, node_partition_map, state
+
+
+# streaming counterpart of network_partitioning for a ChannelGraph; order is 'bfs' or 'file' (CSR order)
+# the edge -> partition array is indexed by ChannelGraph edge id, with both directions of a channel filled;
+# with file_path the channels are streamed straight from the topology CSV in file order (G_channel is not used):
+# the array is indexed by CSV data row (-1 for skipped self-loops), node ids are assigned on first sight and
+# written to node_ids, and trans / payment_frequency must use the same ids (see csv_degrees); trans=None skips the ratio
+def stream_network_partitioning(G_channel, trans, payment_frequency, config, order='bfs', file_path=None, node_ids=None, skip_self_loops=True):
+	num_partitions = int(config['n'])
+	balance_lambda = config['balance_lambda']
+	payment_lambda = config['payment_lambda']
+
+	if file_path is not None:
+		# 两遍读取 CSV：第一遍统计度和行数，第二遍按文件顺序分配
+		degrees, csv_node_ids, num_edges = csv_degrees(file_path, skip_self_loops)
+		if node_ids is None:
+			node_ids = {}
+		node_ids.update(csv_node_ids)
+		edge_stream = edge_stream_from_csv(file_path, node_ids, skip_self_loops)
+	else:
+		degrees = channel_graph_degrees(G_channel)
+		num_edges = len(G_channel.indices)
+		if order == 'bfs':
+			edge_stream = bfs_edge_stream(G_channel, degrees)
+		else:
+			edge_stream = edge_stream_from_channel_graph(G_channel)
+
+	edge_partition, node_partition_map, state = stream_partitioning(edge_stream, degrees, num_edges, num_partitions, balance_lambda, payment_lambda, payment_frequency)
+
+	# 反向边与正向边属于同一分区
+	if file_path is None:
+		assigned = np.flatnonzero(edge_partition >= 0)
+		rev = G_channel.rev[assigned]
+		edge_partition[rev[rev >= 0]] = edge_partition[assigned[rev >= 0]]
+
+	# 输出划分结果
+	print("\nPartition result:")
+	for i in range(num_partitions):
+		num_assigned = int(np.count_nonzero(edge_partition == i))
+		if file_path is None:
+			print(f"Partition {i}: {num_assigned} directed edges, {state.loads[i]} nodes.")
+		else:
+			print(f"Partition {i}: {num_assigned} channels, {state.loads[i]} nodes.")
+
+	num_shared_nodes = sum(1 for partition_ids in node_partition_map.values() if len(partition_ids) > 1)
+	print(f"Total shared nodes: {num_shared_nodes}.")
+
+	if trans is None:
+		return edge_partition, node_partition_map, None, num_shared_nodes
+
+	# 输出分区内交易占比
+	ratio = intra_transaction_ratio(trans, None, node_partition_map)
+	print(f"Intra-partition transaction ratio: {ratio:.2%}.")
+
+	return edge_partition, node_partition_map, ratio, num_shared_nodes
+
+
 def find_shared_nodes_distribution(partitions, node_partition_map):
 	# 统计割点
 	shared_nodes = {node: partition_ids for node, partition_ids in node_partition_map.items() if len(partition_ids) > 1}
@@ -105,22 +402,163 @@ def find_shared_nodes_distribution(partitions, node_partition_map):
 
 
 def intra_transaction_ratio(trans, partitions, node_partition_map):
-	# 统计分区内交易数量
-	intra_partition_count = 0
-	for src, dst, _ in trans:
-		src_partitions = node_partition_map.get(src, set())
-		dst_partitions = node_partition_map.get(dst, set())
-		if src_partitions & dst_partitions:  # 如果发送方和接收方有共同的分区
-			intra_partition_count += 1
+	# 统计分区内交易数量（发送方和接收方有共同的分区），按位掩码一次性分类
+	intra_partition_count = int(np.count_nonzero(subnet_map.classify_payments(node_partition_map, trans)))
 
 	total_transactions = len(trans)
 
 	return intra_partition_count / total_transactions
 
 
-def network_partitioning(G_ori, trans, payment_frequency, config):
-	# 有向图——>无向图
-	G = G_ori.to_undirected()
+# 无向边的键（端点有序）
+def edge_key(u, v):
+	return (u, v) if u <= v else (v, u)
+
+
+def count_boundary_nodes(partitions):
+	replicas = {}
+	for partition in partitions:
+		for node in partition.nodes:
+			replicas[node] = replicas.get(node, 0) + 1
+	return sum(1 for count in replicas.values() if count > 1), sum(replicas.values())
+
+
+def build_node_partition_map(partitions):
+	node_partition_map = {}
+	for i, partition in enumerate(partitions):
+		for node in partition.nodes:
+			if node not in node_partition_map:
+				node_partition_map[node] = set()
+			node_partition_map[node].add(i)
+	return node_partition_map
+
+
+# 局部搜索：在分区间移动边以降低复制因子（节点副本总数），分区节点数保持在初始 [min, max]（加 slack 余量）之内。
+# cnt[node][i] 是 node 在分区 i 中的边数，移动边 (u, v): a -> b 的收益为
+#   [cnt[u][a] == 1] + [cnt[v][a] == 1] - [cnt[u][b] == 0] - [cnt[v][b] == 0]，
+# 只依赖两个端点的计数；每次移动后只重新评估两个端点的邻边，堆中的旧收益在弹出时惰性校验。
+# 预算：max_moves 次移动 / time_budget 秒；partitions 原地修改
+# slack=0 时初始划分已接近均衡，几乎没有可行移动（lightning 上约 5 次），默认允许 10% 的余量
+def refine_partitions(G, partitions, max_moves=None, time_budget=None, slack=0.1, trans=None):
+	start_time = time.perf_counter()
+	num_partitions = len(partitions)
+
+	boundary_before, replicas_before = count_boundary_nodes(partitions)
+	if trans is not None:
+		ratio_before = intra_transaction_ratio(trans, partitions, build_node_partition_map(partitions))
+
+	edge_partition = {}
+	cnt = {}
+	for i, partition in enumerate(partitions):
+		for u, v in partition.edges:
+			edge_partition[edge_key(u, v)] = i
+			for node in (u, v):
+				if node not in cnt:
+					cnt[node] = [0] * num_partitions
+				cnt[node][i] += 1
+
+	loads = [partition.number_of_nodes() for partition in partitions]
+	min_load = min(loads) * (1 - slack)
+	max_load = max(loads) * (1 + slack)
+
+	def best_move(key):
+		u, v = key
+		a = edge_partition[key]
+		cnt_u = cnt[u]
+		cnt_v = cnt[v]
+		leave = (cnt_u[a] == 1) + (cnt_v[a] == 1)
+		best_gain, best_b = 0, None
+		if leave == 0 or loads[a] - leave < min_load:
+			return best_gain, best_b
+		for b in range(num_partitions):
+			if b == a:
+				continue
+			join = (cnt_u[b] == 0) + (cnt_v[b] == 0)
+			if leave - join > best_gain and loads[b] + join <= max_load:
+				best_gain, best_b = leave - join, b
+		return best_gain, best_b
+
+	heap = []
+	for key in edge_partition:
+		gain, b = best_move(key)
+		if gain > 0:
+			heap.append((-gain, key))
+	heapq.heapify(heap)
+
+	moves = 0
+	pops = 0
+	while heap:
+		if max_moves is not None and moves >= max_moves:
+			break
+		pops += 1
+		if time_budget is not None and pops % 1024 == 0 and time.perf_counter() - start_time > time_budget:
+			break
+
+		neg_gain, key = heapq.heappop(heap)
+		gain, b = best_move(key)
+		if gain <= 0:
+			continue
+		if gain < -neg_gain:
+			# 收益已过期，按当前收益重新入堆
+			heapq.heappush(heap, (-gain, key))
+			continue
+
+		# 移动边 a -> b
+		u, v = key
+		a = edge_partition[key]
+		data = partitions[a][u][v]
+		partitions[a].remove_edge(u, v)
+		partitions[b].add_edge(u, v, **data)
+		edge_partition[key] = b
+		for node in (u, v):
+			cnt_node = cnt[node]
+			cnt_node[a] -= 1
+			if cnt_node[a] == 0:
+				partitions[a].remove_node(node)
+				loads[a] -= 1
+			cnt_node[b] += 1
+			if cnt_node[b] == 1:
+				loads[b] += 1
+		moves += 1
+
+		# 端点计数变化，重新评估其邻边
+		for node in (u, v):
+			for neighbor in G.neighbors(node):
+				neighbor_key = edge_key(node, neighbor)
+				if neighbor_key in edge_partition:
+					neighbor_gain, _ = best_move(neighbor_key)
+					if neighbor_gain > 0:
+						heapq.heappush(heap, (-neighbor_gain, neighbor_key))
+
+	boundary_after, replicas_after = count_boundary_nodes(partitions)
+	report = {
+		'moves': moves,
+		'time': time.perf_counter() - start_time,
+		'boundary_before': boundary_before,
+		'boundary_after': boundary_after,
+		'replicas_before': replicas_before,
+		'replicas_after': replicas_after
+	}
+	print(f"\nRefinement: {moves} edge moves in {report['time']:.2f}s.")
+	print(f"Boundary nodes: {boundary_before} -> {boundary_after}; replicas: {replicas_before} -> {replicas_after}.")
+	if trans is not None:
+		report['ratio_before'] = ratio_before
+		report['ratio_after'] = intra_transaction_ratio(trans, partitions, build_node_partition_map(partitions))
+		print(f"Intra-partition transaction ratio: {ratio_before:.2%} -> {report['ratio_after']:.2%}.")
+
+	return report
+
+
+# G: precomputed G_ori.to_undirected(); seed: seeds the tie-breaking draws; export: write the CSV files;
+# edge_order: precomputed bfs_edge_order(G); refine: None, or keyword arguments of refine_partitions
+# (e.g. {'time_budget': 60}) to run the local-search pass after the BFS partitioning
+def network_partitioning(G_ori, trans, payment_frequency, config, G=None, seed=None, export=True, edge_order=None, refine=None):
+	# 有向图——>无向图（ChannelGraph 的 to_undirected() 只有拓扑，没有余额）
+	if G is None:
+		if isinstance(G_ori, channel_graph.ChannelGraph):
+			G = G_ori.to_networkx().to_undirected()
+		else:
+			G = G_ori.to_undirected()
 	
 	"""
 	ag_degree = sum(dict(G.degree()).values()) / G.number_of_nodes()
@@ -138,15 +576,16 @@ def network_partitioning(G_ori, trans, payment_frequency, config):
 	#print(f"payment_lambda = {payment_lambda}\n")
 	
 	# 网络划分
-	partitions = bfs_partitioning(G, num_partitions, balance_lambda, payment_lambda, payment_frequency)
+	if seed is not None:
+		random.seed(seed)
+	partitions = bfs_partitioning(G, num_partitions, balance_lambda, payment_lambda, payment_frequency, edge_order)
+
+	# 局部搜索优化（可选）
+	if refine is not None:
+		refine_partitions(G, partitions, trans=trans, **refine)
 
 	# 建立节点到分区的映射
-	node_partition_map = {}
-	for i, partition in enumerate(partitions):
-		for node in partition.nodes:
-			if node not in node_partition_map:
-				node_partition_map[node] = set()
-			node_partition_map[node].add(i)
+	node_partition_map = build_node_partition_map(partitions)
 
 
 	# 输出划分结果
@@ -179,6 +618,9 @@ def network_partitioning(G_ori, trans, payment_frequency, config):
 	ratio = intra_transaction_ratio(trans, partitions, node_partition_map)
 	print(f"Intra-partition transaction ratio: {ratio:.2%}.")
 
+	if not export:
+		return partitions, node_partition_map, ratio, len(shared_nodes)
+
 	# 导出分区
 	for i, partition in enumerate(partitions):
 		file_name = f"partition_results/partition_{i}.csv"
@@ -201,3 +643,156 @@ def network_partitioning(G_ori, trans, payment_frequency, config):
 
 
 	return partitions, node_partition_map, ratio, len(shared_nodes)
+
+
+class IncrementalPartitioner:
+	"""Keeps a partitioning up to date under channel open/close events.
+
+	Starts from the undirected graph and the partitions of
+	network_partitioning(). A new channel is placed with the same scoring
+	as assign_edge_to_partition(); a closed channel is removed from its
+	partition, and an endpoint left without edges there leaves the
+	partition. node_partition_map and shared_nodes are updated in place.
+	Each event returns the set of subnets it changed: the channel's subnet,
+	plus every subnet of an endpoint that became or stopped being a
+	boundary node. The union since the last take_changed() is kept in
+	self.changed. If G_ori is given,
+	the directed topology is updated too (balance = cap / 2 each way).
+	"""
+
+	def __init__(self, G, partitions, config, payment_frequency, G_ori=None):
+		self.G = G
+		self.G_ori = G_ori
+		self.partitions = partitions
+		self.balance_lambda = config['balance_lambda']
+		self.payment_lambda = config['payment_lambda']
+		self.payment_frequency = payment_frequency
+		self.state = PartitionState.from_partitions(partitions, payment_frequency if self.payment_lambda else None)
+
+		self.node_partition_map = {}
+		self.edge_partition = {}
+		for i, partition in enumerate(partitions):
+			for node in partition.nodes:
+				self.node_partition_map.setdefault(node, set()).add(i)
+			for u, v in partition.edges:
+				self.edge_partition[edge_key(u, v)] = i
+		self.shared_nodes = {node for node, partition_ids in self.node_partition_map.items() if len(partition_ids) > 1}
+		self.changed = set()
+
+	def _joined(self, node, i):
+		partition_ids = self.node_partition_map.setdefault(node, set())
+		partition_ids.add(i)
+		if len(partition_ids) > 1:
+			self.shared_nodes.add(node)
+
+	def _left(self, node, i):
+		self.partitions[i].remove_node(node)
+		self.state.remove_node(node, i)
+		partition_ids = self.node_partition_map[node]
+		partition_ids.discard(i)
+		if not partition_ids:
+			del self.node_partition_map[node]
+		if len(partition_ids) <= 1:
+			self.shared_nodes.discard(node)
+
+	# subnet i of the channel, plus all subnets of an endpoint whose boundary status flipped
+	# (their boundary node sets changed); was_shared: status of the endpoints before the event
+	def _changed_subnets(self, i, endpoints, was_shared):
+		changed = {i}
+		for node, shared in zip(endpoints, was_shared):
+			if (node in self.shared_nodes) != shared:
+				changed |= self.node_partition_map.get(node, set())
+		self.changed |= changed
+		return changed
+
+	# open a channel, or update the capacity of an existing one
+	def add_channel(self, u, v, cap):
+		if u == v:
+			return set()
+		balance = cap / 2
+		if self.G_ori is not None:
+			self.G_ori.add_edge(u, v, balance=balance)
+			self.G_ori.add_edge(v, u, balance=balance)
+
+		key = edge_key(u, v)
+		was_shared = (u in self.shared_nodes, v in self.shared_nodes)
+		i = self.edge_partition.get(key)
+		if i is not None:
+			self.G[u][v]['balance'] = balance
+			self.partitions[i][u][v]['balance'] = balance
+		else:
+			# 与整体划分相同：先加入拓扑，度数包含新边
+			self.G.add_edge(u, v, balance=balance)
+			i = assign_edge_to_partition(self.G, key[0], key[1], self.partitions, self.balance_lambda, self.payment_lambda, self.payment_frequency, self.state)
+			self.edge_partition[key] = i
+			self._joined(u, i)
+			self._joined(v, i)
+
+		return self._changed_subnets(i, (u, v), was_shared)
+
+	def remove_channel(self, u, v):
+		if self.G_ori is not None:
+			if self.G_ori.has_edge(u, v):
+				self.G_ori.remove_edge(u, v)
+			if self.G_ori.has_edge(v, u):
+				self.G_ori.remove_edge(v, u)
+
+		i = self.edge_partition.pop(edge_key(u, v), None)
+		if self.G.has_edge(u, v):
+			self.G.remove_edge(u, v)
+		if i is None:
+			return set()
+
+		was_shared = (u in self.shared_nodes, v in self.shared_nodes)
+		partition = self.partitions[i]
+		partition.remove_edge(u, v)
+		for node in (u, v):
+			if partition.degree[node] == 0:
+				self._left(node, i)
+
+		return self._changed_subnets(i, (u, v), was_shared)
+
+	# add a node, optionally with its channels [(peer, cap), ...]
+	def add_node(self, node, channels=()):
+		self.G.add_node(node)
+		if self.G_ori is not None:
+			self.G_ori.add_node(node)
+		changed = set()
+		for peer, cap in channels:
+			changed |= self.add_channel(node, peer, cap)
+		return changed
+
+	def remove_node(self, node):
+		changed = set()
+		if node in self.G:
+			for peer in list(self.G.neighbors(node)):
+				changed |= self.remove_channel(node, peer)
+			self.G.remove_node(node)
+		if self.G_ori is not None and node in self.G_ori:
+			self.G_ori.remove_node(node)
+		return changed
+
+	# events: ('open', u, v, cap), ('close', u, v), ('add_node', node[, channels]), ('remove_node', node)
+	def apply(self, events):
+		changed = set()
+		for event in events:
+			if event[0] == 'open':
+				changed |= self.add_channel(*event[1:])
+			elif event[0] == 'close':
+				changed |= self.remove_channel(*event[1:])
+			elif event[0] == 'add_node':
+				changed |= self.add_node(*event[1:])
+			elif event[0] == 'remove_node':
+				changed |= self.remove_node(*event[1:])
+			else:
+				raise ValueError(f"Unknown event {event[0]}")
+		return changed
+
+	# subnets changed since the last call (e.g. to rebuild only their part of the index topology)
+	def take_changed(self):
+		changed = self.changed
+		self.changed = set()
+		return changed
+
+	def intra_ratio(self, trans):
+		return intra_transaction_ratio(trans, self.partitions, self.node_partition_map)
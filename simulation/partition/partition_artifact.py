@@ -0,0 +1,164 @@
+import networkx as nx
+import numpy as np
+import hashlib
+import json
+import os
+
+import channel_graph
+import subnet_map
+
+
+ARTIFACT_VERSION = 1
+
+
+# sha1 of the directed topology (src, dst, balance) in canonical edge order
+def topology_digest(G):
+	if isinstance(G, channel_graph.ChannelGraph):
+		src = np.repeat(np.arange(G.num_nodes, dtype=np.int64), np.diff(G.indptr))[G.active]
+		dst = np.asarray(G.indices, dtype=np.int64)[G.active]
+		balance = np.asarray(G.balance, dtype=np.float64)[G.active]
+	else:
+		edges = list(G.edges(data='balance'))
+		src = np.fromiter((e[0] for e in edges), dtype=np.int64, count=len(edges))
+		dst = np.fromiter((e[1] for e in edges), dtype=np.int64, count=len(edges))
+		balance = np.fromiter((e[2] for e in edges), dtype=np.float64, count=len(edges))
+
+	order = np.lexsort((dst, src))
+	h = hashlib.sha1()
+	for column in (src[order], dst[order], balance[order]):
+		h.update(np.ascontiguousarray(column).tobytes())
+	return h.hexdigest()
+
+
+# config values as plain JSON types, so a loaded config compares equal to the one passed in
+def normalize_config(config):
+	return {key: (value.item() if hasattr(value, 'item') else value) for key, value in config.items()}
+
+
+# binary partition artifact (.npz):
+#   edge_src/edge_dst/balance: undirected partition edges, grouped by partition in each partition's edges() order
+#   edge_partition: partition of every edge; edge_indptr: edges of partition i are edge_indptr[i]..edge_indptr[i+1]-1
+#   nodes/node_indptr: nodes of every partition in insertion order (subgraphs are rebuilt in the same order)
+#   masks: node -> subnet bitmask (subnet_map.SubnetMap)
+#   meta: JSON with config, seed, topology digest and partition stats
+def save_partition_artifact(file_name, G_ori, partitions, node_partition_map, config, seed=None, stats=None):
+	edge_src, edge_dst, balance, edge_partition, nodes = [], [], [], [], []
+	edge_indptr = [0]
+	node_indptr = [0]
+	for i, partition in enumerate(partitions):
+		for u, v, bal in partition.edges(data='balance'):
+			edge_src.append(u)
+			edge_dst.append(v)
+			balance.append(bal)
+		edge_partition.extend([i] * partition.number_of_edges())
+		edge_indptr.append(len(edge_src))
+		nodes.extend(partition.nodes)
+		node_indptr.append(len(nodes))
+
+	masks = subnet_map.as_subnet_map(node_partition_map, len(partitions)).masks
+	meta = {
+		'version': ARTIFACT_VERSION,
+		'config': normalize_config(config),
+		'seed': seed,
+		'topology': topology_digest(G_ori),
+		'num_partitions': len(partitions),
+		'stats': stats or {}
+	}
+
+	directory = os.path.dirname(file_name)
+	if directory:
+		os.makedirs(directory, exist_ok=True)
+	tmp_name = file_name + '.tmp.npz'
+	np.savez(
+		tmp_name,
+		edge_src=np.asarray(edge_src, dtype=np.int64),
+		edge_dst=np.asarray(edge_dst, dtype=np.int64),
+		balance=np.asarray(balance, dtype=np.float64),
+		edge_partition=np.asarray(edge_partition, dtype=np.int16),
+		edge_indptr=np.asarray(edge_indptr, dtype=np.int64),
+		nodes=np.asarray(nodes, dtype=np.int64),
+		node_indptr=np.asarray(node_indptr, dtype=np.int64),
+		masks=masks,
+		meta=np.array(json.dumps(meta))
+	)
+	os.replace(tmp_name, file_name)
+
+
+class PartitionArtifact:
+	"""A saved partition, reloaded from save_partition_artifact().
+
+	Only the arrays are read on load. node_subnet_map (a SubnetMap) and the
+	boundary set come straight from the bitmasks; subgraph(i) rebuilds one
+	partition as an nx.Graph on first use, and subGraphs all of them, with
+	the nodes and edges in the order of the original partition.
+	"""
+
+	def __init__(self, arrays, meta):
+		self.arrays = arrays
+		self.meta = meta
+		self.config = meta['config']
+		self.seed = meta['seed']
+		self.num_partitions = meta['num_partitions']
+		self._subgraphs = [None] * self.num_partitions
+		self._node_subnet_map = None
+		self._boundary = None
+
+	@classmethod
+	def load(cls, file_name):
+		with np.load(file_name) as data:
+			arrays = {name: data[name] for name in data.files if name != 'meta'}
+			meta = json.loads(str(data['meta']))
+		if meta.get('version') != ARTIFACT_VERSION:
+			raise ValueError(f"Unsupported partition artifact version {meta.get('version')}")
+		return cls(arrays, meta)
+
+	# same input topology and (if given) the same partition config and seed
+	def matches(self, G_ori, config=None, seed=None):
+		if config is not None and normalize_config(config) != self.config:
+			return False
+		if seed is not None and seed != self.seed:
+			return False
+		return topology_digest(G_ori) == self.meta['topology']
+
+	def subgraph(self, i):
+		if self._subgraphs[i] is None:
+			lo, hi = self.arrays['edge_indptr'][i], self.arrays['edge_indptr'][i + 1]
+			node_lo, node_hi = self.arrays['node_indptr'][i], self.arrays['node_indptr'][i + 1]
+			partition = nx.Graph()
+			partition.add_nodes_from(self.arrays['nodes'][node_lo:node_hi].tolist())
+			partition.add_edges_from(zip(
+				self.arrays['edge_src'][lo:hi].tolist(),
+				self.arrays['edge_dst'][lo:hi].tolist(),
+				({'balance': bal} for bal in self.arrays['balance'][lo:hi].tolist())
+			))
+			self._subgraphs[i] = partition
+		return self._subgraphs[i]
+
+	@property
+	def subGraphs(self):
+		return [self.subgraph(i) for i in range(self.num_partitions)]
+
+	@property
+	def node_subnet_map(self):
+		if self._node_subnet_map is None:
+			self._node_subnet_map = subnet_map.SubnetMap(self.arrays['masks'], self.num_partitions)
+		return self._node_subnet_map
+
+	@property
+	def boundary(self):
+		if self._boundary is None:
+			self._boundary = set(self.node_subnet_map.boundary_nodes().tolist())
+		return self._boundary
+
+
+# the artifact at file_name if it exists and was built from G_ori with config (and seed), else None
+def load_matching(file_name, G_ori, config=None, seed=None):
+	if not os.path.exists(file_name):
+		return None
+	try:
+		artifact = PartitionArtifact.load(file_name)
+	except (OSError, ValueError, KeyError):
+		return None
+	if not artifact.matches(G_ori, config, seed):
+		return None
+	return artifact
@@ -4,10 +4,17 @@ import random
 import sys
 import copy
 import csv
+import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 sys.path.append('./partition')
 import data_load
+import trans_store
 import network_partition
+import partition_artifact
 
 
 def compute_rsd(data):
@@ -17,27 +24,10 @@ def compute_rsd(data):
 	return rsd
 
 
-def compute_payment_frequency(trans):
-	payment_frequency = {}
-
-	for payment in trans:
-		src = payment[0]
-		dst = payment[1]
-
-		# 添加到支付频率列表中
-		if src not in payment_frequency:
-			payment_frequency[src] = {}
-		if dst not in payment_frequency:
-			payment_frequency[dst] = {}
-		if dst not in payment_frequency[src]:
-			payment_frequency[src][dst] = 0
-		if src not in payment_frequency[dst]:
-			payment_frequency[dst][src] = 0
-
-		payment_frequency[src][dst] += 1
-		payment_frequency[dst][src] += 1
-
-	return payment_frequency
+# matrix=True: scipy CSR matrix over the node ids (scored by sparse row slicing in the partitioner);
+# sketch_k: bounded-memory top-k counterparties per node (trans_store.payment_frequency_sketch)
+def compute_payment_frequency(trans, matrix=False, sketch_k=None):
+	return trans_store.compute_payment_frequency(trans, matrix, sketch_k)
 
 
 def get_topology_and_transactions(trace):
@@ -53,29 +43,54 @@ def get_topology_and_transactions(trace):
 	elif trace == 'scale_free':
 		G_ori, trans = data_load.scale_free_setup()
 
+	# 映射后的交易以内存映射的列存储，各进程共享
+	trans = trans_store.share(trans, 'partition_results/mapped_trans')
+
 	return (G_ori, trans)
 
 
-def run_partition(G_ori, trans, config, payment_frequency, nruns):
+# 单次划分，返回 (rsd, intra_payment_ratio, num_boundary_nodes)；refine: None 或 refine_partitions 的参数（如 {'time_budget': 60}）
+def partition_once(G_ori, G_undi, trans, config, payment_frequency, seed, export, edge_order=None, refine=None):
+	# 网络划分（无向图）
+	subGraphs_undi, node_subnet_map, intra_payment_ratio, num_boundary_nodes = network_partition.network_partitioning(G_ori, trans, payment_frequency, config, G=G_undi, seed=seed, export=export, edge_order=edge_order, refine=refine)
+	# 计算RSD
+	size_of_subnets = []
+	for subgraph in subGraphs_undi:
+		size_of_subnets.append(subgraph.number_of_nodes())
+	rsd = compute_rsd(size_of_subnets)
+
+	#print(f'rsd = {rsd}.')
+
+	return 1.0*rsd, 1.0*intra_payment_ratio, 1.0*num_boundary_nodes
+
+
+# 进程池中共享的只读数据（fork 时直接继承，不逐任务序列化）
+_shared = {}
+
+
+def init_worker(G_ori, G_undi, trans, payment_frequency, edge_order=None):
+	_shared['G_ori'] = G_ori
+	_shared['G_undi'] = G_undi
+	_shared['trans'] = trans
+	_shared['payment_frequency'] = payment_frequency
+	_shared['edge_order'] = edge_order
+
+
+def partition_task(config, seed, export, refine=None):
+	return partition_once(_shared['G_ori'], _shared['G_undi'], _shared['trans'], config, _shared['payment_frequency'], seed, export, _shared['edge_order'], refine)
+
 
-	rsd_list = []
-	intra_payment_ratio_list = []
-	num_nodes_list = []
+def get_executor(G_ori, G_undi, trans, payment_frequency, workers, edge_order=None):
+	methods = multiprocessing.get_all_start_methods()
+	context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+	return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(G_ori, G_undi, trans, payment_frequency, edge_order))
 
-	for _ in range(nruns):
-		# 网络划分（无向图）
-		subGraphs_undi, node_subnet_map, intra_payment_ratio, num_boundary_nodes = network_partition.network_partitioning(G_ori, trans, payment_frequency, config)
-		# 计算RSD
-		size_of_subnets = []
-		for subgraph in subGraphs_undi:
-			size_of_subnets.append(subgraph.number_of_nodes())
-		rsd = compute_rsd(size_of_subnets)
-		
-		#print(f'rsd = {rsd}.')
 
-		rsd_list.append(1.0*rsd)
-		intra_payment_ratio_list.append(1.0*intra_payment_ratio)
-		num_nodes_list.append(1.0*num_boundary_nodes)
+# 去除最高和最低的 RSD 及其相关值后取平均
+def trim_results(results):
+	rsd_list = [result[0] for result in results]
+	intra_payment_ratio_list = [result[1] for result in results]
+	num_nodes_list = [result[2] for result in results]
 
 	# 去除最高和最低的 RSD 及其相关值
 	rsd_sorted_indices = sorted(range(len(rsd_list)), key=lambda i: rsd_list[i])  # 按 RSD 排序的索引
@@ -92,119 +107,245 @@ def run_partition(G_ori, trans, config, payment_frequency, nruns):
 	return avg_rsd, avg_intra_payment_ratio, avg_num_nodes
 
 
-def run_varying_n(trace, n_list, balance_lambda, payment_lambda, nruns):
+# run i uses seed + i, so the sequential and the parallel mode give the same results;
+# export=False skips the per-run CSV exports (in parallel mode only the last run exports);
+# refine: None, or keyword arguments of network_partition.refine_partitions for a local-search pass after each run
+def run_partition(G_ori, trans, config, payment_frequency, nruns, workers=1, export=True, seed=0, G_undi=None, edge_order=None, refine=None):
+
+	# 有向图——>无向图（所有运行共用）
+	if G_undi is None:
+		G_undi = G_ori.to_undirected()
+	# BFS 边顺序与划分参数无关（所有运行共用）
+	if edge_order is None:
+		edge_order = network_partition.bfs_edge_order(G_undi)
+
+	if workers > 1:
+		with get_executor(G_ori, G_undi, trans, payment_frequency, workers, edge_order) as executor:
+			futures = [executor.submit(partition_task, config, seed + run, export and run == nruns - 1, refine) for run in range(nruns)]
+			results = [future.result() for future in futures]
+	else:
+		results = [partition_once(G_ori, G_undi, trans, config, payment_frequency, seed + run, export, edge_order, refine) for run in range(nruns)]
+
+	return trim_results(results)
+
+
+SWEEP_CACHE_DIR = 'partition_results/sweep_cache'
+
+
+# sha1 of the sweep inputs: the topology (partition_artifact.topology_digest) and the mapped transactions
+def input_digest(G_ori, trans):
+	h = hashlib.sha1(partition_artifact.topology_digest(G_ori).encode())
+	for column in (trans.src, trans.dst, trans.amount):
+		h.update(np.ascontiguousarray(column).tobytes())
+	return h.hexdigest()
+
+
+# 网格单元 (n, balance_lambda, payment_lambda) 的缓存文件，按配置、运行次数、种子、局部搜索参数和输入数据（input_digest）取哈希
+def sweep_cell_file(trace, cell, nruns, seed, inputs, refine=None):
+	n, balance_lambda, payment_lambda = cell
+	key = [trace, int(n), float(balance_lambda), float(payment_lambda), nruns, seed, inputs]
+	if refine is not None:
+		key.append(refine)
+	key = json.dumps(key, sort_keys=True)
+	digest = hashlib.sha1(key.encode()).hexdigest()
+	return os.path.join(SWEEP_CACHE_DIR, trace, f"{digest}.json")
+
+
+def load_sweep_cell(file_name):
+	try:
+		with open(file_name) as f:
+			return tuple(json.load(f)['result'])
+	except (OSError, ValueError, KeyError):
+		return None
+
+
+def save_sweep_cell(file_name, cell, nruns, seed, result):
+	os.makedirs(os.path.dirname(file_name), exist_ok=True)
+	tmp_name = file_name + '.tmp'
+	with open(tmp_name, 'w') as f:
+		json.dump({'cell': list(cell), 'nruns': nruns, 'seed': seed, 'result': list(result)}, f)
+	os.replace(tmp_name, file_name)
+
+
+# 网格扫描：拓扑、交易、无向图、BFS 边顺序和支付频率只计算一次，
+# 所有 (单元, 运行) 任务分配到进程池中；完成的单元写入磁盘缓存，中断后重新运行会跳过它们（拓扑或交易改变后缓存失效）。
+# 返回 {cell: (rsd, intra_payment_ratio, num_boundary_nodes)}，结果与逐个调用 run_partition 相同；
+# export=True 时最后一个单元的最后一次运行导出 CSV（与逐个运行时最终留下的文件相同）；refine 同 run_partition
+def run_sweep(trace, cells, nruns, workers=1, seed=0, use_cache=True, export=False, refine=None):
+	cells = list(dict.fromkeys(cells))
+	export_cell = cells[-1] if export and cells else None
 
 	# initialize topology and transactions
 	G_ori, trans = get_topology_and_transactions(trace)
+	inputs = input_digest(G_ori, trans)
+
+	results = {}
+	pending = []
+	for cell in cells:
+		result = load_sweep_cell(sweep_cell_file(trace, cell, nruns, seed, inputs, refine)) if use_cache and cell != export_cell else None
+		if result is not None:
+			results[cell] = result
+		else:
+			pending.append(cell)
+	print(f"\n{len(cells) - len(pending)}/{len(cells)} cells cached, {len(pending)} to run.")
+
+	if not pending:
+		return results
+
 	# compute the payment frequency
-	payment_frequency = compute_payment_frequency(trans)
-
-	# record results
-	res_rsd = []
-	res_ratio = []
-	res_num_nodes = []
-	for n in n_list:
-
-		# set parameters
-		config = {
-			'n': n, 	
-			'balance_lambda': balance_lambda,
-			'payment_lambda': payment_lambda
-		}
-		print(f'\nconfig = {config}.')
-		
-		# run partition
-		rsd, intra_payment_ratio, num_boundary_nodes = run_partition(G_ori, trans, config, payment_frequency, nruns)
-		print(f'rsd = {rsd}; intra_payment_ratio = {intra_payment_ratio}, num_boundary_nodes = {num_boundary_nodes}.')
-		
-		res_rsd.append(rsd)
-		res_ratio.append(intra_payment_ratio)
-		res_num_nodes.append(num_boundary_nodes)
+	payment_frequency = compute_payment_frequency(trans, matrix=True)
+	G_undi = G_ori.to_undirected()
+	edge_order = network_partition.bfs_edge_order(G_undi)
+
+	def cell_config(cell):
+		return {'n': cell[0], 'balance_lambda': cell[1], 'payment_lambda': cell[2]}
+
+	def finish(cell, runs):
+		result = trim_results(runs)
+		results[cell] = result
+		if use_cache:
+			save_sweep_cell(sweep_cell_file(trace, cell, nruns, seed, inputs, refine), cell, nruns, seed, result)
+		print(f'\nconfig = {cell_config(cell)}.')
+		print(f'rsd = {result[0]}; intra_payment_ratio = {result[1]}, num_boundary_nodes = {result[2]}. ({len(results)}/{len(cells)})')
+
+	if workers > 1:
+		with get_executor(G_ori, G_undi, trans, payment_frequency, workers, edge_order) as executor:
+			futures = {}
+			for cell in pending:
+				for run in range(nruns):
+					future = executor.submit(partition_task, cell_config(cell), seed + run, cell == export_cell and run == nruns - 1, refine)
+					futures[future] = (cell, run)
+
+			runs = {cell: [None] * nruns for cell in pending}
+			remaining = {cell: nruns for cell in pending}
+			for future in as_completed(futures):
+				cell, run = futures[future]
+				runs[cell][run] = future.result()
+				remaining[cell] -= 1
+				if remaining[cell] == 0:
+					finish(cell, runs.pop(cell))
+	else:
+		for cell in pending:
+			runs = [partition_once(G_ori, G_undi, trans, cell_config(cell), payment_frequency, seed + run, cell == export_cell and run == nruns - 1, edge_order, refine) for run in range(nruns)]
+			finish(cell, runs)
+
+	return results
+
+
+# 拓扑 CSV 及是否跳过自环（与 data_load.load_snapshot 相同）
+TOPOLOGY_FILES = {
+	'lightning': ("data/lightning/1.2_original_topology.csv", False),
+	'ripple': ("data/ripple/RP_topology.csv", True)
+}
+
+
+# 流式划分（不构建 networkx 图），返回 (edge_partition, node_partition_map, intra_payment_ratio, num_boundary_nodes)；
+# from_csv=True 时按文件顺序直接读取拓扑 CSV：节点按首次出现编号（不取最大联通子图），交易按同一编号映射；
+# sketch_k: 支付频率只保留每个节点的前 sketch_k 个交易对象（内存有界，None 为精确统计）
+def run_stream_partition(trace, config, order='bfs', from_csv=False, sketch_k=None):
+	if from_csv:
+		if trace not in TOPOLOGY_FILES:
+			raise ValueError(f"No topology CSV for trace {trace}")
+		file_path, skip_self_loops = TOPOLOGY_FILES[trace]
+		# 先读一遍得到节点编号，交易映射到 [0, 节点数)
+		_, node_ids, _ = network_partition.csv_degrees(file_path, skip_self_loops)
+		vals = data_load.load_bitcoin_values() if trace == 'lightning' else None
+		trans = data_load.load_transactions(len(node_ids), vals=vals)
+		G_channel = None
+	else:
+		file_path, skip_self_loops = None, True
+		if trace == 'ripple':
+			G_channel, trans = data_load.ripple_setup(mode='array')
+		elif trace == 'lightning':
+			G_channel, trans = data_load.lightning_setup(mode='array')
+		elif trace == 'scale_free':
+			G_channel, trans = data_load.scale_free_setup('array')
+
+	payment_frequency = compute_payment_frequency(trans, matrix=True, sketch_k=sketch_k)
+	return network_partition.stream_network_partitioning(G_channel, trans, payment_frequency, config, order, file_path=file_path, skip_self_loops=skip_self_loops)
+
+
+def run_varying_n(trace, n_list, balance_lambda, payment_lambda, nruns, workers=1, export=True, refine=None):
+
+	cells = [(n, balance_lambda, payment_lambda) for n in n_list]
+	results = run_sweep(trace, cells, nruns, workers, export=export, refine=refine)
 
 	with open(f'partition_results/EXP3-{trace}-balance_lambda={balance_lambda}-payment_lambda={payment_lambda}.txt', 'w') as filehandle:
-		for n, rsd, ratio, num_nodes in zip(n_list, res_rsd, res_ratio, res_num_nodes):
+		for n in n_list:
+			rsd, ratio, num_nodes = results[(n, balance_lambda, payment_lambda)]
 			line = f"{n}, {balance_lambda}, {payment_lambda}, {rsd}, {ratio}, {num_nodes}\n\n"
 			filehandle.write(line)
 
 
-def run_varying_lambda_2(trace, n, balance_lambda_list, payment_lambda_list, nruns):
+def run_varying_lambda_2(trace, n, balance_lambda_list, payment_lambda_list, nruns, workers=1, export=True, refine=None):
 
-	# initialize topology and transactions
-	G_ori, trans = get_topology_and_transactions(trace)
-	# compute the payment frequency
-	payment_frequency = compute_payment_frequency(trans)
+	cells = [(n, balance_lambda, payment_lambda) for balance_lambda in balance_lambda_list for payment_lambda in payment_lambda_list]
+	results = run_sweep(trace, cells, nruns, workers, export=export, refine=refine)
 
 	for balance_lambda in balance_lambda_list:
-	
-		# record results
-		res_rsd = []
-		res_ratio = []
-		res_num_nodes = []
-		for payment_lambda in payment_lambda_list:
-			# set parameters
-			config = {
-				'n': n, 	
-				'balance_lambda': balance_lambda,
-				'payment_lambda': payment_lambda
-			}
-			print(f'\nconfig = {config}.')
-		
-			# run partition
-			rsd, intra_payment_ratio, num_boundary_nodes = run_partition(G_ori, trans, config, payment_frequency, nruns)
-			print(f'rsd = {rsd}; intra_payment_ratio = {intra_payment_ratio}, num_boundary_nodes = {num_boundary_nodes}.')
-		
-			res_rsd.append(rsd)
-			res_ratio.append(intra_payment_ratio)
-			res_num_nodes.append(num_boundary_nodes)
-
 		with open(f'partition_results/EXP2-{trace}-{n}-balance_lambda={balance_lambda}.txt', 'w') as filehandle:
-			for payment_lambda, rsd, ratio, num_nodes in zip(payment_lambda_list, res_rsd, res_ratio, res_num_nodes):
+			for payment_lambda in payment_lambda_list:
+				rsd, ratio, num_nodes = results[(n, balance_lambda, payment_lambda)]
 				line = f"{n}, {balance_lambda}, {payment_lambda}, {rsd}, {ratio}, {num_nodes}\n\n"
 				filehandle.write(line)
 
 
-def run_varying_lambda_1(trace, n, balance_lambda_list, payment_lambda_list, nruns):
+def run_varying_lambda_1(trace, n, balance_lambda_list, payment_lambda_list, nruns, workers=1, export=True, refine=None):
 
-	# initialize topology and transactions
-	G_ori, trans = get_topology_and_transactions(trace)
-	# compute the payment frequency
-	payment_frequency = compute_payment_frequency(trans)
+	cells = [(n, balance_lambda, payment_lambda) for payment_lambda in payment_lambda_list for balance_lambda in balance_lambda_list]
+	results = run_sweep(trace, cells, nruns, workers, export=export, refine=refine)
 
 	for payment_lambda in payment_lambda_list:
-
-		# record results
-		res_rsd = []
-		res_ratio = []
-		res_num_nodes = []
-		for balance_lambda in balance_lambda_list:
-			# set parameters
-			config = {
-				'n': n, 	
-				'balance_lambda': balance_lambda,
-				'payment_lambda': payment_lambda
-			}
-			print(f'\nconfig = {config}.')
-		
-			# run partition
-			rsd, intra_payment_ratio, num_boundary_nodes = run_partition(G_ori, trans, config, payment_frequency, nruns)
-			print(f'rsd = {rsd}; intra_payment_ratio = {intra_payment_ratio}, num_boundary_nodes = {num_boundary_nodes}.')
-		
-			res_rsd.append(rsd)
-			res_ratio.append(intra_payment_ratio)
-			res_num_nodes.append(num_boundary_nodes)
-
 		with open(f'partition_results/EXP1-{trace}-{n}-payment_lambda={payment_lambda}.txt', 'w') as filehandle:
-			for balance_lambda, rsd, ratio, num_nodes in zip(balance_lambda_list, res_rsd, res_ratio, res_num_nodes):
+			for balance_lambda in balance_lambda_list:
+				rsd, ratio, num_nodes = results[(n, balance_lambda, payment_lambda)]
 				line = f"{n}, {balance_lambda}, {payment_lambda}, {rsd}, {ratio}, {num_nodes}\n\n"
 				filehandle.write(line)
 
 
+# 增量划分检查：每个事件返回的子网集合应包含边集或边界节点集合发生变化的所有子网
+def check_incremental_changed(trace, config, num_events=500, seed=0):
+	G_ori, trans = get_topology_and_transactions(trace)
+	payment_frequency = compute_payment_frequency(trans, matrix=True)
+	G_undi = G_ori.to_undirected()
+	partitions, _, _, _ = network_partition.network_partitioning(G_ori, trans, payment_frequency, config, G=G_undi, seed=seed, export=False)
+	incremental = network_partition.IncrementalPartitioner(G_undi, partitions, config, payment_frequency)
+
+	def subnet_state():
+		shared = incremental.shared_nodes
+		return [(frozenset(network_partition.edge_key(u, v) for u, v in partition.edges), frozenset(shared.intersection(partition.nodes))) for partition in partitions]
+
+	rng = random.Random(seed)
+	nodes = list(G_undi.nodes)
+	failures = 0
+	for _ in range(num_events):
+		before = subnet_state()
+		if rng.random() < 0.5:
+			u, v = rng.sample(nodes, 2)
+			changed = incremental.add_channel(u, v, rng.randint(20000, 25000))
+		else:
+			u, v = rng.choice(list(G_undi.edges))
+			changed = incremental.remove_channel(u, v)
+		after = subnet_state()
+
+		expected = {i for i in range(len(partitions)) if before[i] != after[i]}
+		if not expected <= changed:
+			failures += 1
+			print(f"Channel ({u}, {v}): changed {sorted(changed)}, expected {sorted(expected)}.")
+
+	print(f"Incremental partition check: {num_events - failures}/{num_events} events report every changed subnet.")
+	return failures == 0
+
+
 # MAIN CODE
 def main():
 
 	# 实验参数
 	trace = 'lightning' # ripple/lightning/scale_free
 	nruns = 7 # 需要去除rsd最大/最小值
+	workers = os.cpu_count() # 并行划分的进程数（1 为串行）
+	export = False # 是否导出每次划分的 CSV 文件
+	refine = None # 局部搜索参数，如 {'time_budget': 60}（None 为不优化）
 
 	"""
 	# #################### EXP1: Partition with varying lambda_1 ####################
@@ -219,7 +360,7 @@ def main():
 	#payment_lambda_list = [3.0]
 	print(f'payment_lambda_list = {payment_lambda_list}.')
 	
-	run_varying_lambda_1(trace, n, balance_lambda_list, payment_lambda_list, nruns)
+	run_varying_lambda_1(trace, n, balance_lambda_list, payment_lambda_list, nruns, workers, export, refine)
 	"""
 	
 	"""
@@ -234,7 +375,20 @@ def main():
 	payment_lambda_list = np.round(payment_lambda_list, 2).tolist()
 	print(f'payment_lambda_list = {payment_lambda_list}.')
 	
-	run_varying_lambda_2(trace, n, balance_lambda_list, payment_lambda_list, nruns)
+	run_varying_lambda_2(trace, n, balance_lambda_list, payment_lambda_list, nruns, workers, export, refine)
+	"""
+
+
+	"""
+	# #################### Streaming partition (no networkx graph) ####################
+	run_stream_partition('scale_free', {'n': 10, 'balance_lambda': 2.5, 'payment_lambda': 1}, order='bfs', sketch_k=16)
+	run_stream_partition('lightning', {'n': 10, 'balance_lambda': 2.5, 'payment_lambda': 1}, from_csv=True)
+	"""
+
+
+	"""
+	# #################### Check: subnets reported by incremental updates ####################
+	check_incremental_changed(trace, {'n': 10, 'balance_lambda': 2.5, 'payment_lambda': 1})
 	"""
 
 
@@ -244,7 +398,7 @@ def main():
 	balance_lambda = 2.5
 	payment_lambda = 1
 
-	run_varying_n(trace, n_list, balance_lambda, payment_lambda, nruns)
+	run_varying_n(trace, n_list, balance_lambda, payment_lambda, nruns, workers, export, refine)
 
 
 if __name__ == "__main__":
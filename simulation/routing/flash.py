@@ -1,7 +1,11 @@
 import micro_random
 import max_flow
+import flow_engine
 
-def routing(G, payments, threshold, num_max_cache, k_iterations):
+# array_flow: 大额支付的最大流寻路在 flow_engine 的数组网络上进行，结果可能与默认路径不同：
+# find_paths 删除余额耗尽的边后再加回，边被移到 G 邻接表的末尾（并且一直保留，networkx 图和 ChannelGraph 相同），
+# 之后的最短路径（包括小额支付的）按新的邻接顺序打破平局，而数组网络的邻居顺序固定不变
+def routing(G, payments, threshold, num_max_cache, k_iterations, array_flow=False):
 	# 统计信息
 	throughput = 0
 	num_delivered = 0
@@ -9,6 +13,7 @@ def routing(G, payments, threshold, num_max_cache, k_iterations):
 	total_commit_messages = 0
 
 	mega_table = {}  # 路由表
+	network = flow_engine.FlowNetwork.from_graph(G) if array_flow else None
 
 	# 迭代支付
 	for payment in payments:
@@ -16,7 +21,7 @@ def routing(G, payments, threshold, num_max_cache, k_iterations):
 		if payment[2] < threshold:  # 处理小额支付
 			sent, probing_messages, commit_messages = micro_random.routing(G, payment, mega_table, num_max_cache)
 		else:  # 处理大额支付
-			sent, probing_messages, commit_messages = max_flow.routing(G, payment, k_iterations)
+			sent, probing_messages, commit_messages = max_flow.routing(G, payment, k_iterations, network)
 
 		total_probing_messages += probing_messages
 		total_commit_messages += commit_messages
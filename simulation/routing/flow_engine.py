@@ -0,0 +1,343 @@
+import channel_graph
+from collections import deque
+
+
+class FlowNetwork:
+	"""Residual network of payment channels on integer-indexed arrays.
+
+	Node i (nodes[i] is its id) has out_edges[i] / in_edges[i] as edge ids;
+	edge e goes tail[e] -> head[e] with residual balance[e], and rev[e] is
+	the opposite channel direction (-1 if it is not in the network).
+	Pushing c along e moves c from balance[e] to balance[rev[e]].
+	removed[e] marks edges taken out by Flash's path search. Searches keep
+	parent pointers instead of path copies and a bytearray visited bitmap.
+	"""
+
+	def __init__(self):
+		self.nodes = []
+		self.index = {}
+		self.out_edges = []
+		self.in_edges = []
+		self.tail = []
+		self.head = []
+		self.balance = []
+		self.rev = []
+		self.edge_index = {}
+		self.removed = bytearray()
+		self.neighbor_sets = None
+
+	def add_node(self, node):
+		i = self.index.get(node)
+		if i is None:
+			i = len(self.nodes)
+			self.index[node] = i
+			self.nodes.append(node)
+			self.out_edges.append([])
+			self.in_edges.append([])
+		return i
+
+	def add_edge(self, u, v, balance):
+		i = self.add_node(u)
+		j = self.add_node(v)
+		e = len(self.head)
+		self.tail.append(i)
+		self.head.append(j)
+		self.balance.append(balance)
+		self.rev.append(-1)
+		self.out_edges[i].append(e)
+		self.in_edges[j].append(e)
+		self.edge_index[(i, j)] = e
+		self.removed.append(0)
+		return e
+
+	def link_reverse(self):
+		for e in range(len(self.head)):
+			self.rev[e] = self.edge_index.get((self.head[e], self.tail[e]), -1)
+
+	# k 条路径的并集，余额取自 G；BFS 按加边顺序访问邻居（平局与原 networkx 实现不同）。
+	# set_order=True 仅用于与原实现对比：按 set(neighbors) - set(visited) 的顺序访问邻居（见 bfs_order），每次出队都新建集合
+	@classmethod
+	def from_paths(cls, G, paths, set_order=False):
+		network = cls()
+		for path in paths:
+			for i in range(len(path) - 1):
+				u, v = path[i], path[i + 1]
+				if (network.index.get(u), network.index.get(v)) not in network.edge_index:
+					network.add_edge(u, v, G[u][v]["balance"])
+		network.link_reverse()
+		if set_order:
+			network.neighbor_sets = [set(network.nodes[network.head[e]] for e in out) for out in network.out_edges]
+		return network
+
+	# 整个通道图（networkx 或 ChannelGraph），邻居顺序与图本身相同
+	@classmethod
+	def from_graph(cls, G):
+		network = cls()
+		if isinstance(G, channel_graph.ChannelGraph):
+			indptr = G.indptr.tolist()
+			network.nodes = list(range(G.num_nodes))
+			network.index = {node: node for node in network.nodes}
+			network.out_edges = [list(range(indptr[i], indptr[i + 1])) for i in range(G.num_nodes)]
+			for i, order in G._succ_order.items():
+				network.out_edges[i] = list(order)
+			network.head = G.indices.tolist()
+			network.tail = [i for i in range(G.num_nodes) for _ in range(indptr[i + 1] - indptr[i])]
+			network.rev = G.rev.tolist()
+			# 前驱顺序与 G.predecessors 相同
+			in_indptr, in_eids, in_src = G._in_edges()
+			in_indptr = in_indptr.tolist()
+			in_eids = in_eids.tolist()
+			network.in_edges = [in_eids[in_indptr[j]:in_indptr[j + 1]] for j in range(G.num_nodes)]
+			for j, order in G._pred_order.items():
+				network.in_edges[j] = list(order)
+			network.edge_index = {(i, j): e for e, (i, j) in enumerate(zip(network.tail, network.head))}
+			network.load_balances(G)
+			return network
+
+		for u in G:
+			network.add_node(u)
+		for u, nbrs in G.succ.items():
+			for v, data in nbrs.items():
+				network.add_edge(u, v, data["balance"])
+		# 前驱顺序与 G.pred 相同
+		network.in_edges = [[network.edge_index[(network.index[u], j)] for u in G.pred[node]] for j, node in enumerate(network.nodes)]
+		network.link_reverse()
+		return network
+
+	# 从 G 读取当前余额（网络由 from_graph(G) 构建）
+	def load_balances(self, G):
+		if isinstance(G, channel_graph.ChannelGraph):
+			self.balance = G.balance.tolist()
+			self.removed = bytearray((~G.active).astype('uint8').tobytes())
+		else:
+			nodes = self.nodes
+			self.balance = [G[nodes[i]][nodes[j]]["balance"] for i, j in zip(self.tail, self.head)]
+			self.removed = bytearray(len(self.head))
+
+	# out-edges of u in BFS order: out_edges[u] by default. With neighbor_sets (from_paths(..., set_order=True)),
+	# in the iteration order of set(neighbors) - set(visited) as the original networkx BFS computed it. That order
+	# is a CPython implementation detail (set_difference in CPython 3.11 copies the neighbour set and
+	# discards the visited ones when len(neighbors) >> 2 > len(visited), else collects the unvisited ones into a
+	# new set). Other interpreters or versions may order differently; the augmenting paths (and flows) depend on it,
+	# so this mode is only for parity checks against the old networkx results
+	def bfs_order(self, u, visited, num_visited):
+		if self.neighbor_sets is None:
+			return self.out_edges[u]
+		neighbors = self.neighbor_sets[u]
+		index = self.index
+		if (len(neighbors) >> 2) > num_visited:
+			order = neighbors.copy()
+			order.difference_update({w for w in neighbors if visited[index[w]]})
+		else:
+			order = {w for w in neighbors if not visited[index[w]]}
+		return [self.edge_index[(u, index[w])] for w in order]
+
+	def path_nodes(self, edges, s):
+		return [self.nodes[s]] + [self.nodes[self.head[e]] for e in edges]
+
+	def push(self, edges, amount):
+		for e in edges:
+			self.balance[e] -= amount
+			if self.rev[e] >= 0:
+				self.balance[self.rev[e]] += amount
+
+	# BFS over edges with positive balance; the edges of the first path found to t, or None.
+	# As in the original networkx BFS, s itself starts unvisited
+	def bfs_path(self, s, t):
+		head = self.head
+		balance = self.balance
+		visited = bytearray(len(self.nodes))
+		num_visited = 0
+		parent = {}
+		queue = deque([s])
+		while queue:
+			u = queue.popleft()
+			for e in self.bfs_order(u, visited, num_visited):
+				v = head[e]
+				if visited[v] or balance[e] <= 0:
+					continue
+				visited[v] = 1
+				num_visited += 1
+				parent[v] = e
+				if v == t:
+					edges = []
+					while v != s:
+						e = parent[v]
+						edges.append(e)
+						v = self.tail[e]
+					edges.reverse()
+					return edges
+				queue.append(v)
+		return None
+
+	# BFS levels over edges with positive balance
+	def levels(self, s):
+		level = {s: 0}
+		queue = deque([s])
+		while queue:
+			u = queue.popleft()
+			for e in self.out_edges[u]:
+				v = self.head[e]
+				if v not in level and self.balance[e] > 0:
+					level[v] = level[u] + 1
+					queue.append(v)
+		return level
+
+	# one s -> t path in the level graph (Dinic), advancing the current-arc pointers arc
+	def level_path(self, s, t, level, arc):
+		edges = []
+		u = s
+		while u != t:
+			out = self.out_edges[u]
+			while arc[u] < len(out):
+				e = out[arc[u]]
+				v = self.head[e]
+				if self.balance[e] > 0 and level.get(v) == level[u] + 1:
+					break
+				arc[u] += 1
+			else:
+				# 死路：回退一步
+				if not edges:
+					return None
+				e = edges.pop()
+				u = self.tail[e]
+				arc[u] += 1
+				continue
+			edges.append(e)
+			u = self.head[e]
+		return edges
+
+	# bidirectional BFS over the edges not removed (as nx.shortest_path / ChannelGraph.shortest_path)
+	def bidirectional_path(self, s, t):
+		if s == t:
+			return []
+		head = self.head
+		tail = self.tail
+		removed = self.removed
+		pred = {s: -1}
+		succ = {t: -1}
+		forward = [s]
+		reverse = [t]
+		meet = None
+		while forward and reverse and meet is None:
+			if len(forward) <= len(reverse):
+				this_level = forward
+				forward = []
+				for u in this_level:
+					for e in self.out_edges[u]:
+						if removed[e]:
+							continue
+						w = head[e]
+						if w not in pred:
+							forward.append(w)
+							pred[w] = e
+						if w in succ:
+							meet = w
+							break
+					if meet is not None:
+						break
+			else:
+				this_level = reverse
+				reverse = []
+				for v in this_level:
+					for e in self.in_edges[v]:
+						if removed[e]:
+							continue
+						w = tail[e]
+						if w not in succ:
+							succ[w] = e
+							reverse.append(w)
+						if w in pred:
+							meet = w
+							break
+					if meet is not None:
+						break
+		if meet is None:
+			return None
+
+		edges = []
+		w = meet
+		while pred[w] != -1:
+			edges.append(pred[w])
+			w = tail[pred[w]]
+		edges.reverse()
+		w = meet
+		while succ[w] != -1:
+			edges.append(succ[w])
+			w = head[succ[w]]
+		return edges
+
+
+# 最大流：method='edmonds_karp'（最短增广路；默认按加边顺序打破平局，网络以 set_order=True 构建时与原 networkx 实现的结果相同）
+# 或 'dinic'（分层图阻塞流）。
+# 网络中只有同在网络里的反向边，增广是贪心的，两种方法得到的路径和总流量可能不同
+# 返回 path_set, cap_set, probing_messages
+def max_flow(network, src, dst, method='edmonds_karp'):
+	path_set = []
+	cap_set = []
+	probing_messages = 0
+	s = network.index.get(src)
+	t = network.index.get(dst)
+	if s is None or t is None:
+		return path_set, cap_set, probing_messages
+
+	def augment(edges):
+		path_cap = min(network.balance[e] for e in edges)
+		path_set.append(network.path_nodes(edges, s))
+		cap_set.append(path_cap)
+		network.push(edges, path_cap)
+		return len(edges)
+
+	if method == 'edmonds_karp':
+		while True:
+			edges = network.bfs_path(s, t)
+			if edges is None:
+				break
+			probing_messages += augment(edges)
+	elif method == 'dinic':
+		while True:
+			level = network.levels(s)
+			if t not in level:
+				break
+			arc = [0] * len(network.nodes)
+			while True:
+				edges = network.level_path(s, t, level, arc)
+				if edges is None:
+					break
+				probing_messages += augment(edges)
+	else:
+		raise ValueError(f"Unknown max flow method {method}")
+
+	return path_set, cap_set, probing_messages
+
+
+# Flash 的最大流寻路（max_flow.find_paths）：最多 k_iterations 条最短路径，余额 <= 0 的边被移除，反向边被重新加入；
+# 只修改 network 中的余额，不修改原图
+def flash_paths(network, src, dst, k_iterations):
+	path_set = []
+	cap_set = []
+	probing_messages = 0
+	s = network.index[src]
+	t = network.index[dst]
+	balance = network.balance
+	removed = network.removed
+	for iteration_count in range(k_iterations):
+		edges = network.bidirectional_path(s, t)
+		if edges is None:
+			break
+
+		path_set.append(network.path_nodes(edges, s))
+		path_cap = min(balance[e] for e in edges)
+		cap_set.append(path_cap)
+		probing_messages += len(edges)
+
+		for e in edges:
+			balance[e] -= path_cap
+			r = network.rev[e]
+			if r >= 0:
+				removed[r] = 0
+				balance[r] += path_cap
+			if balance[e] <= 0:
+				removed[e] = 1
+
+	return path_set, cap_set, probing_messages
@@ -1,4 +1,5 @@
 import networkx as nx
+import channel_graph
 
 def restore_edges(G, removed_edges):
 	"""恢复删除的边及其属性"""
@@ -11,7 +12,7 @@ def lnd(src, dst, G, a):
 
 	for _ in range(3):# 迭代3次
 		try:
-			path = nx.shortest_path(G, src, dst)
+			path = channel_graph.shortest_path(G, src, dst)
 
 			invalid_edge = None
 			for i in range(len(path) - 1):
@@ -55,9 +56,7 @@ def routing(G, payments):
 		# success
 		if path:
 			# update balance
-			for i in range(len(path) - 1):
-				G[path[i]][path[i + 1]]["balance"] -= payment_size
-				G[path[i + 1]][path[i]]["balance"] += payment_size
+			channel_graph.update_path(G, path, payment_size)
 			throughput += payment_size
 			num_delivered += 1
 
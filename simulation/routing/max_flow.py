@@ -1,5 +1,7 @@
 import networkx as nx
 import collections
+import channel_graph
+import flow_engine
 
 
 def find_paths(G, src, dst, k_iterations):
@@ -13,13 +15,13 @@ def find_paths(G, src, dst, k_iterations):
 	for iteration_count in range(k_iterations):
 		# 查找路径，没有找到路径则停止
 		try:
-			path = nx.shortest_path(G, source=src, target=dst)
+			path = channel_graph.shortest_path(G, src, dst)
 		except nx.NetworkXNoPath:
 			break
 
 		# 记录路径和路径容量信息
 		path_set.append(path)
-		path_cap = min(G[path[i]][path[i + 1]]["balance"] for i in range(len(path) - 1))
+		path_cap = channel_graph.path_capacity(G, path)
 		cap_set.append(path_cap)
 		# 更新探测消息数
 		probing_messages += len(path) - 1
@@ -50,7 +52,8 @@ def find_paths(G, src, dst, k_iterations):
 	return path_set, cap_set, probing_messages
 
 
-def routing(G, payment, k_iterations):
+# network: flow_engine.FlowNetwork.from_graph(G)，寻路在数组上进行，不修改 G（邻居顺序固定，networkx 图上平局可能与 find_paths 不同，见 flash.routing）
+def routing(G, payment, k_iterations, network=None):
 	src, dst, payment_size = payment
 
 	# 统计数据
@@ -60,14 +63,15 @@ def routing(G, payment, k_iterations):
 	commit_messages = 0
 
 	# 最大流寻路
-	path_set, cap_set, probing_messages = find_paths(G, src, dst, k_iterations)
+	if network is not None:
+		network.load_balances(G)
+		path_set, cap_set, probing_messages = flow_engine.flash_paths(network, src, dst, k_iterations)
+	else:
+		path_set, cap_set, probing_messages = find_paths(G, src, dst, k_iterations)
 
-	# 先恢复 G 的余额
-	for path, path_cap in zip(path_set, cap_set):
-		for i in range(len(path) - 1):
-			u, v = path[i], path[i + 1]
-			G[u][v]['balance'] += path_cap
-			G[v][u]['balance'] -= path_cap
+		# 先恢复 G 的余额
+		for path, path_cap in zip(path_set, cap_set):
+			channel_graph.update_path(G, path, -path_cap)
 
 	# 若未找到足够容量，则返回
 	if sum(cap_set) < payment_size:
@@ -78,10 +82,7 @@ def routing(G, payment, k_iterations):
 	for path, path_cap in zip(path_set, cap_set):
 		flow = min(path_cap, remaining_amount)
 		remaining_amount -= flow
-		for i in range(len(path) - 1):
-			u, v = path[i], path[i + 1]
-			G[u][v]['balance'] -= flow
-			G[v][u]['balance'] += flow
+		channel_graph.update_path(G, path, flow)
 		commit_messages += len(path) - 1
 		# 如果支付需求已满足，停止分配
 		if remaining_amount <= 1e-6:
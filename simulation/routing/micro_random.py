@@ -1,11 +1,12 @@
 import networkx as nx
 import sys
 from itertools import islice
+import channel_graph
 
 
 # function to find k shortest paths
 def k_shortest_paths(G, source, target, k):
-	return list(islice(nx.shortest_simple_paths(G, source, target), k))
+	return list(islice(nx.shortest_simple_paths(channel_graph.topology(G), source, target), k))
 
 
 def get_path(mega_table, src, dst):
@@ -42,9 +43,7 @@ def routing(G, payment, mega_table, num_max_cache):
 		remaining_credits = payment_size - sum(sent_list)
 
 		# 计算路径可用余额
-		pathCap = sys.maxsize
-		for i in range(len(path) - 1):
-			pathCap = min(pathCap, G[path[i]][path[i + 1]]["balance"])
+		pathCap = min(sys.maxsize, channel_graph.path_capacity(G, path))
 
 		# 确定发送余额
 		sent = remaining_credits if (pathCap > remaining_credits) else pathCap
@@ -59,9 +58,7 @@ def routing(G, payment, mega_table, num_max_cache):
 		sent_list.append(sent)
 
 		# update path balance
-		for i in range(len(path) - 1):
-			G[path[i]][path[i + 1]]["balance"] -= sent
-			G[path[i + 1]][path[i]]["balance"] += sent
+		channel_graph.update_path(G, path, sent)
 
 		if pathCap >= remaining_credits:
 			break
@@ -69,10 +66,7 @@ def routing(G, payment, mega_table, num_max_cache):
 	# if fails, roll back
 	if sum(sent_list) < payment_size:
 		for i in range(len(visited_paths)):
-			p = visited_paths[i]
-			for j in range(len(p) - 1):
-				G[p[j]][p[j + 1]]["balance"] += sent_list[i]
-				G[p[j + 1]][p[j]]["balance"] -= sent_list[i]
+			channel_graph.update_path(G, visited_paths[i], -sent_list[i])
 		return 0, probing_messages, commit_messages
 	else:
 		return payment_size, probing_messages, commit_messages
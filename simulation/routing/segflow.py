@@ -1,55 +1,13 @@
 import networkx as nx
 import csv
 import random
-from itertools import islice
+from itertools import islice, chain, count
 import collections
-
-
-def bfs_path(G, src, dst):
-	visited = []
-	queue = collections.deque([(src, [src])])
-	while queue:
-		(vertex, path) = queue.popleft()
-		for next in set(list(G.neighbors(vertex))) - set(visited):
-			if G[vertex][next]["balance"] > 0:
-				visited.append(next)
-				if next == dst:
-					return path + [next]
-				else:
-					queue.append((next, path + [next]))
-	return []
-
-
-def max_flow_of_kpaths(G_kpaths, src, dst):
-	local_G = G_kpaths.copy()
-
-	path_set = []
-	cap_set = []
-	probing_messages = 0
-
-	# 寻找最大流
-	while True:
-		# 查找路径，没有找到路径则停止
-		path = bfs_path(local_G, src, dst)
-		if not path:
-			break
-
-		# 记录路径和路径容量信息
-		path_set.append(path)
-		path_cap = min(local_G[path[i]][path[i + 1]]["balance"] for i in range(len(path) - 1))
-		cap_set.append(path_cap)
-
-		# 更新探测消息数
-		probing_messages += len(path) - 1
-
-		# 更新local_G
-		for i in range(len(path) - 1):
-			u, v = path[i], path[i + 1]
-			local_G[u][v]["balance"] -= path_cap
-			if local_G.has_edge(v, u):
-				local_G[v][u]["balance"] += path_cap
-
-	return path_set, cap_set, probing_messages
+import sys
+import heapq
+import channel_graph
+import flow_engine
+import subnet_map
 
 
 def extract_edge_disjoint_paths(paths):
@@ -149,108 +107,504 @@ def get_path_attributes(index_path, keys, index_topo):
 	return path_length, subnet_ids
 
 
-def dijkstra_for_multigraph(G, source, target, weight):
-	# Get the shortest path
-	try:
-		path = nx.shortest_path(G, source, target, weight=weight)
-	except nx.NetworkXNoPath:
-		#print(f"No path between {source} and {target} in current graph.")
-		return [], []
-
-	# Get the key of each edge in the path
-	path_keys = []
-	for i in range(len(path) - 1):
-		u, v = path[i], path[i + 1]
-		edge_data = G.get_edge_data(u, v)
-
-		weights = [data[weight] for data in edge_data.values()]
-		min_weight = min(weights) # 获取最小权重
-		keys_with_min_weight = [key for key, data in edge_data.items() if data[weight] == min_weight] # 获取拥有最小权重的边的key
-		random_key = random.choice(keys_with_min_weight)
-		# print(f"[{u}, {v}]  min_weight: {min_weight}, keys_with_min_weight: {keys_with_min_weight}, random_key: {random_key}.")
-
-		path_keys.append(random_key)
-
-	return path, path_keys
+class IndexOverlay:
+	"""Per-payment view of the index topology without copying it.
+
+	The base MultiDiGraph is shared and never modified. Virtual edges
+	(src -> boundary, boundary -> dst) live in a small per-view layer, so
+	building a view costs O(virtual edges) instead of O(index edges).
+	base_pred holds the predecessors of the base in the node order of a
+	MultiDiGraph.copy(), so path searches break ties as on the extended
+	copy. Yen's spur searches mask nodes and edges in IndexQuery instead
+	of changing the view.
+	"""
+
+	def __init__(self, base, base_pred=None, shared=None):
+		self.base = base
+		self.shared = shared if shared is not None else {}
+		if base_pred is None:
+			# MultiDiGraph.copy() 之后的前驱顺序：按节点顺序
+			base_pred = {node: {} for node in base}
+			for u, nbrs in base._succ.items():
+				for v, keydict in nbrs.items():
+					base_pred[v][u] = keydict
+		self.base_pred = base_pred
+		self.extra_nodes = {}
+		self.extra_succ = {}
+		self.extra_pred = {}
+
+	# empty view on the same base
+	def view(self):
+		return IndexOverlay(self.base, self.base_pred, self.shared)
+
+	# IndexArrays of the base, built once and shared by all views
+	def arrays(self):
+		if 'arrays' not in self.shared:
+			self.shared['arrays'] = IndexArrays(self.base, self.base_pred)
+		return self.shared['arrays']
+
+	def add_edge(self, u, v, **attr):
+		for node in (u, v):
+			if node not in self.base and node not in self.extra_nodes:
+				self.extra_nodes[node] = len(self.extra_nodes)
+		existing = self.get_edge_data(u, v) or {}
+		key = len(existing)
+		while key in existing:
+			key += 1
+		keydict = self.extra_succ.setdefault(u, {}).setdefault(v, {})
+		keydict[key] = attr
+		self.extra_pred.setdefault(v, {})[u] = keydict
+		return key
+
+	# {key: data} of the u -> v edges of the base and the view
+	def get_edge_data(self, u, v, default=None):
+		base = self.base._succ.get(u, {}).get(v)
+		extra = self.extra_succ.get(u, {}).get(v)
+		if not extra:
+			return base if base is not None else default
+		return {**base, **extra} if base else extra
+
+
+class IndexCapacity:
+	"""Bottleneck capacity of index edges from the live channel balances.
+
+	For an index edge u -> v of subnet i, the capacity is the largest
+	bottleneck balance over the shortest u -> v paths of the subnet, from a
+	max-bottleneck DP over the BFS DAG of u (cap_out; cap_in gives the
+	v -> u direction over the same DAG). DP results are cached per
+	(subnet, source) and dropped when a commit changes the balance of an
+	edge on that source's shortest-path DAG, so they are refreshed lazily on
+	the next lookup.
+	"""
+
+	def __init__(self, subGraphs, G, node_subnet_map):
+		self.subGraphs = subGraphs
+		self.G = G
+		self.node_subnet_map = node_subnet_map
+		self.cache = {}
+		self.sources = collections.defaultdict(set)
+
+	def _compute(self, subnet_id, source):
+		subgraph = self.subGraphs[subnet_id]
+		G = self.G
+		inf = float("inf")
+		dist = {source: 0}
+		cap_out = {source: inf}
+		cap_in = {source: inf}
+		queue = collections.deque([source])
+		while queue:
+			w = queue.popleft()
+			d = dist[w] + 1
+			for x in subgraph.neighbors(w):
+				dx = dist.get(x)
+				if dx is None:
+					dist[x] = d
+					cap_out[x] = min(cap_out[w], G[w][x]["balance"])
+					cap_in[x] = min(cap_in[w], G[x][w]["balance"])
+					queue.append(x)
+				elif dx == d:
+					cap_out[x] = max(cap_out[x], min(cap_out[w], G[w][x]["balance"]))
+					cap_in[x] = max(cap_in[x], min(cap_in[w], G[x][w]["balance"]))
+
+		entry = (dist, cap_out, cap_in)
+		self.cache[(subnet_id, source)] = entry
+		self.sources[subnet_id].add(source)
+		return entry
+
+	def capacity(self, subnet_id, u, v):
+		entry = self.cache.get((subnet_id, u))
+		if entry is not None:
+			return entry[1].get(v, 0)
+		entry = self.cache.get((subnet_id, v))
+		if entry is not None:
+			return entry[2].get(u, 0)
+		return self._compute(subnet_id, u)[1].get(v, 0)
+
+	# capacity of an index edge given its data dict (for the path search)
+	def edge_capacity(self, u, v, data):
+		return self.capacity(data['subnet'], u, v)
+
+	# balances on path changed: drop the DP results whose shortest-path DAG contains one of its edges
+	def touch(self, path):
+		for a, b in zip(path[:-1], path[1:]):
+			for subnet_id in self.node_subnet_map.common(a, b):
+				if not self.subGraphs[subnet_id].has_edge(a, b):
+					continue
+				for source in list(self.sources[subnet_id]):
+					dist = self.cache[(subnet_id, source)][0]
+					if a in dist and b in dist and abs(dist[a] - dist[b]) == 1:
+						del self.cache[(subnet_id, source)]
+						self.sources[subnet_id].discard(source)
+
+
+class IndexArrays:
+	"""Array form of the base index topology for Yen's spur searches.
+
+	Nodes are numbered 0..n-1 in node order and every (parallel) edge gets
+	an edge id. succ[i] / pred[i] list the (neighbor, edges) groups of node
+	i in adjacency order (pred in the node order of MultiDiGraph.copy()),
+	edges being the (edge id, key, data) of the parallel edges. Built once
+	per base; IndexQuery adds the virtual nodes and edges of a view.
+	"""
+
+	def __init__(self, base, base_pred):
+		self.nodes = list(base)
+		self.index = {node: i for i, node in enumerate(self.nodes)}
+		self.succ = [[] for _ in self.nodes]
+		self.num_edges = 0
+		groups = {}
+		for u, nbrs in base._succ.items():
+			i = self.index[u]
+			for v, keydict in nbrs.items():
+				group = []
+				for key, data in keydict.items():
+					group.append((self.num_edges, key, data))
+					self.num_edges += 1
+				group = tuple(group)
+				self.succ[i].append((self.index[v], group))
+				groups[(u, v)] = group
+		self.pred = [[(self.index[u], groups[(u, v)]) for u in base_pred[v]] for v in self.nodes]
+
+
+class IndexQuery:
+	"""IndexArrays plus the virtual nodes and edges of one IndexOverlay view.
+
+	Removed nodes and edges of a spur search are set in the node_mask /
+	edge_mask bytearrays and cleared afterwards, instead of copying the
+	graph. The first search sees virtual predecessors in insertion order,
+	spur searches in node order, as the extended MultiDiGraph and its
+	copies in the original spur searches did.
+	"""
+
+	def __init__(self, arrays, overlay):
+		self.arrays = arrays
+		num_base = len(arrays.nodes)
+		self.extra_nodes = list(overlay.extra_nodes)
+		self.extra_index = {node: num_base + i for i, node in enumerate(self.extra_nodes)}
+		self.num_nodes = num_base + len(self.extra_nodes)
+
+		self.extra_succ = {}
+		self.extra_pred_first = {}
+		num_edges = arrays.num_edges
+		for u, nbrs in overlay.extra_succ.items():
+			i = self.index_of(u)
+			for v, keydict in nbrs.items():
+				group = []
+				for key, data in keydict.items():
+					group.append((num_edges, key, data))
+					num_edges += 1
+				group = tuple(group)
+				self.extra_succ.setdefault(i, []).append((self.index_of(v), group))
+		self.num_edges = num_edges
+		for v, preds in overlay.extra_pred.items():
+			j = self.index_of(v)
+			self.extra_pred_first[j] = [(self.index_of(u), self._group(self.index_of(u), j)) for u in preds]
+		self.extra_pred = {j: sorted(preds, key=lambda item: item[0]) for j, preds in self.extra_pred_first.items()}
+
+		self.node_mask = bytearray(self.num_nodes)
+		self.edge_mask = bytearray(self.num_edges)
+
+	def index_of(self, node):
+		i = self.arrays.index.get(node)
+		return i if i is not None else self.extra_index.get(node)
+
+	def node_of(self, i):
+		num_base = len(self.arrays.nodes)
+		return self.arrays.nodes[i] if i < num_base else self.extra_nodes[i - num_base]
+
+	def succ(self, i):
+		base = self.arrays.succ[i] if i < len(self.arrays.nodes) else ()
+		extra = self.extra_succ.get(i)
+		return base if extra is None else chain(base, extra)
+
+	def pred(self, j, first):
+		base = self.arrays.pred[j] if j < len(self.arrays.nodes) else ()
+		extra = (self.extra_pred_first if first else self.extra_pred).get(j)
+		return base if extra is None else chain(base, extra)
+
+	# all parallel edges i -> j as (edge id, key, data)
+	def _group(self, i, j):
+		group = ()
+		for w, parallel in self.succ(i):
+			if w == j:
+				group += parallel
+		return group
+
+	# parallel edges i -> j that are not masked
+	def edges(self, i, j):
+		return [entry for entry in self._group(i, j) if not self.edge_mask[entry[0]]]
+
+	# networkx.bidirectional_dijkstra over the masked arrays, then a random key among the
+	# minimum-weight parallel edges; ([], []) if there is no path
+	def shortest_path(self, s, t, weight, first=False):
+		node_mask = self.node_mask
+		edge_mask = self.edge_mask
+		path = [s]
+		if s != t:
+			dists = [{}, {}]
+			preds = [{s: None}, {t: None}]
+			fringe = [[], []]
+			seen = [{s: 0}, {t: 0}]
+			c = count()
+			heapq.heappush(fringe[0], (0, next(c), s))
+			heapq.heappush(fringe[1], (0, next(c), t))
+			finaldist = None
+			meetnode = None
+			direction = 1
+			path = []
+			while fringe[0] and fringe[1]:
+				direction = 1 - direction
+				(dist, _, v) = heapq.heappop(fringe[direction])
+				if v in dists[direction]:
+					continue
+				dists[direction][v] = dist
+				if v in dists[1 - direction]:
+					curr = meetnode
+					while curr is not None:
+						path.append(curr)
+						curr = preds[0][curr]
+					path.reverse()
+					curr = preds[1][meetnode]
+					while curr is not None:
+						path.append(curr)
+						curr = preds[1][curr]
+					break
 
+				for w, group in (self.succ(v) if direction == 0 else self.pred(v, first)):
+					if node_mask[w] or w in dists[direction]:
+						continue
+					cost = None
+					for e, key, data in group:
+						if not edge_mask[e]:
+							edge_cost = data.get(weight, 1)
+							if cost is None or edge_cost < cost:
+								cost = edge_cost
+					if cost is None:
+						continue
+					vw_length = dist + cost
+					if w not in seen[direction] or vw_length < seen[direction][w]:
+						seen[direction][w] = vw_length
+						heapq.heappush(fringe[direction], (vw_length, next(c), w))
+						preds[direction][w] = v
+						if w in seen[1 - direction]:
+							finaldist_w = vw_length + seen[1 - direction][w]
+							if finaldist is None or finaldist > finaldist_w:
+								finaldist, meetnode = finaldist_w, w
+			if not path:
+				return [], []
+
+		entries = []
+		for i in range(len(path) - 1):
+			parallel = self.edges(path[i], path[i + 1])
+			min_weight = min(data[weight] for _, _, data in parallel)
+			entries.append(random.choice([entry for entry in parallel if entry[2][weight] == min_weight]))
+		return path, entries
+
+	# widest-shortest path: minimum total weight, ties broken by the largest bottleneck capacity;
+	# index edges with no capacity left are skipped. (length, -bottleneck) labels are monotone, so Dijkstra applies
+	def widest_shortest_path(self, s, t, weight, capacity):
+		node_mask = self.node_mask
+		edge_mask = self.edge_mask
+		inf = float("inf")
+		best = {s: (0, -inf)}
+		prev = {}
+		counter = 0
+		heap = [(0, -inf, counter, s)]
+		while heap:
+			length, neg_cap, _, u = heapq.heappop(heap)
+			if (length, neg_cap) > best[u]:
+				continue
+			if u == t:
+				break
+			for v, group in self.succ(u):
+				if node_mask[v]:
+					continue
+				for entry in group:
+					if edge_mask[entry[0]]:
+						continue
+					cap = capacity(self.node_of(u), self.node_of(v), entry[2])
+					if cap <= 0:
+						continue
+					label = (length + entry[2][weight], -min(-neg_cap, cap))
+					if v not in best or label < best[v]:
+						best[v] = label
+						prev[v] = (u, entry)
+						counter += 1
+						heapq.heappush(heap, (label[0], label[1], counter, v))
+
+		if t not in best:
+			return [], []
+		path = [t]
+		entries = []
+		while path[-1] != s:
+			u, entry = prev[path[-1]]
+			path.append(u)
+			entries.append(entry)
+		path.reverse()
+		entries.reverse()
+		return path, entries
+
+
+# Yen's k shortest paths on the index topology (an IndexOverlay view or a MultiDiGraph). The graph is
+# searched as IndexArrays with transient node/edge masks, candidates sit in a heap with their weights
+# (ties: earliest candidate first) and are deduplicated by hash.
+# capacity: None for hop-count Yen; otherwise capacity(u, v, data) of index edges, for widest-shortest index paths
+# lawler: spur only from the node where a path deviated from its parent (Lawler); earlier spur nodes give no new
+# path lengths, but may give other equal-length paths, so it is off by default
+def yen_k_shortest_paths_for_multigraph(G, source, target, k, weight, capacity=None, lawler=False):
+	if not isinstance(G, IndexOverlay):
+		G = IndexOverlay(G)
+	query = IndexQuery(G.arrays(), G)
+	s = query.index_of(source)
+	t = query.index_of(target)
+	if s is None or t is None:
+		return []
 
-def yen_k_shortest_paths_for_multigraph(G, source, target, k, weight):
+	def find_path(spur, first=False):
+		if capacity is None:
+			return query.shortest_path(spur, t, weight, first)
+		return query.widest_shortest_path(spur, t, weight, capacity)
 
-	k_shortest_paths = []
-	potential_paths = []
+	def path_weight(path, entries):
+		total = sum(entry[2][weight] for entry in entries)
+		if capacity is None:
+			return total
+		bottleneck = float("inf")
+		for i, entry in enumerate(entries):
+			bottleneck = min(bottleneck, capacity(query.node_of(path[i]), query.node_of(path[i + 1]), entry[2]))
+		return (total, -bottleneck)
 
 	# Compute the first shortest path
-	first_path, first_path_keys = dijkstra_for_multigraph(G, source, target, weight)
+	first_path, first_entries = find_path(s, first=True)
 	if not first_path:
 		return []
-	k_shortest_paths.append((first_path, first_path_keys))
+	k_shortest_paths = [(first_path, first_entries, 0)]
 
+	potential_paths = []
+	potential_set = set()
+	counter = count()
+	node_mask = query.node_mask
+	edge_mask = query.edge_mask
 
-	for i in range(1,k):
+	for i in range(1, k):
 		# 获取第i条路径
-		cur_shortest_path = k_shortest_paths[i-1][0]
-		cur_shortest_path_keys = k_shortest_paths[i-1][1]
+		cur_path, cur_entries, deviation = k_shortest_paths[i - 1]
 
 		# 遍历第i条路径的边
-		for j in range(len(cur_shortest_path) - 1):
-			spur_node = cur_shortest_path[j]
-			root_path = cur_shortest_path[:j + 1]
-			root_path_keys = cur_shortest_path_keys[:j]
-
-			# 复制原图
-			tmp_G = G.copy() 
-			# 移除边
-			for path, keys in k_shortest_paths:
-				if path[:j + 1] == root_path and keys[:j] == root_path_keys:
-					if tmp_G.has_edge(path[j], path[j + 1], keys[j]):
-						tmp_G.remove_edge(path[j], path[j + 1], key = keys[j])
-			# 移除节点
-			for node in root_path[:-1]:
-				tmp_G.remove_node(node)
+		for j in range(deviation if lawler else 0, len(cur_path) - 1):
+			root_path = cur_path[:j + 1]
+			root_entries = cur_entries[:j]
+
+			# 屏蔽边和节点（代替复制原图）
+			masked_edges = [
+				entries[j][0] for path, entries, _ in k_shortest_paths
+				if path[:j + 1] == root_path and entries[:j] == root_entries and not edge_mask[entries[j][0]]
+			]
+			masked_nodes = [node for node in root_path[:-1] if not node_mask[node]]
+			for e in masked_edges:
+				edge_mask[e] = 1
+			for node in masked_nodes:
+				node_mask[node] = 1
 
 			# 计算从spurnode到target的最短路径
-			spur_path, spur_path_keys = dijkstra_for_multigraph(tmp_G, spur_node, target, weight)
+			spur_path, spur_entries = find_path(cur_path[j])
+
+			for e in masked_edges:
+				edge_mask[e] = 0
+			for node in masked_nodes:
+				node_mask[node] = 0
 
 			# 拼接路径 root_path + spur_path
 			if spur_path:
 				total_path = root_path[:-1] + spur_path
-				total_path_keys = root_path_keys + spur_path_keys
-
-				if not any(p[0] == total_path and p[1] == total_path_keys for p in potential_paths):
-					potential_paths.append((total_path, total_path_keys))
+				total_entries = root_entries + spur_entries
+				candidate = (tuple(total_path), tuple(entry[0] for entry in total_entries))
+				if candidate not in potential_set:
+					potential_set.add(candidate)
+					heapq.heappush(potential_paths, (path_weight(total_path, total_entries), next(counter), total_path, total_entries, j))
 
 		# Choose the best potential path (the shortest one)
-		if potential_paths:
-			best_path = []
-			best_path_keys = []
-			min_weight = float("inf")
-			
-			for path, keys in potential_paths:
-				cur_weight = 0
-				for i in range(len(path)-1):
-					edge_data = G.get_edge_data(path[i], path[i+1])
-					cur_weight += edge_data[keys[i]][weight]
-				
-				if cur_weight < min_weight: 
-					min_weight = cur_weight
-					best_path = path
-					best_path_keys = keys
-
-			k_shortest_paths.append((best_path,best_path_keys))
-			potential_paths.remove((best_path, best_path_keys)) # 移除选中的路径
-
-		else:
+		if not potential_paths:
 			break
-
-	return k_shortest_paths
-
-
-def get_k_shortest_paths(src, dst, extended_index_topo, subGraphs, k):
+		_, _, best_path, best_entries, deviation = heapq.heappop(potential_paths)
+		potential_set.discard((tuple(best_path), tuple(entry[0] for entry in best_entries)))
+		k_shortest_paths.append((best_path, best_entries, deviation))
+
+	return [([query.node_of(node) for node in path], [entry[1] for entry in entries]) for path, entries, _ in k_shortest_paths]
+
+
+class PathCache:
+	"""LRU cache of the k shortest simple paths between two nodes of a subnet.
+
+	Keyed by (subnet_id, u, v, k). Hop-count paths depend only on the
+	subnet topology, not on balances, so entries stay valid across commits;
+	invalidate(subnet_id) must be called after a subnet's topology changes.
+	Least recently used entries are evicted once the estimated size of the
+	cached paths exceeds max_bytes. The cached path lists are shared and
+	must not be modified.
+	"""
+
+	def __init__(self, max_bytes=64 << 20):
+		self.max_bytes = max_bytes
+		self.entries = collections.OrderedDict()
+		self.keys_by_subnet = collections.defaultdict(set)
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	@staticmethod
+	def entry_bytes(paths):
+		return sys.getsizeof(paths) + sum(sys.getsizeof(path) + 28 * len(path) for path in paths)
+
+	def get(self, subGraphs, subnet_id, u, v, k):
+		key = (subnet_id, u, v, k)
+		entry = self.entries.get(key)
+		if entry is not None:
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return entry[0]
+
+		self.misses += 1
+		paths = list(islice(nx.shortest_simple_paths(subGraphs[subnet_id], u, v), k))
+		size = self.entry_bytes(paths)
+		self.entries[key] = (paths, size)
+		self.keys_by_subnet[subnet_id].add(key)
+		self.nbytes += size
+		while self.nbytes > self.max_bytes and len(self.entries) > 1:
+			self._pop(next(iter(self.entries)))
+			self.evictions += 1
+		return paths
+
+	def _pop(self, key):
+		paths, size = self.entries.pop(key)
+		self.keys_by_subnet[key[0]].discard(key)
+		self.nbytes -= size
+
+	# the topology of subnet_id changed
+	def invalidate(self, subnet_id):
+		for key in list(self.keys_by_subnet.pop(subnet_id, ())):
+			self._pop(key)
+
+	def stats(self):
+		lookups = self.hits + self.misses
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'hit_ratio': self.hits / lookups if lookups else 0.0,
+			'evictions': self.evictions,
+			'entries': len(self.entries),
+			'nbytes': self.nbytes
+		}
+
+
+# path_cache: PathCache of the partial paths inside subnets (None: compute every segment)
+def get_k_shortest_paths(src, dst, extended_index_topo, subGraphs, k, capacity=None, path_cache=None):
 	iterations = 0
 	request_messages = 0
 
-	# 计算k最短索引路径
-	k_shortest_index_paths = yen_k_shortest_paths_for_multigraph(extended_index_topo, src, dst, k, weight="length")
+	# 计算k最短索引路径（capacity 不为 None 时为最宽最短索引路径）
+	k_shortest_index_paths = yen_k_shortest_paths_for_multigraph(extended_index_topo, src, dst, k, weight="length", capacity=capacity)
 
 	# 遍历k最短索引路径
 	temp_paths_1 = []
@@ -278,7 +632,10 @@ def get_k_shortest_paths(src, dst, extended_index_topo, subGraphs, k):
 			v = compressed_index_path[i + 1]
 
 
-			k_partial_paths = list(islice(nx.shortest_simple_paths(subGraphs[compressed_subnet_ids[i]], u, v), k))
+			if path_cache is not None:
+				k_partial_paths = path_cache.get(subGraphs, compressed_subnet_ids[i], u, v, k)
+			else:
+				k_partial_paths = list(islice(nx.shortest_simple_paths(subGraphs[compressed_subnet_ids[i]], u, v), k))
 
 			if not temp_paths_2:
 				temp_paths_2 = k_partial_paths
@@ -294,22 +651,18 @@ def get_k_shortest_paths(src, dst, extended_index_topo, subGraphs, k):
 	return temp_paths_1, request_messages
 
 
-def inter_subnet_routing(src, dst, extended_index_topo, subGraphs, payment_size, k, G):
+# flow_method: 'edmonds_karp' 或 'dinic'（见 flow_engine.max_flow）。
+# 增广路的平局按加边顺序打破，与原 networkx 实现（集合差的迭代顺序）不同，个别支付的路径和流量可能不同
+def inter_subnet_routing(src, dst, extended_index_topo, subGraphs, payment_size, k, G, capacity=None, flow_method='edmonds_karp', path_cache=None):
 
 	# 寻路
-	k_shortest_paths, request_messages = get_k_shortest_paths(src, dst, extended_index_topo, subGraphs, k)
+	k_shortest_paths, request_messages = get_k_shortest_paths(src, dst, extended_index_topo, subGraphs, k, capacity, path_cache)
 	
-	# 创建一个新图，只包含这些k条路径上的边
-	G_kpaths = nx.DiGraph()
-	for path in k_shortest_paths:
-		for i in range(len(path) - 1):
-			u, v = path[i], path[i + 1]
-			if not G_kpaths.has_edge(u, v):
-				G_kpaths.add_edge(u, v, balance=G[u][v]["balance"])
+	# 只包含这些k条路径上的边的残量网络（数组），BFS 按加边顺序访问邻居
+	network = flow_engine.FlowNetwork.from_paths(G, k_shortest_paths)
 
-	
 	# 使用最大流算法来获取结果
-	path_set, cap_set, probing_messages = max_flow_of_kpaths(G_kpaths, src, dst)
+	path_set, cap_set, probing_messages = flow_engine.max_flow(network, src, dst, flow_method)
 
 	if sum(cap_set) < payment_size:
 		path_set = []
@@ -319,9 +672,17 @@ def inter_subnet_routing(src, dst, extended_index_topo, subGraphs, payment_size,
 	return path_set, cap_set, probing_messages, request_messages
 
 
-def extend_index_topo(index_topo, src, dst, node_subnet_map, subGraphs):
+# distance_tables: index_topo_build.build_distance_tables() 的结果，src/dst 到边界节点的距离直接查表，
+# 为 None 时对每个边界节点做一次 BFS；两种方式加边的顺序相同
+# index_topo: IndexOverlay 时返回其上的新视图（不复制索引拓扑），MultiDiGraph 时返回扩展后的副本
+def extend_index_topo(index_topo, src, dst, node_subnet_map, subGraphs, distance_tables=None):
 	# 创建扩展索引图
-	extended_index_topo = index_topo.copy()
+	if isinstance(index_topo, IndexOverlay):
+		extended_index_topo = index_topo.view()
+		index_nodes = index_topo.base
+	else:
+		extended_index_topo = index_topo.copy()
+		index_nodes = index_topo
 
 	subnets_src = node_subnet_map.get(src)
 	subnets_dst = node_subnet_map.get(dst)
@@ -329,26 +690,39 @@ def extend_index_topo(index_topo, src, dst, node_subnet_map, subGraphs):
 	# 添加 src -> boundary nodes 的边
 	if len(subnets_src)==1:
 		subnet_id = next(iter(subnets_src))
-		boundary_nodes = set(index_topo.nodes()) & set(subGraphs[subnet_id].nodes())
+		boundary_nodes = set(index_nodes.nodes()) & set(subGraphs[subnet_id].nodes())
 		#print(f"src_subnet_id: {subnet_id}, number of boundary_nodes: {len(boundary_nodes)}.")
-		for u in boundary_nodes:
-			try:
-				path = nx.shortest_path(subGraphs[subnet_id], src, u)
-				extended_index_topo.add_edge(src, u, length=len(path)-1, subnet = subnet_id)
-			except nx.NetworkXNoPath:
-				continue
+		if distance_tables is not None:
+			# 查表代替 BFS，按同样的 boundary_nodes 顺序加边
+			lengths = distance_tables[subnet_id].distances(src)
+			for u in boundary_nodes:
+				if u in lengths:
+					extended_index_topo.add_edge(src, u, length=lengths[u], subnet = subnet_id)
+		else:
+			for u in boundary_nodes:
+				try:
+					path = nx.shortest_path(subGraphs[subnet_id], src, u)
+					extended_index_topo.add_edge(src, u, length=len(path)-1, subnet = subnet_id)
+				except nx.NetworkXNoPath:
+					continue
 
 	# 添加 boundary nodes -> dst 的边
 	if len(subnets_dst)==1:
 		subnet_id = next(iter(subnets_dst))
-		boundary_nodes = set(index_topo.nodes()) & set(subGraphs[subnet_id].nodes())
+		boundary_nodes = set(index_nodes.nodes()) & set(subGraphs[subnet_id].nodes())
 		#print(f"dst_subnet_id: {subnet_id}, number of boundary_nodes: {len(boundary_nodes)}.")
-		for u in boundary_nodes:
-			try:
-				path = nx.shortest_path(subGraphs[subnet_id], u, dst)
-				extended_index_topo.add_edge(u, dst, length=len(path)-1, subnet = subnet_id)
-			except nx.NetworkXNoPath:
-				continue
+		if distance_tables is not None:
+			lengths = distance_tables[subnet_id].distances(dst)
+			for u in boundary_nodes:
+				if u in lengths:
+					extended_index_topo.add_edge(u, dst, length=lengths[u], subnet = subnet_id)
+		else:
+			for u in boundary_nodes:
+				try:
+					path = nx.shortest_path(subGraphs[subnet_id], u, dst)
+					extended_index_topo.add_edge(u, dst, length=len(path)-1, subnet = subnet_id)
+				except nx.NetworkXNoPath:
+					continue
 
 	return extended_index_topo
 
@@ -395,7 +769,12 @@ def merge_subgraphs(subGraphs, inter_set):
 	return merged_graph
 
 
-def routing(subGraphs, index_topo, node_subnet_map, cur_payments, G):
+# index_path_mode: 'shortest' (hop-count index paths) or 'widest' (widest-shortest index paths
+# from the bottleneck capacity of index edges, refreshed lazily after commits)
+# distance_tables: per-subnet boundary distance tables for extend_index_topo (None: BFS per boundary node)
+# flow_method: max flow over the k paths, 'edmonds_karp' or 'dinic'
+# path_cache: PathCache of intra-subnet partial paths, may be shared by runs on the same subnets (None: a new cache per call)
+def routing(subGraphs, index_topo, node_subnet_map, cur_payments, G, index_path_mode='shortest', distance_tables=None, flow_method='edmonds_karp', path_cache=None):
 	
 	# 跨子网路由路径数
 	k = 4
@@ -417,20 +796,30 @@ def routing(subGraphs, index_topo, node_subnet_map, cur_payments, G):
 	total_commit_messages = 0
 	total_request_messages = 0
 
-	# 统计子网内/子网间支付数量
-	subpayment_count = 0
-	crosspayment_count = 0
-	for payment in cur_payments:
-		partitions_src = node_subnet_map.get(payment[0])
-		partitions_dst = node_subnet_map.get(payment[1])
-		if partitions_src.intersection(partitions_dst):
-			subpayment_count += 1
-		else: 
-			crosspayment_count += 1
+	# 统计子网内/子网间支付数量（位掩码，一次分类所有支付）
+	node_subnet_map = subnet_map.as_subnet_map(node_subnet_map)
+	intra_flags = subnet_map.classify_payments(node_subnet_map, cur_payments)
+	subpayment_count = int(intra_flags.sum())
+	crosspayment_count = len(cur_payments) - subpayment_count
 	print('Intra-subnet payment count:', subpayment_count, 'Inter-subnet payment count:', crosspayment_count)
 
+	# 索引拓扑只读，每个跨子网支付在其视图上扩展
+	index_view = IndexOverlay(index_topo)
+
+	if path_cache is None:
+		path_cache = PathCache()
+
+	if index_path_mode == 'widest':
+		index_capacity = IndexCapacity(subGraphs, G, node_subnet_map)
+		capacity = index_capacity.edge_capacity
+	elif index_path_mode == 'shortest':
+		index_capacity = None
+		capacity = None
+	else:
+		raise ValueError(f"Unknown index path mode {index_path_mode}")
+
 	# 迭代支付
-	for payment in cur_payments:
+	for payment, is_intra in zip(cur_payments, intra_flags.tolist()):
 
 		src = payment[0]
 		dst = payment[1]
@@ -440,9 +829,7 @@ def routing(subGraphs, index_topo, node_subnet_map, cur_payments, G):
 		path_set = []
 
 		# 判断是否为子网内路由
-		partitions_src = node_subnet_map.get(src)
-		partitions_dst = node_subnet_map.get(dst)
-		inter_set = partitions_src.intersection(partitions_dst)
+		inter_set = node_subnet_map.common(src, dst) if is_intra else set()
 		
 		#print(f"\ncurrent payment: {payment}; partitions_src: {partitions_src}; partitions_dst: {partitions_dst}.")
 
@@ -457,10 +844,9 @@ def routing(subGraphs, index_topo, node_subnet_map, cur_payments, G):
 		# 若子网内路由成功
 		if path:
 			# 进行单路径支付
-			for i in range(len(path) - 1):
-				u, v = path[i], path[i + 1]
-				G[u][v]["balance"] -= payment_size
-				G[v][u]["balance"] += payment_size
+			channel_graph.update_path(G, path, payment_size)
+			if index_capacity is not None:
+				index_capacity.touch(path)
 
 			# 统计信息
 			subnet_delivered += 1
@@ -468,8 +854,8 @@ def routing(subGraphs, index_topo, node_subnet_map, cur_payments, G):
 			total_commit_messages += len(path) - 1
 
 		else: # 否则，进行子网间路由
-			extended_index_topo = extend_index_topo(index_topo, src, dst, node_subnet_map, subGraphs) # 扩展索引拓扑
-			path_set, cap_set, probing_messages, request_messages = inter_subnet_routing(src, dst, extended_index_topo, subGraphs, payment_size, k, G) # 路由
+			extended_index_topo = extend_index_topo(index_view, src, dst, node_subnet_map, subGraphs, distance_tables) # 扩展索引拓扑
+			path_set, cap_set, probing_messages, request_messages = inter_subnet_routing(src, dst, extended_index_topo, subGraphs, payment_size, k, G, capacity, flow_method, path_cache) # 路由
 			total_probing_messages += probing_messages
 			total_request_messages += request_messages
 
@@ -483,10 +869,9 @@ def routing(subGraphs, index_topo, node_subnet_map, cur_payments, G):
 				remaining_amount -= flow
 
 				# 更新每条边的容量
-				for i in range(len(path) - 1):
-					u, v = path[i], path[i + 1]
-					G[u][v]["balance"] -= flow
-					G[v][u]["balance"] += flow
+				channel_graph.update_path(G, path, flow)
+				if index_capacity is not None:
+					index_capacity.touch(path)
 
 				total_commit_messages += len(path) - 1
 
@@ -498,5 +883,8 @@ def routing(subGraphs, index_topo, node_subnet_map, cur_payments, G):
 			non_subnet_delivered += 1
 			non_subnet_throughput += payment_size
 
+	stats = path_cache.stats()
+	print(f"Path cache: {stats['hits']} hits, {stats['misses']} misses (hit ratio {stats['hit_ratio']:.2f}), {stats['evictions']} evictions, {stats['entries']} entries, {stats['nbytes'] / 2**20:.1f} MB")
+
 	return (subnet_throughput + non_subnet_throughput), (subnet_delivered + non_subnet_delivered), total_probing_messages, total_commit_messages, subnet_throughput, subnet_delivered
 
@@ -1,5 +1,5 @@
-import networkx as nx
 import sys
+import channel_graph
 
 
 def routing(G, cur_payments):
@@ -14,27 +14,21 @@ def routing(G, cur_payments):
 		src = payment[0]
 		dst = payment[1]
 		payment_size = payment[2]
-		path = nx.shortest_path(G, src, dst)
+		path = channel_graph.shortest_path(G, src, dst)
 
 		# probe
-		path_cap = sys.maxsize
-		for i in range(len(path) - 1):
-			path_cap = min(path_cap, G[path[i]][path[i + 1]]["balance"])
+		path_cap = min(sys.maxsize, channel_graph.path_capacity(G, path))
 
 		sent = payment_size if (path_cap > payment_size) else path_cap
 
 		# commit
-		for i in range(len(path) - 1):
-			G[path[i]][path[i + 1]]["balance"] -= sent
-			G[path[i + 1]][path[i]]["balance"] += sent
+		channel_graph.update_path(G, path, sent)
 
 		total_commit_messages += len(path) - 1
 
 		# fail, roll back
 		if sent < payment[2]:
-			for i in range(len(path) - 1):
-				G[path[i]][path[i + 1]]["balance"] += sent
-				G[path[i + 1]][path[i]]["balance"] -= sent
+			channel_graph.update_path(G, path, -sent)
 		else:  # success, record
 			throughput += sent
 			num_delivered += 1
@@ -1,6 +1,7 @@
 import networkx as nx
 import sys
 import math
+import channel_graph
 
 def rank(cap, maxSet, secMaxSet):
 	largest = -sys.maxsize - 1
@@ -60,7 +61,7 @@ def k_edge_disjoint_shortest_paths(G, src, dst, k):
 	for _ in range(k):
 		try:
 			# 找一条最短路径
-			path = nx.shortest_path(G, source=src, target=dst)
+			path = channel_graph.shortest_path(G, src, dst)
 			paths.append(path)
 
 			# 删除路径中的所有边
@@ -99,8 +100,7 @@ def routing(G, payments, k):
 		path_caps = [sys.maxsize] * len(path_set)
 		index_p = 0
 		for path in path_set:
-			for i in range(len(path) - 1):
-				path_caps[index_p] = min(path_caps[index_p], G[path[i]][path[i + 1]]["balance"])
+			path_caps[index_p] = min(path_caps[index_p], channel_graph.path_capacity(G, path))
 			index_p += 1
 
 		# 注水式分配金额
@@ -110,9 +110,7 @@ def routing(G, payments, k):
 		index_p = 0
 		for path in path_set:
 			partial_payment_size = res[index_p]
-			for i in range(len(path) - 1):
-				G[path[i]][path[i + 1]]["balance"] -= partial_payment_size
-				G[path[i + 1]][path[i]]["balance"] += partial_payment_size
+			channel_graph.update_path(G, path, partial_payment_size)
 
 			payment_units = math.ceil(partial_payment_size / 10000)  # 1美元 ≈ 10000聪 in 2018
 			#payment_units = math.ceil(partial_payment_size/1668) # 1美元 ≈ 10000聪 in 2024.5
@@ -123,10 +121,7 @@ def routing(G, payments, k):
 		# 若失败则回滚
 		if sum(res) < payment[2] - 1e-6:
 			for i in range(len(path_set)):
-				p = path_set[i]
-				for j in range(len(p) - 1):
-					G[p[j]][p[j + 1]]["balance"] += res[i]
-					G[p[j + 1]][p[j]]["balance"] -= res[i]
+				channel_graph.update_path(G, path_set[i], -res[i])
 		else:
 			num_delivered += 1
 			throughput += payment[2]
@@ -5,6 +5,7 @@ from random import shuffle
 from itertools import islice
 import sys
 import time
+import channel_graph
 
 
 def rank(cap, maxSet, secMaxSet):
@@ -74,7 +75,7 @@ def routing(G, cur_payments, k):
 		payment_size = payment[2]
 
 		# 选择k不相交路径
-		path_set = list(nx.edge_disjoint_paths(G, src, dst))  # TODO: use k edge-disjoint widest paths
+		path_set = list(nx.edge_disjoint_paths(channel_graph.topology(G), src, dst))  # TODO: use k edge-disjoint widest paths
 		if len(path_set) > k:
 			path_set = path_set[0:k]
 
@@ -83,8 +84,7 @@ def routing(G, cur_payments, k):
 		index_p = 0
 		for path in path_set:
 			total_probing_messages += len(path) - 1
-			for i in range(len(path) - 1):
-				path_caps[index_p] = min(path_caps[index_p], G[path[i]][path[i + 1]]["balance"])
+			path_caps[index_p] = min(path_caps[index_p], channel_graph.path_capacity(G, path))
 			index_p += 1
 
 		# 注水式分配金额
@@ -93,19 +93,14 @@ def routing(G, cur_payments, k):
 		# commit
 		index_p = 0
 		for path in path_set:
-			for i in range(len(path) - 1):
-				G[path[i]][path[i + 1]]["balance"] -= res[index_p]
-				G[path[i + 1]][path[i]]["balance"] += res[index_p]
+			channel_graph.update_path(G, path, res[index_p])
 			total_commit_messages += len(path) - 1
 			index_p += 1
 
 		# 若失败则回滚，否则统计
 		if sum(res) < payment[2] - 1e-6:
 			for i in range(len(path_set)):
-				p = path_set[i]
-				for j in range(len(p) - 1):
-					G[p[j]][p[j + 1]]["balance"] += res[i]
-					G[p[j + 1]][p[j]]["balance"] -= res[i]
+				channel_graph.update_path(G, path_set[i], -res[i])
 		else:
 			num_delivered += 1
 			throughput += payment[2]
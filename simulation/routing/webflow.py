@@ -5,6 +5,7 @@ import sys
 from scipy.spatial import Delaunay
 from sklearn.manifold import MDS
 import random
+import channel_graph
 
 
 def build_spanning_tree(G, root):
@@ -132,7 +133,7 @@ def build_mdt_structure(G, DT_neighbors):
 
 		for dt_neigh in DT_neighbors[node]:
 			if dt_neigh not in real_neighbors:
-				path = nx.shortest_path(G, source=node, target=dt_neigh)
+				path = channel_graph.shortest_path(G, node, dt_neigh)
 				MDT[node]['virtual_links'][dt_neigh] = path
 
 	return MDT
@@ -226,9 +227,7 @@ def routing(G, payments, d):
 		
 		# success
 		if path:
-			for i in range(len(path) - 1):
-				G[path[i]][path[i + 1]]["balance"] -= payment_size
-				G[path[i + 1]][path[i]]["balance"] += payment_size
+			channel_graph.update_path(G, path, payment_size)
 			num_delivered += 1
 			throughput += payment_size
 			total_commit_messages += len(path)-1
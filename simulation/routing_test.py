@@ -7,6 +7,10 @@ import csv
 
 sys.path.append('./partition')
 import data_load
+import trans_store
+import channel_graph
+import subnet_map
+import partition_artifact
 import network_partition
 import index_topo_build
 
@@ -20,47 +24,35 @@ import webflow
 import segflow
 
 
-def compute_payment_frequency(trans):
-	payment_frequency = {}
-
-	for payment in trans:
-		src = payment[0]
-		dst = payment[1]
-
-		# 添加到支付频率列表中
-		if src not in payment_frequency:
-			payment_frequency[src] = {}
-		if dst not in payment_frequency:
-			payment_frequency[dst] = {}
-		if dst not in payment_frequency[src]:
-			payment_frequency[src][dst] = 0
-		if src not in payment_frequency[dst]:
-			payment_frequency[dst][src] = 0
-
-		payment_frequency[src][dst] += 1
-		payment_frequency[dst][src] += 1
-
-	return payment_frequency
+# matrix=True: scipy CSR matrix over the node ids (scored by sparse row slicing in the partitioner);
+# sketch_k: bounded-memory top-k counterparties per node (trans_store.payment_frequency_sketch)
+def compute_payment_frequency(trans, matrix=False, sketch_k=None):
+	return trans_store.compute_payment_frequency(trans, matrix, sketch_k)
 
 
 def get_threshold(trans, percentage):
+	if isinstance(trans, trans_store.TransColumns):
+		return trans_store.amount_percentile(trans.amount, percentage)
+
 	sorted_trans = sorted(trans, key=lambda x: x[2])
 	threshold = sorted_trans[int(1.0*percentage/100*(len(sorted_trans)-1))]
 	return threshold[2]
 
 
-def get_topology_and_transactions(trace):
+def get_topology_and_transactions(trace, graph_backend='networkx'):
 	G_ori = nx.DiGraph()
 	trans = []
 	
 	print(f"\n/**Load [{trace}] topology and transactions**/")
 
+	# the array mode builds the ChannelGraph and the transaction array without a networkx intermediate
+	mode = 'array' if graph_backend == 'array' else 'networkx'
 	if trace == 'ripple':
-		G_ori, trans = data_load.ripple_setup()
+		G_ori, trans = data_load.ripple_setup(mode=mode)
 	elif trace == 'lightning':
-		G_ori, trans = data_load.lightning_setup()
+		G_ori, trans = data_load.lightning_setup(mode=mode)
 	elif trace == 'scale_free':
-		G_ori, trans = data_load.scale_free_setup()
+		G_ori, trans = data_load.scale_free_setup(mode)
 
 	return (G_ori, trans)
 
@@ -68,21 +60,32 @@ def get_topology_and_transactions(trace):
 # generates payments from trans
 def generate_payments(seed, nflows, trans, G):
 	random.seed(seed)
-	temp_trans = trans.copy()  # 创建 trans 的副本
+	# 未被选中的交易下标（不复制 trans）
+	remaining = trans_store.RemainingIndex(len(trans))
+	# 重复的交易：每组下一个未被移除的下标
+	run, positions = trans_store.duplicate_runs(trans)
+	next_in_run = [0] * len(positions)
 	payments = []
 
 	while len(payments) < nflows:
 		# 检查是否还有交易可选
-		if not temp_trans:
+		if not len(remaining):
 			print(f"Insufficient transactions to generate {nflows} payments.")
 			break
 
-		# 随机选择交易并从 temp_trans 中移除
-		tx = random.choice(temp_trans)
-		temp_trans.remove(tx)
+		# 随机选择交易并移除，与 random.choice + list.remove 的抽样序列相同：
+		# list.remove 删除第一个相等的交易，即重复交易中下标最小的剩余一个
+		pos = remaining.find(random.choice(range(len(remaining))))
+		tx = trans[pos]
+		r = int(run[pos])
+		if r >= 0:
+			remaining.remove(positions[r][next_in_run[r]])
+			next_in_run[r] += 1
+		else:
+			remaining.remove(pos)
 
 		# 检查路径是否存在
-		if not nx.has_path(G, tx[0], tx[1]):
+		if not channel_graph.has_path(G, tx[0], tx[1]):
 			continue
 
 		# 添加到支付列表中
@@ -103,6 +106,9 @@ def convert_to_directed(undi_graph):
 
 # scale capacity
 def scale_topo_cap(G_ori, scale_factor):
+	if isinstance(G_ori, channel_graph.ChannelGraph):
+		return G_ori.scaled(scale_factor)
+
 	G = nx.DiGraph()
 
 	for e in G_ori.edges():
@@ -120,10 +126,18 @@ def scale_topo_cap_for_subnets(subGraphs_ori, scale_factor):
 	return subGraphs
 
 
-def run_general(scheme, trace, nflows, nruns, scale_list, config):
+# partition_file: binary partition artifact; an artifact built from the same topology and config
+# is reused instead of re-partitioning (reuse_partition=False always re-partitions)
+# index_path_mode: segflow index paths, 'shortest' or 'widest' (widest-shortest by index-edge capacity)
+# partition_seed: seeds the partitioning tie-breaks; stored in the artifact, which is only reused for the same seed
+# refine: None, or keyword arguments of network_partition.refine_partitions (e.g. {'time_budget': 60});
+# stored with the config in the artifact
+def run_general(scheme, trace, nflows, nruns, scale_list, config, graph_backend='networkx', partition_file=None, reuse_partition=True, index_path_mode='shortest', partition_seed=0, refine=None):
 
 	# initialize topology and transactions from the dataset
-	G_ori, trans = get_topology_and_transactions(trace)
+	G_ori, trans = get_topology_and_transactions(trace, graph_backend)
+	# 映射后的交易以内存映射的列存储，各进程共享
+	trans = trans_store.share(trans, 'partition_results/mapped_trans')
 	# 导出映射后的交易列表
 	with open('partition_results/mapped_trans.csv', mode='w', newline='') as file:
 		writer = csv.writer(file)
@@ -133,16 +147,34 @@ def run_general(scheme, trace, nflows, nruns, scale_list, config):
 
 
 	if scheme == 'segflow':
-		payment_frequency = compute_payment_frequency(trans)
-		# 网络划分（无向图）
-		print(f"\n/**Start network partitioning**/")
-		subGraphs_undi, node_subnet_map, intra_payment_ratio, num_boundary_nodes  = network_partition.network_partitioning(G_ori, trans, payment_frequency, config)
-
-		print(aaa)
+		if partition_file is None:
+			partition_file = f'partition_results/partition-{trace}.npz'
+		# 局部搜索参数作为划分配置的一部分，参数不同时不复用
+		partition_config = config if refine is None else dict(config, refine=refine)
+		artifact = partition_artifact.load_matching(partition_file, G_ori, partition_config, partition_seed) if reuse_partition else None
+
+		if artifact is not None:
+			# 复用已保存的划分结果
+			print(f"\n/**Reuse network partition {partition_file}**/")
+			subGraphs_undi = artifact.subGraphs
+			node_subnet_map = artifact.node_subnet_map
+		else:
+			payment_frequency = compute_payment_frequency(trans, matrix=True)
+			# 网络划分（无向图）
+			print(f"\n/**Start network partitioning**/")
+			subGraphs_undi, node_subnet_map, intra_payment_ratio, num_boundary_nodes  = network_partition.network_partitioning(G_ori, trans, payment_frequency, config, seed=partition_seed, refine=refine)
+			stats = {'intra_payment_ratio': intra_payment_ratio, 'num_boundary_nodes': num_boundary_nodes}
+			partition_artifact.save_partition_artifact(partition_file, G_ori, subGraphs_undi, node_subnet_map, partition_config, seed=partition_seed, stats=stats)
 
 		# 索引拓扑构建（有向图）
 		print('\n/**Construct index topology**/')
 		index_topo_di = index_topo_build.build_index_topo(subGraphs_undi, node_subnet_map)
+		# 边界节点距离表（extend_index_topo 查表）
+		distance_tables = index_topo_build.build_distance_tables(subGraphs_undi, node_subnet_map)
+		# 子网内 k 最短路径缓存（只依赖子网拓扑，各次运行共用）
+		path_cache = segflow.PathCache()
+		# 节点->子网映射改为位掩码数组
+		node_subnet_map = subnet_map.as_subnet_map(node_subnet_map, len(subGraphs_undi))
 
 		# 无向图——>有向图
 		subGraphs_di = [convert_to_directed(subgraph) for subgraph in subGraphs_undi]
@@ -153,6 +185,11 @@ def run_general(scheme, trace, nflows, nruns, scale_list, config):
 		threshold = get_threshold(trans, 90)
 		print(threshold)
 
+	# array-backed channel balances for routing ('array'), or nx.DiGraph ('networkx')
+	# 邻居顺序与 nx.DiGraph 相同，确定性的方案两种后端结果一致（flash 的 array_flow 除外）
+	if graph_backend == 'array' and not isinstance(G_ori, channel_graph.ChannelGraph):
+		G_ori = channel_graph.ChannelGraph.from_networkx(G_ori)
+
 	#结果记录（不同的扩展因子）
 	res_volume = [] #成功金额
 	res_ratio = [] #成功率
@@ -208,7 +245,7 @@ def run_general(scheme, trace, nflows, nruns, scale_list, config):
 				volume, num_delivered, total_probing_messages, total_commit_messages = webflow.routing(G.copy(), payments, dimension)
 			elif scheme == 'segflow':
 				subGraphs_copy = [copy.deepcopy(subgraph) for subgraph in subGraphs]
-				volume, num_delivered, total_probing_messages, total_commit_messages, subnet_volume, subnet_delivered = segflow.routing(subGraphs_copy, index_topo_di.copy(), node_subnet_map, payments, G.copy())
+				volume, num_delivered, total_probing_messages, total_commit_messages, subnet_volume, subnet_delivered = segflow.routing(subGraphs_copy, index_topo_di, node_subnet_map, payments, G.copy(), index_path_mode, distance_tables, path_cache=path_cache)
 
 			print(f"{volume}, {num_delivered}, {total_probing_messages}, {total_commit_messages}")
 
@@ -250,6 +287,8 @@ def main():
 	scale_list = [1] # [1, 10, 20, 30, 40, 50, 60]
 	nflows_list = [10000] # [1000, 2000, 3000, 4000, 5000, 6000, 7000, 8000, 9000, 10000]
 	nruns = 5
+	graph_backend = 'networkx' # networkx/array
+	refine = None # segflow 划分后的局部搜索参数，如 {'time_budget': 60}
 
 	# 划分参数
 	config = {
@@ -260,7 +299,7 @@ def main():
 
 	for nflows in nflows_list:
 		for scheme in ALL_SCHEMES:
-			run_general(scheme, trace, nflows, nruns, scale_list, config)
+			run_general(scheme, trace, nflows, nruns, scale_list, config, graph_backend, refine=refine)
 
 
 if __name__ == "__main__":
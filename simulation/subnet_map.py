@@ -0,0 +1,137 @@
+import numpy as np
+import trans_store
+
+
+WORD_BITS = 64
+
+
+class SubnetMap:
+	"""Node -> subnet membership as a uint64 bitmask per node.
+
+	masks[node, w] holds bit (i % 64) of subnet i for w = i // 64, so up to
+	64 subnets take one word (8 bytes) per node and larger n use
+	ceil(n / 64) words. Node ids are the 0..N-1 ids of the relabelled
+	topology. get(node) returns a set like the node_partition_map dict, so
+	the map can be passed where the dict was used; classify() labels a whole
+	payment array as intra-subnet (sender and receiver share a subnet) in
+	one operation.
+	"""
+
+	def __init__(self, masks, num_subnets):
+		self.masks = masks
+		self.num_subnets = num_subnets
+		self.num_words = masks.shape[1]
+
+	@classmethod
+	def from_node_partition_map(cls, node_partition_map, num_subnets=None, num_nodes=None):
+		if num_subnets is None:
+			num_subnets = max((max(ids) for ids in node_partition_map.values() if ids), default=-1) + 1
+		if num_nodes is None:
+			num_nodes = max(node_partition_map, default=-1) + 1
+
+		nodes = []
+		subnets = []
+		for node, partition_ids in node_partition_map.items():
+			for i in partition_ids:
+				nodes.append(node)
+				subnets.append(i)
+		nodes = np.asarray(nodes, dtype=np.int64)
+		subnets = np.asarray(subnets, dtype=np.int64)
+
+		num_words = max((num_subnets + WORD_BITS - 1) // WORD_BITS, 1)
+		masks = np.zeros((num_nodes, num_words), dtype=np.uint64)
+		bits = np.left_shift(np.uint64(1), (subnets % WORD_BITS).astype(np.uint64))
+		np.bitwise_or.at(masks, (nodes, subnets // WORD_BITS), bits)
+		return cls(masks, num_subnets)
+
+	def __len__(self):
+		return int(np.count_nonzero(self.masks.any(axis=1)))
+
+	@property
+	def nbytes(self):
+		return self.masks.nbytes
+
+	def mask(self, node):
+		if node < 0 or node >= len(self.masks):
+			return 0
+		words = self.masks[node].tolist()
+		mask = words[0]
+		for w in range(1, self.num_words):
+			mask |= words[w] << (WORD_BITS * w)
+		return mask
+
+	def get(self, node, default=None):
+		mask = self.mask(node)
+		if not mask:
+			return default
+		return mask_to_set(mask)
+
+	def __getitem__(self, node):
+		partition_ids = self.get(node)
+		if partition_ids is None:
+			raise KeyError(node)
+		return partition_ids
+
+	def __contains__(self, node):
+		return self.mask(node) != 0
+
+	def keys(self):
+		return np.flatnonzero(self.masks.any(axis=1)).tolist()
+
+	def items(self):
+		for node in self.keys():
+			yield node, self[node]
+
+	# subnets shared by src and dst
+	def common(self, src, dst):
+		return mask_to_set(self.mask(src) & self.mask(dst))
+
+	# number of subnets of every node
+	def counts(self):
+		return popcount(self.masks).sum(axis=1)
+
+	def boundary_nodes(self):
+		return np.flatnonzero(self.counts() > 1)
+
+	# boolean array: payment i is intra-subnet; nodes outside the map are in no subnet
+	def classify(self, src, dst):
+		src = np.asarray(src, dtype=np.int64)
+		dst = np.asarray(dst, dtype=np.int64)
+		num_nodes = len(self.masks)
+		valid = (src >= 0) & (src < num_nodes) & (dst >= 0) & (dst < num_nodes)
+		intra = np.zeros(len(src), dtype=bool)
+		intra[valid] = (self.masks[src[valid]] & self.masks[dst[valid]]).any(axis=1)
+		return intra
+
+
+def mask_to_set(mask):
+	partition_ids = set()
+	i = 0
+	while mask:
+		if mask & 1:
+			partition_ids.add(i)
+		mask >>= 1
+		i += 1
+	return partition_ids
+
+
+# per-word bit counts (SWAR, for NumPy versions without np.bitwise_count)
+def popcount(words):
+	if hasattr(np, 'bitwise_count'):
+		return np.bitwise_count(words).astype(np.int64)
+	words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+	words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+	words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+	return ((words * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+
+def as_subnet_map(node_subnet_map, num_subnets=None):
+	if isinstance(node_subnet_map, SubnetMap):
+		return node_subnet_map
+	return SubnetMap.from_node_partition_map(node_subnet_map, num_subnets)
+
+
+# intra-subnet flag of every payment
+def classify_payments(node_subnet_map, payments):
+	src, dst = trans_store.trace_columns(payments)
+	return as_subnet_map(node_subnet_map).classify(src, dst)
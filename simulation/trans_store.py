@@ -0,0 +1,245 @@
+import numpy as np
+from scipy import sparse
+import array
+import os
+
+
+COLUMNS = ('src', 'dst', 'amount')
+
+
+class TransColumns:
+	"""Mapped transaction trace as three columns (src, dst, amount).
+
+	Columns loaded with load_columns() are read-only np.memmap views of the
+	.npy files, so every process that opens the same directory shares the
+	physical pages. Pickling only sends the directory, and the columns are
+	re-mapped on the other side. Iterating and indexing yield (src, dst,
+	amount) tuples like the list returned by the setup functions.
+	"""
+
+	def __init__(self, src, dst, amount, directory=None):
+		self.src = src
+		self.dst = dst
+		self.amount = amount
+		self.directory = directory
+
+	def __len__(self):
+		return len(self.src)
+
+	def __getitem__(self, i):
+		return (int(self.src[i]), int(self.dst[i]), float(self.amount[i]))
+
+	def __iter__(self, chunksize=65536):
+		for lo in range(0, len(self.src), chunksize):
+			hi = lo + chunksize
+			yield from zip(self.src[lo:hi].tolist(), self.dst[lo:hi].tolist(), self.amount[lo:hi].tolist())
+
+	def __getstate__(self):
+		if self.directory is not None:
+			return {'directory': self.directory}
+		return {'src': self.src, 'dst': self.dst, 'amount': self.amount, 'directory': None}
+
+	def __setstate__(self, state):
+		if state['directory'] is not None:
+			state = load_columns(state['directory']).__dict__
+		self.__dict__.update(state)
+
+
+# write the trace (list of tuples, TRANS_DTYPE array or TransColumns) as src.npy/dst.npy/amount.npy
+def save_columns(trans, directory):
+	if isinstance(trans, TransColumns):
+		columns = {'src': trans.src, 'dst': trans.dst, 'amount': trans.amount}
+	elif isinstance(trans, np.ndarray) and trans.dtype.names is not None:
+		columns = {name: trans[name] for name in COLUMNS}
+	else:
+		columns = {
+			'src': np.fromiter((tx[0] for tx in trans), dtype=np.int32, count=len(trans)),
+			'dst': np.fromiter((tx[1] for tx in trans), dtype=np.int32, count=len(trans)),
+			'amount': np.fromiter((tx[2] for tx in trans), dtype=np.float64, count=len(trans))
+		}
+
+	os.makedirs(directory, exist_ok=True)
+	for name in COLUMNS:
+		file_name = os.path.join(directory, f"{name}.npy")
+		tmp_name = os.path.join(directory, f"{name}.tmp.npy")
+		np.save(tmp_name, np.ascontiguousarray(columns[name]))
+		os.replace(tmp_name, file_name)
+
+
+def load_columns(directory, mmap_mode='r'):
+	columns = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in COLUMNS]
+	return TransColumns(*columns, directory=os.path.abspath(directory))
+
+
+# persist the trace once and return the memory-mapped columns
+def share(trans, directory):
+	save_columns(trans, directory)
+	return load_columns(directory)
+
+
+# (src, dst) columns of a trace: list of tuples, TRANS_DTYPE array or TransColumns
+def trace_columns(trans):
+	if isinstance(trans, TransColumns):
+		return trans.src, trans.dst
+	if isinstance(trans, np.ndarray) and trans.dtype.names is not None:
+		return trans['src'], trans['dst']
+	src = np.fromiter((tx[0] for tx in trans), dtype=np.int64, count=len(trans))
+	dst = np.fromiter((tx[1] for tx in trans), dtype=np.int64, count=len(trans))
+	return src, dst
+
+
+# repeated (src, dst, amount) tuples of a trace: run[i] is -1 if trans[i] is unique, else the id
+# of its run in positions, the list of positions holding that tuple in ascending order
+def duplicate_runs(trans):
+	src, dst = trace_columns(trans)
+	if isinstance(trans, TransColumns):
+		amount = trans.amount
+	elif isinstance(trans, np.ndarray) and trans.dtype.names is not None:
+		amount = trans['amount']
+	else:
+		amount = np.fromiter((tx[2] for tx in trans), dtype=np.float64, count=len(trans))
+
+	run = np.full(len(src), -1, dtype=np.int64)
+	if len(src) < 2:
+		return run, []
+
+	# lexsort 稳定，相同元组的下标保持升序
+	order = np.lexsort((amount, dst, src))
+	src, dst, amount = np.asarray(src)[order], np.asarray(dst)[order], np.asarray(amount)[order]
+	new_run = np.ones(len(order), dtype=bool)
+	new_run[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1]) | (amount[1:] != amount[:-1])
+	run_id = np.cumsum(new_run) - 1
+	repeated = np.bincount(run_id)[run_id] > 1
+
+	order = order[repeated]
+	run_id = run_id[repeated]
+	starts = np.flatnonzero(np.diff(run_id, prepend=-1))
+	run[order] = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(order))))
+	positions = [chunk.tolist() for chunk in np.split(order, starts[1:])] if len(order) else []
+	return run, positions
+
+
+# payment frequency of a trace; matrix=True gives the CSR matrix instead of the dict-of-dicts;
+# sketch_k: keep only the top sketch_k counterparties per node (payment_frequency_sketch, a CSR matrix)
+def compute_payment_frequency(trans, matrix=False, sketch_k=None):
+	src, dst = trace_columns(trans)
+	if sketch_k is not None:
+		return payment_frequency_sketch(src, dst, sketch_k)
+	if matrix:
+		return payment_frequency_matrix(src, dst)
+	return payment_frequency(src, dst)
+
+
+# payment frequency dict-of-dicts from the columns: every payment counts once for
+# src->dst and once for dst->src, as compute_payment_frequency does
+def payment_frequency(src, dst):
+	src = np.asarray(src, dtype=np.int64)
+	dst = np.asarray(dst, dtype=np.int64)
+	if len(src) == 0:
+		return {}
+
+	num_nodes = int(max(src.max(), dst.max())) + 1
+	keys = np.concatenate((src * num_nodes + dst, dst * num_nodes + src))
+	keys, counts = np.unique(keys, return_counts=True)
+
+	freq = {}
+	for key, count in zip(keys.tolist(), counts.tolist()):
+		u, v = divmod(key, num_nodes)
+		if u not in freq:
+			freq[u] = {}
+		freq[u][v] = count
+
+	return freq
+
+
+# the same counts as a symmetric CSR matrix over the relabelled node ids
+def payment_frequency_matrix(src, dst, num_nodes=None):
+	src = np.asarray(src, dtype=np.int64)
+	dst = np.asarray(dst, dtype=np.int64)
+	if num_nodes is None:
+		num_nodes = int(max(src.max(), dst.max())) + 1 if len(src) else 0
+
+	rows = np.concatenate((src, dst))
+	cols = np.concatenate((dst, src))
+	counts = np.ones(len(rows), dtype=np.int64)
+	# duplicates are summed when converting to CSR
+	return sparse.csr_matrix((counts, (rows, cols)), shape=(num_nodes, num_nodes))
+
+
+# keep the k largest entries of every row
+def top_k_rows(matrix, k):
+	matrix = sparse.coo_matrix(matrix)
+	order = np.lexsort((-matrix.data, matrix.row))
+	rows = matrix.row[order]
+	row_start = np.searchsorted(rows, rows, side='left')
+	keep = order[np.arange(len(order)) - row_start < k]
+	return sparse.csr_matrix((matrix.data[keep], (matrix.row[keep], matrix.col[keep])), shape=matrix.shape)
+
+
+# bounded-memory heavy-hitter sketch: top-k counterparties per node, built chunk by chunk,
+# so memory is O(num_nodes * k + chunksize). Counts of counterparties that were dropped
+# and seen again restart from zero, so the kept counts are lower bounds.
+def payment_frequency_sketch(src, dst, k, num_nodes=None, chunksize=1 << 20):
+	if num_nodes is None:
+		num_nodes = 0
+		for lo in range(0, len(src), chunksize):
+			num_nodes = max(num_nodes, int(np.max(src[lo:lo + chunksize])) + 1, int(np.max(dst[lo:lo + chunksize])) + 1)
+
+	sketch = sparse.csr_matrix((num_nodes, num_nodes), dtype=np.int64)
+	for lo in range(0, len(src), chunksize):
+		chunk = payment_frequency_matrix(src[lo:lo + chunksize], dst[lo:lo + chunksize], num_nodes)
+		sketch = top_k_rows(sketch + chunk, k)
+	return sketch
+
+
+# amount at the given percentile, as sorting the trace by amount would give
+def amount_percentile(amount, percentage):
+	k = int(1.0*percentage/100*(len(amount)-1))
+	return float(np.partition(np.asarray(amount), k)[k])
+
+
+class RemainingIndex:
+	"""Positions 0..n-1 of a sequence, with removal and selection of the k-th remaining one.
+
+	A Fenwick tree over per-position presence, so pop(k) behaves like
+	list.pop(k) on the list of remaining positions in O(log n); find(k)
+	and remove(pos) do the two halves separately.
+	"""
+
+	def __init__(self, n):
+		self.n = n
+		self.count = n
+		ids = np.arange(n + 1, dtype=np.int64)
+		self.tree = array.array('i', (ids & -ids).astype(np.int32).tobytes())
+		self.top = 1 << max(n.bit_length() - 1, 0)
+
+	def __len__(self):
+		return self.count
+
+	# the k-th (0-based) remaining position
+	def find(self, k):
+		pos = 0
+		rem = k + 1
+		step = self.top
+		tree = self.tree
+		while step:
+			nxt = pos + step
+			if nxt <= self.n and tree[nxt] < rem:
+				pos = nxt
+				rem -= tree[nxt]
+			step >>= 1
+		return pos
+
+	# remove a remaining position
+	def remove(self, pos):
+		tree = self.tree
+		i = pos + 1
+		while i <= self.n:
+			tree[i] -= 1
+			i += i & -i
+		self.count -= 1
+
+	def pop(self, k):
+		pos = self.find(k)
+		self.remove(pos)
+		return pos
@@ -17,6 +17,7 @@ import (
 	"encoding/json"
 	"math/rand"
 	"math"
+	"math/bits"
 )
 
 
@@ -54,6 +55,9 @@ var bk_G map[int]map[int]float64
 //子网拓扑与备份
 var subGs map[int]map[int]map[int]float64
 var bk_subGs map[int]map[int]map[int]float64
+// 节点 -> 所在子网的位掩码（第 i 位对应 subnetIDList[i]）
+var subnetIDList []int
+var subnetMasks map[int][]uint64
 
 //交易集合
 var all_trans []Comm.Trans
@@ -156,10 +160,33 @@ func init_subGs(subnetIDs []int) bool {
 		// 备份当前子网拓扑
 		bk_subGs[sid] = deepCopy(subGs[sid])
 	}
+	build_subnet_masks()
 
 	return true
 }
 
+// 建立节点 -> 子网位掩码（子网拓扑恢复时节点不变，只需建立一次）
+func build_subnet_masks() {
+	subnetIDList = make([]int, 0, len(subGs))
+	for sid := range subGs {
+		subnetIDList = append(subnetIDList, sid)
+	}
+	sort.Ints(subnetIDList)
+
+	words := (len(subnetIDList) + 63) / 64
+	subnetMasks = make(map[int][]uint64)
+	for i, sid := range subnetIDList {
+		for nid := range subGs[sid] {
+			mask := subnetMasks[nid]
+			if mask == nil {
+				mask = make([]uint64, words)
+				subnetMasks[nid] = mask
+			}
+			mask[i/64] |= 1 << uint(i%64)
+		}
+	}
+}
+
 //加载交易
 func load_trans(trans_filename string) bool {
 	var ret bool = true
@@ -1398,11 +1425,13 @@ func mergeSubGs(subnetIDs []int) map[int]map[int]float64 {
 	return merged
 }
 
+// 节点所在的子网 ID（按 ID 升序），查位掩码代替遍历所有子网
 func getSubnetIDs(nid int) []int {
 	var subnetIDs []int
-	for sid, graph := range subGs {
-		if _, exists := graph[nid]; exists {
-			subnetIDs = append(subnetIDs, sid)
+	for w, word := range subnetMasks[nid] {
+		for word != 0 {
+			subnetIDs = append(subnetIDs, subnetIDList[w*64+bits.TrailingZeros64(word)])
+			word &= word - 1
 		}
 	}
 	return subnetIDs